@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetische Kohorten-Bäume für Benchmarks (keine echten Daten nötig)
+Erzeugt unter einem Zielordner dieselben Layouts wie auf isilon/bq-storage:
+- mri_prep/<Kohorte>/*.nii(.gz): NIfTI-1 Stubs mit echtem 348-Byte Header (Dimensionen,
+  Voxelgröße, sform) ohne Bilddaten; mit --full-size als Sparse-Datei in voller Größe
+- primäre/sekundäre Ordner und zusätzliche Pfade wie in config.py (inkl. Duplikaten,
+  nur sekundär/zusätzlich vorhandenen und fehlenden Subjects)
+- mri_prep/<Kohorte>/report/cat_<SUBJECT>.xml mit qualitymeasures/qualityratings/subjectmeasures
+- mri_prep/<Kohorte>/label/catROI_<SUBJECT>.xml (Volumen-ROIs im cat_io_xml Format)
+- data_output/<SUBJECT>/<SUBJECT>_cat12_results.csv (Spalten wie run_cat12_full_pipeline.m)
+- metadata/complete_metadata_all.csv + participants.tsv (neuer BIDS-Datensatz für ingest.py)
+Gleicher Seed -> identischer Baum. synthetic.json beschreibt den Baum für run_benchmarks.py.
+
+    python benchmarks/generate_synthetic.py /tmp/synthetic_1k --subjects 1000
+    python benchmarks/generate_synthetic.py /tmp/synthetic_10k --subjects 10000 --parts raw reports metadata
+"""
+
+import argparse
+import gzip
+import json
+import struct
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+#%% ========== KONFIGURATION ==========
+
+# Bei Änderungen am erzeugten Layout hochzählen -> gecachte Bäume werden neu erzeugt
+GENERATOR_VERSION = 1
+
+SEED = 0
+
+# Ordner wie in config.py: primär -> Dataset, Dateinamen-Vorlage, Anteil, Scan-Geometrie
+COHORTS = {
+    'ixinii': {'dataset': 'IXI', 'template': 'IXI{i:06d}-Guys-{j:04d}-T1', 'weight': 0.15,
+               'dim': (256, 256, 150), 'voxel': (0.94, 0.94, 1.2)},
+    'mcicnii': {'dataset': 'MCIC', 'template': 'sub-MCIC{i:06d}_T1w', 'weight': 0.08,
+                'dim': (256, 256, 160), 'voxel': (1.0, 1.0, 1.0)},
+    'cobrenii': {'dataset': 'COBRE', 'template': 'sub-COBRE{i:06d}_ses-01_T1w', 'weight': 0.07,
+                 'dim': (176, 256, 256), 'voxel': (1.0, 1.0, 1.0)},
+    'SRBPSnii': {'dataset': 'SRBPS', 'template': 'sub-SRBPS{i:06d}_T1w', 'weight': 0.15,
+                 'dim': (240, 256, 176), 'voxel': (1.0, 1.0, 1.0)},
+    'earlypsyconii': {'dataset': 'EPSY', 'template': 'sub-EPSY{i:06d}_T1w', 'weight': 0.05,
+                      'dim': (192, 256, 256), 'voxel': (1.0, 1.0, 1.0)},
+    'NSSnii': {'dataset': 'NSS', 'template': 'sub-NSS{i:06d}_T1w', 'weight': 0.1,
+               'dim': (256, 256, 180), 'voxel': (1.0, 1.0, 1.0)},
+    'NUdatanii': {'dataset': 'NU', 'template': 'sub-NU{i:06d}_T1w', 'weight': 0.1,
+                  'dim': (256, 256, 160), 'voxel': (1.0, 1.0, 1.2)},
+    'whitecatnii': {'dataset': 'whiteCAT', 'template': 'sub-whiteCAT{i:06d}_ses-01_T1w', 'weight': 0.15,
+                    'dim': (240, 240, 192), 'voxel': (1.0, 1.0, 1.0)},
+}
+SECONDARY_FOLDERS = ['mcicprocessednii', 'cobreprocessednii', 'nsscat12_updt', 'whitecat12_pupdt']
+
+# Zusätzliche Pfade (nur dort vorhandene Datensätze, .nii.gz wie heruntergeladen)
+ADDITIONAL_COHORTS = {
+    'openneuro': {'dataset': 'openNeuro', 'template': 'sub-{i:06d}_ses1_1_T1w', 'weight': 0.06,
+                  'dim': (176, 256, 256), 'voxel': (1.0, 1.0, 1.0)},
+    'sald': {'dataset': 'SALD', 'template': 'sub-{i:06d}_T1w', 'weight': 0.04,
+             'dim': (176, 256, 256), 'voxel': (1.0, 1.0, 1.0)},
+}
+
+# Wo liegt der Scan eines Subjects aus einer primären Kohorte (Rest: nur primär)
+P_ONLY_SECONDARY = 0.05   # fehlt primär, liegt in einem sekundären Ordner
+P_DUPLICATE = 0.05        # zusätzlich als Kopie in einem sekundären Ordner
+P_MISSING = 0.02          # in den Metadaten, aber nirgends als Datei
+P_GZIP = 0.3              # Anteil .nii.gz in den primären Ordnern
+
+# Verteilung der QC-Metriken (Mittelwert, SD); ~3% Ausreißer mit deutlich schlechteren Werten
+QC_DISTRIBUTIONS = {
+    'qualitymeasures': {'SurfaceEulerNumber': (30, 15), 'SurfaceDefectArea': (2.5, 1.0), 'SurfaceDefectNumber': (20, 8),
+                        'SurfaceIntensityRMSE': (0.09, 0.02), 'SurfacePositionRMSE': (0.07, 0.02), 'NCR': (0.12, 0.04),
+                        'ICR': (0.25, 0.08), 'contrast': (0.3, 0.05), 'contrastr': (0.32, 0.04), 'res_RMS': (1.0, 0.1)},
+    'qualityratings': {'IQR': (2.0, 0.4), 'SIQR': (2.1, 0.4), 'NCR': (2.0, 0.5), 'ICR': (1.8, 0.4), 'res_RMS': (1.5, 0.2),
+                       'SurfaceEulerNumber': (1.8, 0.5), 'SurfaceDefectArea': (1.6, 0.4)},
+    'subjectmeasures': {'vol_TIV': (1450, 130), 'surf_TSA': (1800, 150)},
+}
+P_OUTLIER = 0.03
+
+# Volumen-Atlas (catROI XML, Vgm/Vwm/Vcsf) und Surface-Atlas (T/G) -> Spalten der Ergebnis-CSV
+VOLUME_ATLAS = ('neuromorphometrics', 'Neurom', 136)
+SURFACE_ATLAS = ('aparc_DK40', 'DK40', 72)
+
+DIAGNOSES = {'HC': 0.55, 'SCHZ': 0.2, 'MDD': 0.12, 'BP': 0.05, 'CTT': 0.05, 'MCI': 0.03}
+ICD10_CODES = ['F20.0', 'F25.1', 'F32.1', 'F33.2', 'F31.4', 'F31', 'F10.2', 'F60.3', '']
+
+ALL_PARTS = ['raw', 'reports', 'labels', 'results', 'metadata']
+
+#%% ========== FUNKTIONEN ==========
+
+NIFTI_FORMAT = '<i10s18sihcc8h3f4h8f3fhcc4f2i80s24s2h6f4f4f4f16s4s'
+assert struct.calcsize(NIFTI_FORMAT) == 348
+
+
+def nifti_header(dim, voxel, datatype: int = 4, bitpix: int = 16) -> bytes:
+    """NIfTI-1 Header (n+1, vox_offset 352) + leere Extension, sform/qform in mm"""
+    nx, ny, nz = dim
+    vx, vy, vz = voxel
+    origin = (-vx * nx / 2, -vy * ny / 2, -vz * nz / 2)
+    header = struct.pack(
+        NIFTI_FORMAT,
+        348, b'', b'', 0, 0, b'\x00', b'\x00',
+        3, nx, ny, nz, 1, 1, 1, 1,
+        0.0, 0.0, 0.0,
+        0, datatype, bitpix, 0,
+        1.0, vx, vy, vz, 0.0, 0.0, 0.0, 0.0,
+        352.0, 1.0, 0.0,
+        nz - 1, b'\x00', b'\x0a',
+        0.0, 0.0, 0.0, 0.0, 0, 0,
+        b'synthetic benchmark volume', b'',
+        1, 1,
+        0.0, 0.0, 0.0, *origin,
+        vx, 0.0, 0.0, origin[0], 0.0, vy, 0.0, origin[1], 0.0, 0.0, vz, origin[2],
+        b'', b'n+1\x00',
+    )
+    return header + b'\x00' * 4
+
+
+def subject_table(n_subjects: int, seed: int = SEED) -> pd.DataFrame:
+    """
+    Subjects mit Kohorte, Filename und Ablageort:
+    location = primary | secondary_only | additional | missing, duplicate = zusätzliche Kopie
+    """
+    rng = np.random.default_rng([seed, 1])
+    cohorts = {**COHORTS, **ADDITIONAL_COHORTS}
+    names = list(cohorts)
+    weights = np.array([cohorts[c]['weight'] for c in names])
+    cohort = np.array(names, dtype=object)[rng.choice(len(names), n_subjects, p=weights / weights.sum())]
+    filenames = [cohorts[c]['template'].format(i=i, j=i % 10000) for i, c in enumerate(cohort)]
+
+    additional = np.isin(cohort, list(ADDITIONAL_COHORTS))
+    u = rng.random(n_subjects)
+    location = np.where(additional, 'additional', 'primary').astype(object)
+    location[~additional & (u < P_MISSING)] = 'missing'
+    location[~additional & (u >= P_MISSING) & (u < P_MISSING + P_ONLY_SECONDARY)] = 'secondary_only'
+    duplicate = (location == 'primary') & (rng.random(n_subjects) < P_DUPLICATE)
+    secondary = np.array(SECONDARY_FOLDERS, dtype=object)[rng.integers(0, len(SECONDARY_FOLDERS), n_subjects)]
+    gz = additional | (rng.random(n_subjects) < P_GZIP)
+
+    return pd.DataFrame({'Filename': filenames, 'cohort': cohort, 'location': location,
+                         'duplicate': duplicate, 'secondary': secondary, 'gz': gz})
+
+
+def write_raw_tree(root: Path, subjects: pd.DataFrame, full_size: bool = False):
+    """NIfTI-Stubs in primären/sekundären Ordnern und zusätzlichen Pfaden"""
+    cohorts = {**COHORTS, **ADDITIONAL_COHORTS}
+    headers = {c: nifti_header(info['dim'], info['voxel']) for c, info in cohorts.items()}
+    data_bytes = {c: int(np.prod(info['dim'])) * 2 for c, info in cohorts.items()}
+    stub_gz = {c: gzip.compress(h + b'\x00' * 4096, compresslevel=1, mtime=0) for c, h in headers.items()}
+
+    folders = {}
+    for row in subjects.itertuples(index=False):
+        if row.location == 'missing':
+            continue
+        targets = []
+        if row.location == 'primary':
+            targets.append(root / 'mri_prep' / row.cohort)
+        if row.location == 'secondary_only' or row.duplicate:
+            targets.append(root / 'mri_prep' / row.secondary)
+        if row.location == 'additional':
+            targets.append(root / 'additional' / row.cohort)
+        for folder in targets:
+            if folder not in folders:
+                folder.mkdir(parents=True, exist_ok=True)
+                folders[folder] = True
+            if row.gz:
+                (folder / f"{row.Filename}.nii.gz").write_bytes(stub_gz[row.cohort])
+            else:
+                path = folder / f"{row.Filename}.nii"
+                with open(path, 'wb') as f:
+                    f.write(headers[row.cohort])
+                    if full_size:
+                        f.truncate(len(headers[row.cohort]) + data_bytes[row.cohort])  # sparse
+
+
+def qc_values(n_subjects: int, cohorts: np.ndarray, seed: int = SEED) -> Dict[str, Dict[str, np.ndarray]]:
+    """QC-Werte pro Abschnitt/Metrik; jede Kohorte mit eigener Verschiebung, einige Ausreißer"""
+    rng = np.random.default_rng([seed, 2])
+    names, codes = np.unique(cohorts, return_inverse=True)
+    shift = rng.normal(0, 0.3, len(names))[codes]
+    outlier = rng.random(n_subjects) < P_OUTLIER
+    values = {}
+    for section, metrics in QC_DISTRIBUTIONS.items():
+        values[section] = {}
+        for metric, (mean, sd) in metrics.items():
+            v = mean + sd * (rng.standard_normal(n_subjects) + shift)
+            if section != 'subjectmeasures':
+                v = np.where(outlier, v + 4 * sd * (1 if metric not in ('contrast', 'contrastr') else -1), v)
+            values[section][metric] = np.abs(v)
+    return values
+
+
+def _xml_section(section: str, values: Dict[str, np.ndarray], i: int) -> str:
+    inner = ''.join(f"<{m}>{v[i]:.6g}</{m}>" for m, v in values.items())
+    return f"<{section}>{inner}</{section}>"
+
+
+def write_reports(root: Path, subjects: pd.DataFrame, seed: int = SEED):
+    """cat_<SUBJECT>.xml pro Subject im report/ Ordner seiner primären Kohorte"""
+    values = qc_values(len(subjects), subjects['cohort'].to_numpy(), seed)
+    # filedata/parameter vor den QC-Abschnitten wie in echten Reports (Parser muss sie überspringen)
+    parameter = '<parameter><opts><tpm>TPM.nii</tpm><affreg>mni</affreg><biasstr>0.5</biasstr></opts>' \
+                + '<extopts>' + ''.join(f'<p{k}>{k * 0.1:.1f}</p{k}>' for k in range(60)) + '</extopts></parameter>'
+    for i, row in enumerate(subjects.itertuples(index=False)):
+        if row.cohort not in COHORTS or row.location != 'primary':
+            continue
+        folder = root / 'mri_prep' / row.cohort / 'report'
+        folder.mkdir(parents=True, exist_ok=True)
+        xml = (f'<?xml version="1.0" encoding="utf-8"?>\n<S><filedata><fname>{row.Filename}.nii</fname></filedata>'
+               f'{parameter}'
+               + ''.join(_xml_section(s, values[s], i) for s in QC_DISTRIBUTIONS)
+               + '<software><version_cat>12.9</version_cat></software></S>\n')
+        (folder / f"cat_{row.Filename}.xml").write_text(xml)
+
+
+def write_labels(root: Path, subjects: pd.DataFrame, seed: int = SEED):
+    """catROI_<SUBJECT>.xml mit names/item und data/Vgm,Vwm,Vcsf für den Volumen-Atlas"""
+    atlas, _, n_regions = VOLUME_ATLAS
+    rng = np.random.default_rng([seed, 3])
+    names = ''.join(f'<item>r{k:03d}</item>' for k in range(n_regions))
+    for row in subjects.itertuples(index=False):
+        if row.cohort not in COHORTS or row.location != 'primary':
+            continue
+        folder = root / 'mri_prep' / row.cohort / 'label'
+        folder.mkdir(parents=True, exist_ok=True)
+        data = ''.join(f"<{m}>[{' '.join(f'{v:.4f}' for v in rng.gamma(4, 1.5, n_regions))}]</{m}>"
+                       for m in ('Vgm', 'Vwm', 'Vcsf'))
+        (folder / f"catROI_{row.Filename}.xml").write_text(
+            f'<?xml version="1.0" encoding="utf-8"?>\n<S><{atlas}><names>{names}</names>'
+            f'<data>{data}</data></{atlas}></S>\n')
+
+
+def results_table(subjects: pd.DataFrame, seed: int = SEED) -> pd.DataFrame:
+    """Eine Zeile pro Subject mit den Spalten der *_cat12_results.csv"""
+    rng = np.random.default_rng([seed, 4])
+    n = len(subjects)
+    tiv = rng.normal(1450, 130, n)
+    columns = {
+        'Subject': subjects['Filename'].to_numpy(),
+        'IQR': rng.normal(85, 4, n), 'NCR': rng.normal(2.0, 0.5, n), 'ICR': rng.normal(1.8, 0.4, n),
+        'res_RMS': rng.normal(1.5, 0.2, n), 'TIV': tiv,
+        'GM_vol': 0.45 * tiv, 'WM_vol': 0.35 * tiv, 'CSF_vol': 0.2 * tiv, 'WMH_vol': rng.gamma(2, 0.5, n),
+        'mean_thickness_lh': rng.normal(2.5, 0.1, n), 'mean_thickness_rh': rng.normal(2.5, 0.1, n),
+        'mean_thickness_global': rng.normal(2.5, 0.1, n),
+        'mean_gyri_lh': rng.normal(25, 1, n), 'mean_gyri_rh': rng.normal(25, 1, n), 'mean_gyri_global': rng.normal(25, 1, n),
+    }
+    _, short, n_regions = VOLUME_ATLAS
+    for measure in ('Vgm', 'Vwm', 'Vcsf'):
+        block = rng.gamma(4, 1.5, (n, n_regions)).astype(np.float32)
+        columns.update({f'{measure}_{short}_r{k:03d}': block[:, k] for k in range(n_regions)})
+    _, short, n_regions = SURFACE_ATLAS
+    for measure, (mean, sd) in (('T', (2.5, 0.3)), ('G', (25, 3))):
+        block = rng.normal(mean, sd, (n, n_regions)).astype(np.float32)
+        columns.update({f'{measure}_{short}_{"lh" if k < n_regions // 2 else "rh"}_r{k:03d}': block[:, k]
+                        for k in range(n_regions)})
+    return pd.DataFrame(columns)
+
+
+def write_results(root: Path, subjects: pd.DataFrame, seed: int = SEED):
+    """data_output/<SUBJECT>/<SUBJECT>_cat12_results.csv (Header + 1 Zeile) für verarbeitete Subjects"""
+    done = subjects[subjects['location'] != 'missing']
+    table = results_table(done, seed)
+    header = ','.join(table.columns) + '\n'
+    lines = table.to_csv(index=False, header=False, float_format='%.6g').splitlines()
+    for name, line in zip(done['Filename'], lines):
+        folder = root / 'data_output' / name
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"{name}_cat12_results.csv").write_text(header + line + '\n')
+
+
+def metadata_table(subjects: pd.DataFrame, seed: int = SEED) -> pd.DataFrame:
+    """Metadaten im Schema von complete_metadata_all.csv"""
+    rng = np.random.default_rng([seed, 5])
+    n = len(subjects)
+    cohorts = {**COHORTS, **ADDITIONAL_COHORTS}
+    diagnosis = rng.choice(list(DIAGNOSES), n, p=np.array(list(DIAGNOSES.values())))
+    diagnosis = np.where(np.isin(subjects['cohort'], list(ADDITIONAL_COHORTS)), 'HC', diagnosis)
+    sex = rng.choice(['Female', 'Male', 'F', 'M', 'male ', None], n, p=[0.4, 0.4, 0.05, 0.05, 0.05, 0.05])
+    icd = np.where(diagnosis == 'HC', '', rng.choice(ICD10_CODES, n))
+    panss = rng.integers(7, 50, (n, 3)).astype(float)
+    panss[diagnosis == 'HC'] = np.nan
+    return pd.DataFrame({
+        'Filename': subjects['Filename'].to_numpy(),
+        'Dataset': [cohorts[c]['dataset'] for c in subjects['cohort']],
+        'Diagnosis': diagnosis,
+        'Age': np.round(rng.uniform(18, 80, n), 1),
+        'Sex': sex,
+        'Sex_int': pd.Series(sex).str.strip().str.lower().map({'female': 0.0, 'f': 0.0, 'male': 1.0, 'm': 1.0}),
+        'Co_Diagnosis': '',
+        'ICD10_Code': icd,
+        'GAF_Score': np.where(diagnosis == 'HC', np.nan, rng.integers(20, 90, n)),
+        'PANSS_Positive': panss[:, 0], 'PANSS_Negative': panss[:, 1], 'PANSS_General': panss[:, 2],
+        'PANSS_Total': panss.sum(axis=1),
+        'Usage_original': rng.choice(['train', 'test', 'valid'], n),
+    })
+
+
+def participants_table(n_subjects: int, seed: int = SEED) -> pd.DataFrame:
+    """BIDS participants.tsv eines neuen Datensatzes (für metadata/ingest.py, Adapter 'bids')"""
+    rng = np.random.default_rng([seed, 6])
+    return pd.DataFrame({
+        'participant_id': [f'sub-NEW{i:06d}' for i in range(n_subjects)],
+        'age': np.round(rng.uniform(18, 80, n_subjects), 1),
+        'sex': rng.choice(['F', 'M', 'f', 'm', 'n/a'], n_subjects, p=[0.45, 0.45, 0.04, 0.04, 0.02]),
+    })
+
+
+def generate_tree(root: Path, n_subjects: int, seed: int = SEED, parts: Optional[List[str]] = None,
+                  full_size: bool = False) -> Dict:
+    """
+    Erzeugt den Baum (bzw. die gewählten Teile) und schreibt synthetic.json.
+    Ist synthetic.json mit gleichen Parametern schon vorhanden, wird nichts neu erzeugt.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    parts = list(parts or ALL_PARTS)
+    manifest_path = root / 'synthetic.json'
+    params = {'generator_version': GENERATOR_VERSION, 'n_subjects': n_subjects, 'seed': seed,
+              'full_size': full_size}
+    existing = []
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if {k: manifest.get(k) for k in params} != params:
+            raise ValueError(f"{root} enthält einen Baum mit anderen Parametern - anderen Zielordner wählen")
+        existing = manifest['parts']
+        if set(parts) <= set(existing):
+            print(f"✓ Synthetischer Baum vorhanden: {root} ({n_subjects} Subjects)")
+            return manifest
+    missing = [p for p in ALL_PARTS if p in parts and p not in existing]
+
+    print(f"Erzeuge synthetischen Baum: {root} ({n_subjects} Subjects, Teile: {', '.join(missing)})")
+    subjects = subject_table(n_subjects, seed)
+    timings = {}
+    writers = {
+        'raw': lambda: write_raw_tree(root, subjects, full_size),
+        'reports': lambda: write_reports(root, subjects, seed),
+        'labels': lambda: write_labels(root, subjects, seed),
+        'results': lambda: write_results(root, subjects, seed),
+        'metadata': lambda: _write_metadata(root, subjects, seed),
+    }
+    for part in missing:
+        start = time.perf_counter()
+        writers[part]()
+        timings[part] = round(time.perf_counter() - start, 2)
+        print(f"  ✓ {part}: {timings[part]:.1f} s")
+
+    manifest = {
+        **params,
+        'parts': [p for p in ALL_PARTS if p in parts or p in existing],
+        'raw_data_root': str(root / 'mri_prep'),
+        'primary_folders': list(COHORTS),
+        'secondary_folders': SECONDARY_FOLDERS,
+        'additional_paths': [str(root / 'additional' / c) for c in ADDITIONAL_COHORTS],
+        'qc_cohorts': list(COHORTS),
+        'data_output_root': str(root / 'data_output'),
+        'metadata_path': str(root / 'metadata' / 'complete_metadata_all.csv'),
+        'participants_path': str(root / 'metadata' / 'participants.tsv'),
+        'locations': subjects['location'].value_counts().to_dict(),
+        'generation_seconds': timings,
+    }
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def _write_metadata(root: Path, subjects: pd.DataFrame, seed: int):
+    folder = root / 'metadata'
+    folder.mkdir(parents=True, exist_ok=True)
+    metadata_table(subjects, seed).to_csv(folder / 'complete_metadata_all.csv', index=False)
+    participants_table(max(1, len(subjects) // 10), seed).to_csv(folder / 'participants.tsv', sep='\t', index=False)
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetische CAT12-Kohorten-Bäume für Benchmarks erzeugen")
+    parser.add_argument('root', type=Path, help="Zielordner (wird angelegt)")
+    parser.add_argument('--subjects', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--parts', nargs='+', choices=ALL_PARTS, default=ALL_PARTS)
+    parser.add_argument('--full-size', action='store_true',
+                        help=".nii Stubs als Sparse-Dateien in voller Volumen-Größe")
+    args = parser.parse_args()
+
+    manifest = generate_tree(args.root, args.subjects, args.seed, args.parts, args.full_size)
+    print(f"\n✓ Fertig: {args.root / 'synthetic.json'}")
+    print(f"  Ablage: {manifest['locations']}")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks der Python-Pipeline-Stufen auf synthetischen Bäumen (generate_synthetic.py)
+Gemessen werden die echten Funktionen aus config.py, CAT12_Quality_analysis.py,
+metadata/ und model_input/ bei 1k/10k/100k Subjects. Ergebnisse landen als JSON in
+benchmarks/results/ (Zeitstempel + Commit); jeder Lauf wird mit dem vorherigen bzw.
+--baseline verglichen, langsamere Stufen werden als Regression markiert.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000
+    python benchmarks/run_benchmarks.py --sizes 1000 --only identify_problematic_scans perform_statistical_tests
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/baseline.json --fail-on-regression
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for _folder in ['', 'quality_assessment', 'metadata', 'model_input']:
+    sys.path.insert(0, str(REPO_ROOT / _folder))
+
+from generate_synthetic import generate_tree, results_table, subject_table
+
+#%% ========== KONFIGURATION ==========
+
+SIZES = [1000, 10000, 100000]
+
+# Synthetische Bäume (einmal pro Größe erzeugt, danach wiederverwendet)
+WORK_PATH = Path(tempfile.gettempdir()) / 'cat12_benchmarks'
+
+RESULTS_PATH = Path(__file__).resolve().parent / 'results'
+
+# Wiederholungen pro Messung; dauert der erste Lauf länger als MAX_REPEAT_SECONDS, bleibt es bei einem
+REPEATS = 3
+MAX_REPEAT_SECONDS = 30
+
+# Regression: Median mehr als REGRESSION_TOLERANCE langsamer und mindestens NOISE_FLOOR Sekunden
+REGRESSION_TOLERANCE = 0.2
+NOISE_FLOOR = 0.05
+
+# Teile des Baums, die die Benchmarks brauchen (Ergebnis-CSVs werden im Speicher erzeugt)
+PARTS = ['raw', 'reports', 'metadata']
+
+#%% ========== FUNKTIONEN ==========
+
+class Context:
+    """Pfade eines synthetischen Baums + einmal geladene Eingaben, die mehrere Benchmarks teilen"""
+
+    def __init__(self, manifest: Dict, work_dir: Path):
+        self.manifest = manifest
+        self.work_dir = work_dir
+        self._cache = {}
+
+    def get(self, key: str, build: Callable):
+        if key not in self._cache:
+            with contextlib.redirect_stdout(io.StringIO()):
+                self._cache[key] = build()
+        return self._cache[key]
+
+    def qc(self) -> pd.DataFrame:
+        from CAT12_Quality_analysis import collect_data_from_cohorts
+        return self.get('qc', lambda: collect_data_from_cohorts(
+            Path(self.manifest['raw_data_root']), self.manifest['qc_cohorts'], store_path=None))
+
+    def metadata(self) -> pd.DataFrame:
+        return self.get('metadata', lambda: pd.read_csv(self.manifest['metadata_path']))
+
+    def results(self) -> pd.DataFrame:
+        def build():
+            subjects = subject_table(self.manifest['n_subjects'], self.manifest['seed'])
+            return results_table(subjects[subjects['location'] != 'missing'], self.manifest['seed'])
+        return self.get('results', build)
+
+
+def bench_get_valid_mri_paths(ctx: Context) -> int:
+    from config import get_valid_mri_paths
+    m = ctx.manifest
+    paths, _ = get_valid_mri_paths(m['raw_data_root'], m['primary_folders'], m['secondary_folders'],
+                                   m['additional_paths'], [m['metadata_path']])
+    return len(paths)
+
+
+def bench_collect_data_from_cohorts(ctx: Context) -> int:
+    from CAT12_Quality_analysis import collect_data_from_cohorts
+    df = collect_data_from_cohorts(Path(ctx.manifest['raw_data_root']), ctx.manifest['qc_cohorts'], store_path=None)
+    return len(df)
+
+
+def setup_qc_store(ctx: Context):
+    """Store einmal füllen -> der Benchmark misst den warmen Pfad (nichts geändert)"""
+    from CAT12_Quality_analysis import collect_data_from_cohorts
+    store = ctx.work_dir / 'qc_store.sqlite'
+    if store.exists():
+        store.unlink()
+    collect_data_from_cohorts(Path(ctx.manifest['raw_data_root']), ctx.manifest['qc_cohorts'], store_path=store)
+
+
+def bench_collect_data_from_cohorts_warm_store(ctx: Context) -> int:
+    from CAT12_Quality_analysis import collect_data_from_cohorts
+    df = collect_data_from_cohorts(Path(ctx.manifest['raw_data_root']), ctx.manifest['qc_cohorts'],
+                                   store_path=ctx.work_dir / 'qc_store.sqlite')
+    return len(df)
+
+
+def bench_identify_problematic_scans(ctx: Context) -> int:
+    from CAT12_Quality_analysis import identify_problematic_scans
+    df = ctx.qc()
+    identify_problematic_scans(df, ctx.work_dir)
+    return len(df)
+
+
+def bench_perform_statistical_tests(ctx: Context) -> int:
+    from CAT12_Quality_analysis import METRICS_INFO, perform_statistical_tests
+    df = ctx.qc()
+    for metric in METRICS_INFO:
+        if metric in df.columns:
+            perform_statistical_tests(df, metric)
+    return len(df)
+
+
+def bench_process_metadata(ctx: Context) -> int:
+    from metadata_joining import process_metadata
+    df, _ = process_metadata(ctx.metadata())
+    return len(df)
+
+
+def bench_join_results_metadata_qc(ctx: Context) -> int:
+    from build_feature_matrix import join_results_metadata_qc
+    merged = join_results_metadata_qc(ctx.results(), ctx.metadata(), ctx.qc())
+    return len(merged)
+
+
+def setup_ingest(ctx: Context):
+    """Kopie der Master-Tabelle, damit ein versehentliches Schreiben den Baum nicht verändert"""
+    shutil.copy(ctx.manifest['metadata_path'], ctx.work_dir / 'master.csv')
+
+
+def bench_ingest_dry_run(ctx: Context) -> int:
+    from ingest import ingest
+    new = ingest('bids', Path(ctx.manifest['participants_path']), ctx.work_dir / 'master.csv',
+                 dataset='NEW', dry_run=True)
+    return len(new)
+
+
+# max_subjects: größere Bäume werden übersprungen (get_valid_mri_paths ist Dateien x IDs)
+BENCHMARKS = {
+    'get_valid_mri_paths': {'run': bench_get_valid_mri_paths, 'max_subjects': 10000},
+    'collect_data_from_cohorts': {'run': bench_collect_data_from_cohorts},
+    'collect_data_from_cohorts_warm_store': {'run': bench_collect_data_from_cohorts_warm_store,
+                                             'setup': setup_qc_store},
+    'identify_problematic_scans': {'run': bench_identify_problematic_scans},
+    'perform_statistical_tests': {'run': bench_perform_statistical_tests},
+    'process_metadata': {'run': bench_process_metadata},
+    'join_results_metadata_qc': {'run': bench_join_results_metadata_qc},
+    'ingest_dry_run': {'run': bench_ingest_dry_run, 'setup': setup_ingest},
+}
+
+
+def time_benchmark(name: str, spec: Dict, ctx: Context, repeats: int = REPEATS) -> Dict:
+    """Misst Wall- und CPU-Zeit (Ausgaben der Funktionen werden verschluckt)"""
+    n_subjects = ctx.manifest['n_subjects']
+    record = {'benchmark': name, 'n_subjects': n_subjects}
+    if n_subjects > spec.get('max_subjects', np.inf):
+        return {**record, 'status': 'skipped'}
+
+    walls, cpus, items = [], [], None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if 'setup' in spec:
+                spec['setup'](ctx)
+            for _ in range(repeats):
+                wall, cpu = time.perf_counter(), time.process_time()
+                items = spec['run'](ctx)
+                walls.append(time.perf_counter() - wall)
+                cpus.append(time.process_time() - cpu)
+                if walls[-1] > MAX_REPEAT_SECONDS:
+                    break
+    except Exception as e:
+        return {**record, 'status': f'failed: {type(e).__name__}: {e}'}
+
+    wall_median = float(np.median(walls))
+    return {**record, 'status': 'ok', 'repeats': len(walls), 'items': items,
+            'wall_min': min(walls), 'wall_median': wall_median, 'cpu_median': float(np.median(cpus)),
+            'items_per_second': items / wall_median if items and wall_median > 0 else None}
+
+
+def environment_info() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'date': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def latest_results(results_path: Path = RESULTS_PATH) -> Optional[Path]:
+    files = sorted(p for p in results_path.glob('*.json') if p.name != 'baseline.json') if results_path.exists() else []
+    return files[-1] if files else None
+
+
+def compare(current: List[Dict], baseline: List[Dict], tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    """Median-Zeiten gegen die Baseline: ratio > 1 + tolerance (und > NOISE_FLOOR langsamer) = Regression"""
+    columns = ['benchmark', 'n_subjects', 'wall_median']
+    new = pd.DataFrame([r for r in current if r.get('status') == 'ok'], columns=columns)
+    old = pd.DataFrame([r for r in baseline if r.get('status') == 'ok'], columns=columns)
+    table = new.merge(old, on=['benchmark', 'n_subjects'], how='left', suffixes=('', '_baseline'))
+    table['ratio'] = table['wall_median'] / table['wall_median_baseline']
+    table['regression'] = ((table['ratio'] > 1 + tolerance)
+                           & (table['wall_median'] - table['wall_median_baseline'] > NOISE_FLOOR))
+    return table
+
+
+def run_benchmarks(sizes: List[int] = SIZES, names: Optional[List[str]] = None, work_path: Path = WORK_PATH,
+                   repeats: int = REPEATS) -> List[Dict]:
+    names = names or list(BENCHMARKS)
+    records = []
+    for n_subjects in sizes:
+        print("\n" + "="*80)
+        print(f"BENCHMARKS: {n_subjects} SUBJECTS")
+        print("="*80)
+        root = work_path / f'synthetic_{n_subjects}'
+        manifest = generate_tree(root, n_subjects, parts=PARTS)
+        with tempfile.TemporaryDirectory(prefix='run_', dir=work_path) as scratch:
+            ctx = Context(manifest, Path(scratch))
+            for name in names:
+                record = time_benchmark(name, BENCHMARKS[name], ctx, repeats)
+                records.append(record)
+                if record['status'] == 'ok':
+                    print(f"  {name:<40} {record['wall_median']:>9.3f} s  (CPU {record['cpu_median']:.3f} s, "
+                          f"{record['repeats']}x, {record['items']} Einträge)")
+                else:
+                    print(f"  {name:<40} {record['status']}")
+    return records
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks der Pipeline-Stufen auf synthetischen Daten")
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=None, metavar='BENCHMARK')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--work', type=Path, default=WORK_PATH, help="Ordner für die synthetischen Bäume")
+    parser.add_argument('--results', type=Path, default=RESULTS_PATH)
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help="Vergleichs-JSON (Standard: letzter Lauf in --results)")
+    parser.add_argument('--save-baseline', action='store_true', help="Ergebnis zusätzlich als baseline.json")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit-Code 1 bei Regressionen")
+    args = parser.parse_args()
+
+    baseline_file = args.baseline or latest_results(args.results)
+    args.work.mkdir(parents=True, exist_ok=True)
+    records = run_benchmarks(args.sizes, args.only, args.work, args.repeats)
+
+    env = environment_info()
+    args.results.mkdir(parents=True, exist_ok=True)
+    output_file = args.results / f"{datetime.now():%Y%m%d_%H%M%S}_{env['commit'] or 'nogit'}.json"
+    payload = {'environment': env, 'results': records}
+    output_file.write_text(json.dumps(payload, indent=2))
+    print(f"\n✓ Ergebnisse gespeichert: {output_file}")
+    if args.save_baseline:
+        (args.results / 'baseline.json').write_text(json.dumps(payload, indent=2))
+        print(f"✓ Baseline gespeichert: {args.results / 'baseline.json'}")
+
+    if baseline_file is None or not baseline_file.exists():
+        print("Keine Baseline zum Vergleichen vorhanden.")
+        sys.exit(0)
+
+    print("\n" + "="*80)
+    print(f"VERGLEICH MIT {baseline_file.name}")
+    print("="*80)
+    table = compare(records, json.loads(baseline_file.read_text())['results'])
+    print(table.to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+    regressions = table[table['regression']]
+    if regressions.empty:
+        print("\n✓ Keine Regressionen")
+    else:
+        print(f"\n⚠️  {len(regressions)} Regressionen (> {REGRESSION_TOLERANCE:.0%} langsamer):")
+        print(regressions[['benchmark', 'n_subjects', 'wall_median_baseline', 'wall_median', 'ratio']]
+              .to_string(index=False, float_format=lambda v: f'{v:.3f}'))
+        if args.fail_on_regression:
+            sys.exit(1)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gemeinsamer Einstiegspunkt für die CAT12-Pipeline
+    python cat12.py discover                      # valid_paths-Liste aus Rohdaten + Metadaten (config.py)
+    python cat12.py submit --paths reprocess_subjects.txt --mem 12G --time 48:00:00
+    python cat12.py submit --plan output/resources/submission_plan.csv   # aus scripts/resource_sizing.py
+    python cat12.py status                        # fertig / läuft / abgebrochen / offen pro Kohorten-Ordner
+    python cat12.py qc --source data_output       # CAT12_Quality_analysis.py
+    python cat12.py aggregate                     # Feature-Store (model_input/build_feature_matrix.py)
+    python cat12.py ingest SALD --source ...      # metadata/ingest.py
+Alle Argumente nach dem Unterbefehl gehen an das jeweilige Skript (python cat12.py qc --help).
+pandas/scipy/matplotlib werden erst im Unterbefehl geladen, der sie braucht - status und
+submit kommen mit der Standardbibliothek aus und starten auch auf dem Login-Knoten sofort.
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent
+
+#%% ========== KONFIGURATION ==========
+
+PROJECT_ROOT = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals")
+
+# Subject-Liste, Logs und Output wie in scripts/run_cat12_pipeline_batch.slurm
+VALID_PATHS_FILE = PROJECT_ROOT / "reprocess_subjects.txt"
+LOG_PATH = PROJECT_ROOT / "output" / "logs"
+DATA_OUTPUT_ROOT = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/data_output")
+SLURM_SCRIPT = ROOT / "scripts" / "run_cat12_pipeline_batch.slurm"
+BATCH_SIZE = 15
+MAX_PARALLEL = 80
+
+SUCCESS_MARKER = "CAT12 surface analysis and ROI extraction completed successfully"
+
+# Log ohne Erfolgsmeldung, seit so vielen Stunden unverändert -> gilt als abgebrochen
+STALE_HOURS = 6
+
+# Threads für die Datei-Abfragen (NFS-Latenz überlappt)
+STATUS_THREADS = 32
+
+# Unterbefehle, die ein bestehendes Skript aufrufen: (Ordner, Modul, Beschreibung)
+SCRIPT_COMMANDS = {
+    'discover': ('.', 'config', "valid_paths-Liste aus Rohdaten + Metadaten erstellen"),
+    'qc': ('quality_assessment', 'CAT12_Quality_analysis', "QC-Analyse der CAT12-Reports"),
+    'aggregate': ('model_input', 'build_feature_matrix', "Ergebnis-CSVs + Metadaten + QC -> Feature-Store"),
+    'ingest': ('metadata', 'ingest', "neue Datensätze an die Metadaten-Tabelle anhängen"),
+}
+
+STATES = ['finished', 'running', 'failed', 'pending']
+
+#%% ========== FUNKTIONEN ==========
+
+def subject_name(path: str) -> str:
+    """Subject-Name wie im SLURM-Skript: basename ohne .nii.gz/.nii/.gz"""
+    name = os.path.basename(path.strip())
+    for suffix in ('.nii.gz', '.nii', '.gz'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def read_paths(path: Path) -> List[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def subject_state(subject: str, output_root: Path, log_path: Path, now: float) -> str:
+    """finished: Ergebnis-CSV oder Erfolgsmeldung, running/failed: Log (frisch/alt), sonst pending"""
+    if os.path.exists(os.path.join(output_root, subject, f'{subject}_cat12_results.csv')):
+        return 'finished'
+    log_file = os.path.join(log_path, f'cat12_{subject}.log')
+    try:
+        mtime = os.stat(log_file).st_mtime
+    except OSError:
+        return 'pending'
+    with open(log_file, errors='replace') as f:
+        if SUCCESS_MARKER in f.read():
+            return 'finished'
+    return 'running' if now - mtime < STALE_HOURS * 3600 else 'failed'
+
+
+def pipeline_status(paths: List[str], output_root: Path = DATA_OUTPUT_ROOT, log_path: Path = LOG_PATH,
+                    n_threads: int = STATUS_THREADS) -> Dict[str, Dict[str, int]]:
+    """Anzahl Subjects pro Zustand, gruppiert nach Kohorten-Ordner des Inputs"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    now = time.time()
+    with ThreadPoolExecutor(max_workers=n_threads) as pool:
+        states = list(pool.map(lambda p: subject_state(subject_name(p), output_root, log_path, now), paths))
+
+    counts = {}
+    for path, state in zip(paths, states):
+        folder = os.path.basename(os.path.dirname(path)) or '?'
+        counts.setdefault(folder, dict.fromkeys(STATES, 0))[state] += 1
+    return counts
+
+
+def squeue_states() -> Optional[Dict[str, int]]:
+    """Eigene SLURM-Jobs nach Zustand (None, wenn squeue nicht verfügbar ist)"""
+    import shutil
+    import subprocess
+
+    if shutil.which('squeue') is None:
+        return None
+    try:
+        result = subprocess.run(['squeue', '-h', '-r', '-u', os.environ.get('USER', ''), '-o', '%T'],
+                                capture_output=True, text=True, timeout=20)
+    except subprocess.TimeoutExpired:
+        return None
+    states = {}
+    for state in result.stdout.split():
+        states[state] = states.get(state, 0) + 1
+    return states
+
+
+def print_status(counts: Dict[str, Dict[str, int]], manifest: Path, queue: Optional[Dict[str, int]]):
+    total = {state: sum(c[state] for c in counts.values()) for state in STATES}
+    n = sum(total.values())
+    print("="*80)
+    print(f"CAT12 STATUS: {manifest} ({n} Subjects)")
+    print("="*80)
+    print(f"{'Ordner':<20}" + "".join(f"{state:>10}" for state in STATES))
+    for folder in sorted(counts):
+        print(f"{folder:<20}" + "".join(f"{counts[folder][state]:>10}" for state in STATES))
+    print("-"*60)
+    print(f"{'Gesamt':<20}" + "".join(f"{total[state]:>10}" for state in STATES))
+    if n:
+        print(f"\n✓ {total['finished'] / n:.1%} fertig")
+    if total['failed']:
+        print(f"⚠️  {total['failed']} Subjects mit Log ohne Erfolgsmeldung (> {STALE_HOURS} h unverändert)")
+    if queue is not None:
+        print(f"SLURM-Tasks: {', '.join(f'{k} {v}' for k, v in sorted(queue.items())) or 'keine'}")
+
+
+def sbatch_command(paths_file: Path, n_subjects: int, batch_size: int = BATCH_SIZE, mem: Optional[str] = None,
+                   time_limit: Optional[str] = None, max_parallel: int = MAX_PARALLEL,
+                   script: Path = SLURM_SCRIPT) -> List[str]:
+    """sbatch-Aufruf für das Batch-Skript: --array aus der Anzahl Subjects, Liste über VALID_PATHS_FILE"""
+    n_tasks = -(-n_subjects // batch_size)
+    command = ['sbatch']
+    if mem:
+        command.append(f'--mem={mem}')
+    if time_limit:
+        command.append(f'--time={time_limit}')
+    command += [f'--array=1-{n_tasks}%{max_parallel}',
+                f'--export=ALL,VALID_PATHS_FILE={Path(paths_file).resolve()},BATCH_SIZE={batch_size}', str(script)]
+    return command
+
+
+def submit(argv: Optional[List[str]] = None):
+    """Array-Jobs für eine Subject-Liste oder einen submission_plan.csv (resource_sizing.py) abschicken"""
+    import argparse
+    import csv
+    import subprocess
+
+    parser = argparse.ArgumentParser(prog='cat12.py submit', description="CAT12 Batch-Jobs über sbatch abschicken")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--paths', type=Path, default=VALID_PATHS_FILE, help="Subject-Liste (eine NIfTI pro Zeile)")
+    source.add_argument('--plan', type=Path, default=None,
+                        help="submission_plan.csv aus scripts/resource_sizing.py --manifest (ein Job pro Gruppe)")
+    parser.add_argument('--mem', default=None, help="z.B. 12G (Standard: #SBATCH im Skript)")
+    parser.add_argument('--time', default=None, help="z.B. 48:00:00 (Standard: #SBATCH im Skript)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--max-parallel', type=int, default=MAX_PARALLEL, help="gleichzeitige Array-Tasks (%%)")
+    parser.add_argument('--script', type=Path, default=SLURM_SCRIPT)
+    parser.add_argument('--dry-run', action='store_true', help="sbatch-Aufrufe nur anzeigen")
+    args = parser.parse_args(argv)
+
+    if args.plan:
+        with open(args.plan, newline='') as f:
+            jobs = [{'paths_file': Path(row['paths_file']), 'n_subjects': int(row['n_subjects']),
+                     'batch_size': int(row['batch_size']), 'mem': args.mem or row['mem'],
+                     'time_limit': args.time or row['time']} for row in csv.DictReader(f)]
+    else:
+        jobs = [{'paths_file': args.paths, 'n_subjects': len(read_paths(args.paths)),
+                 'batch_size': args.batch_size, 'mem': args.mem, 'time_limit': args.time}]
+
+    failed = 0
+    for job in jobs:
+        if job['n_subjects'] == 0:
+            print(f"⚠️  {job['paths_file']}: keine Subjects - übersprungen")
+            continue
+        command = sbatch_command(**job, max_parallel=args.max_parallel, script=args.script)
+        print(f"{job['n_subjects']} Subjects: {' '.join(command)}")
+        if args.dry_run:
+            continue
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode == 0:
+            print(f"  ✓ {result.stdout.strip()}")
+        else:
+            print(f"  ✗ {result.stderr.strip()}")
+            failed += 1
+    if failed:
+        sys.exit(1)
+
+
+def status(argv: Optional[List[str]] = None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='cat12.py status', description="Fortschritt eines CAT12-Laufs")
+    parser.add_argument('--manifest', type=Path, default=VALID_PATHS_FILE, help="VALID_PATHS_FILE des Laufs")
+    parser.add_argument('--output-root', type=Path, default=DATA_OUTPUT_ROOT)
+    parser.add_argument('--logs', type=Path, default=LOG_PATH)
+    parser.add_argument('--threads', type=int, default=STATUS_THREADS)
+    parser.add_argument('--no-squeue', action='store_true', help="SLURM-Warteschlange nicht abfragen")
+    args = parser.parse_args(argv)
+
+    paths = read_paths(args.manifest)
+    counts = pipeline_status(paths, args.output_root, args.logs, args.threads)
+    print_status(counts, args.manifest, None if args.no_squeue else squeue_states())
+
+
+def run_script(command: str, argv: List[str]):
+    """Unterbefehl an main() des bestehenden Skripts weitergeben (Import erst hier)"""
+    import importlib
+
+    folder, module_name, _ = SCRIPT_COMMANDS[command]
+    for path in (ROOT, ROOT / folder):
+        if str(path) not in sys.path:
+            sys.path.insert(0, str(path))
+    sys.argv = [f'cat12.py {command}', *argv]  # argparse-Usage der Skripte
+    importlib.import_module(module_name).main(argv)
+
+
+LOCAL_COMMANDS = {
+    'submit': (submit, "Batch-Jobs abschicken (--array aus der Subject-Liste, --mem/--time oder --plan)"),
+    'status': (status, "fertig / läuft / abgebrochen / offen pro Kohorten-Ordner"),
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    commands = {name: description for name, (_, description) in LOCAL_COMMANDS.items()}
+    commands.update({name: description for name, (_, _, description) in SCRIPT_COMMANDS.items()})
+    order = ['discover', 'submit', 'status', 'qc', 'aggregate', 'ingest']
+
+    if not argv or argv[0] in ('-h', '--help') or argv[0] not in commands:
+        print("usage: cat12.py <befehl> [argumente]   (cat12.py <befehl> --help)\n\nBefehle:")
+        for name in order:
+            print(f"  {name:<11} {commands[name]}")
+        if argv and argv[0] not in ('-h', '--help'):
+            print(f"\n✗ unbekannter Befehl: {argv[0]}")
+            sys.exit(2)
+        return
+
+    command, rest = argv[0], argv[1:]
+    if command in LOCAL_COMMANDS:
+        LOCAL_COMMANDS[command][0](rest)
+    else:
+        run_script(command, rest)
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    main()
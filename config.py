@@ -3,6 +3,8 @@ import pandas as pd
 import os
 from collections import Counter
 
+from instrumentation import instrumented, stage
+
 # --- Konfiguration ---
 RAW_DATA_ROOT = "/net/data.isilon/ag-cherrmann/stumrani/mri_prep"
 
@@ -44,6 +46,20 @@ METADATA_PATHS = ["/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_new
 OUTPUT_FILE = "/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/valid_paths_all_data.txt"
 # --------------------
 
+def normalize_subject_id(names: pd.Series) -> pd.Series:
+    """
+    Bringt Dateinamen aus allen Pipeline-Stufen auf eine gemeinsame Subject-ID
+    (z.B. 'cat_IXI002-Guys-0828-T1.xml', 'mwp1sub-whiteCAT137_ses-01_T1w.nii',
+    'IXI002-Guys-0828-T1_cat12_results.csv' -> Metadaten-'Filename')
+    """
+    ids = names.astype(str).str.strip().str.replace(r'^.*/', '', regex=True)
+    ids = ids.str.replace(r'(_cat12_results\.csv|\.xml|\.nii\.gz|\.nii|\.gz)$', '', regex=True)
+    ids = ids.str.replace(r'^(cat_|catROIs?_)', '', regex=True)
+    ids = ids.str.replace(r'^(mwp[12]|p[012])(?=sub-|IXI|CC|\d)', '', regex=True)
+    return ids
+
+
+@instrumented('discovery.check_duplicates_in_metadata', items=len)
 def check_duplicates_in_metadata(paths: list):
     """
     Prüft auf Duplikate in den Metadaten
@@ -72,6 +88,7 @@ def check_duplicates_in_metadata(paths: list):
         print("✓ Keine Duplikate in Metadaten gefunden")
         return {}
 
+@instrumented('discovery.valid_patients', items=len)
 def valid_patients(paths: list) -> list:
     """
     Liest die Metadaten und gibt eine Liste von Patientennamen zurück
@@ -100,6 +117,7 @@ def find_nii_files(directory: pathlib.Path) -> list:
     nii_gz_files = list(directory.glob("*.nii.gz"))
     return nii_files + nii_gz_files
 
+@instrumented('discovery.get_valid_mri_paths', items=lambda result: len(result[0]))
 def get_valid_mri_paths(root_dir: str, primary_folders: list, secondary_folders: list, additional_paths: list, metadata_paths: list) -> tuple:
     """
     Findet alle .nii und .nii.gz Dateien in drei Phasen:
@@ -251,7 +269,15 @@ def get_valid_mri_paths(root_dir: str, primary_folders: list, secondary_folders:
     print(f"\nTotal matched files: {len(filtered_mri_paths)}")
     return filtered_mri_paths, file_duplicates
 
-if __name__ == "__main__":
+
+def main(argv: list = None):
+    """Kommandozeile (auch über cat12.py discover)"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="valid_paths-Liste (NIfTI-Pfade mit Metadaten) für SLURM erstellen")
+    parser.add_argument('--output', default=OUTPUT_FILE, help="Zieldatei (VALID_PATHS_FILE im SLURM-Skript)")
+    args = parser.parse_args(argv)
+
     # Generiere die finale Liste
     print("=== Starting file validation ===")
     
@@ -272,11 +298,12 @@ if __name__ == "__main__":
         exit(1)
     
     # Speichere die Liste in einer Textdatei für SLURM
-    with open(OUTPUT_FILE, "w") as f:
-        f.write("\n".join(VALID_FILES))
+    with stage('discovery.write_valid_paths', items=len(VALID_FILES)):
+        with open(args.output, "w") as f:
+            f.write("\n".join(VALID_FILES))
     
     print(f"\n=== Validation complete ===")
-    print(f"Valid paths saved to: {OUTPUT_FILE}")
+    print(f"Valid paths saved to: {args.output}")
     print(f"Total files to process: {len(VALID_FILES)}")
     
     # Zusammenfassung
@@ -289,4 +316,8 @@ if __name__ == "__main__":
     if file_duplicates:
         print(f"⚠️  MRI-Datei-Duplikate: {len(file_duplicates)} Patienten mit mehreren Dateien")
     else:
-        print("✓ MRI-Dateien: Keine Duplikate")
\ No newline at end of file
+        print("✓ MRI-Dateien: Keine Duplikate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stufen-Instrumentierung für die Python-Pipeline (Wall-Zeit, CPU-Zeit, Peak-RSS, Anzahl Einträge)
+Eingeschaltet über die Umgebungsvariable CAT12_PROFILE:
+    CAT12_PROFILE=1                      -> ./cat12_profile.jsonl
+    CAT12_PROFILE=/pfad/profil.jsonl     -> diese Datei
+Ohne die Variable sind stage() und @instrumented fast kostenlos (eine Abfrage pro Aufruf).
+Jede beendete Stufe wird als eine JSON-Zeile angehängt; verschachtelte Stufen bekommen einen
+Pfad (z.B. 'qc.main/qc.parse'). Peak-RSS gilt pro Stufe (VmHWM wird unter Linux beim Eintritt
+zurückgesetzt), sonst für den ganzen Prozess. Arbeit in Worker-Prozessen zählt als children_cpu_s.
+
+    with stage('metadata.read_csv') as s:
+        df = pd.read_csv(path)
+        s.items = len(df)
+
+    @instrumented('qc.parse', items=len)
+    def collect_data_from_cohorts(...): ...
+
+    python instrumentation.py summary cat12_profile.jsonl --top 15
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+#%% ========== KONFIGURATION ==========
+
+PROFILE_ENV = 'CAT12_PROFILE'
+DEFAULT_PROFILE_FILE = 'cat12_profile.jsonl'
+
+# Werte von CAT12_PROFILE, die als "aus" bzw. "an mit Standarddatei" gelten
+_OFF_VALUES = {'', '0', 'false', 'off', 'no'}
+_ON_VALUES = {'1', 'true', 'on', 'yes'}
+
+RUN_ID = f"{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}"
+
+#%% ========== FUNKTIONEN ==========
+
+_state = {'configured': False, 'path': None, 'hwm_reset': None}
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def profile_path() -> Optional[Path]:
+    """Zieldatei aus CAT12_PROFILE (einmal gelesen), None = Instrumentierung aus"""
+    if not _state['configured']:
+        value = os.environ.get(PROFILE_ENV, '').strip()
+        if value.lower() in _OFF_VALUES:
+            path = None
+        elif value.lower() in _ON_VALUES:
+            path = Path(DEFAULT_PROFILE_FILE)
+        else:
+            path = Path(value)
+        _state.update(configured=True, path=path)
+    return _state['path']
+
+
+def enable(path: Union[str, Path] = DEFAULT_PROFILE_FILE):
+    """Instrumentierung im Code einschalten (statt über CAT12_PROFILE)"""
+    _state.update(configured=True, path=Path(path))
+
+
+def disable():
+    _state.update(configured=True, path=None)
+
+
+def _memory_kb() -> dict:
+    """VmRSS / VmHWM aus /proc/self/status (kB), leer wenn nicht verfügbar"""
+    values = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    values[line[:5]] = int(line.split()[1])
+    except OSError:
+        pass
+    return values
+
+
+def _reset_hwm() -> bool:
+    """VmHWM auf aktuelle RSS zurücksetzen (Linux >= 4.0); False, wenn nicht möglich"""
+    if _state['hwm_reset'] is False:
+        return False
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _state['hwm_reset'] = True
+    except OSError:
+        _state['hwm_reset'] = False
+    return _state['hwm_reset']
+
+
+def _peak_kb(memory: dict) -> int:
+    if 'VmHWM' in memory:
+        return memory['VmHWM']
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak  # macOS: Bytes
+    return 0
+
+
+def _children_cpu() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _write(record: dict, path: Path):
+    line = json.dumps(record, default=str) + '\n'
+    with _write_lock:
+        with open(path, 'a') as f:
+            f.write(line)
+
+
+class _NullStage:
+    """Ersatz, wenn die Instrumentierung aus ist (items/fields werden verworfen)"""
+    items = None
+
+    @property
+    def fields(self) -> dict:
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, name: str, path: Path, items: Optional[int] = None, **fields):
+        self.name = name
+        self.file = path
+        self.items = items
+        self.fields = fields
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        self.path = f"{self.parent.path}/{self.name}" if self.parent else self.name
+
+        memory = _memory_kb()
+        if self.parent is not None:
+            self.parent.peak = max(self.parent.peak, _peak_kb(memory))
+        self.peak_scope = 'stage' if _reset_hwm() else 'process'
+        self.peak = 0
+        self.rss_start = memory.get('VmRSS', 0)
+        stack.append(self)
+
+        self.started = datetime.now()
+        self.children_start = _children_cpu()
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        children = _children_cpu() - self.children_start
+        memory = _memory_kb()
+        self.peak = max(self.peak, _peak_kb(memory))
+        _local.stack.pop()
+        if self.parent is not None:
+            self.parent.peak = max(self.parent.peak, self.peak)
+
+        record = {
+            'run': RUN_ID, 'pid': os.getpid(), 'host': os.uname().nodename if hasattr(os, 'uname') else None,
+            'script': Path(sys.argv[0]).name if sys.argv and sys.argv[0] else None,
+            'stage': self.name, 'path': self.path, 'depth': self.path.count('/'),
+            'start': self.started.isoformat(timespec='milliseconds'),
+            'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6), 'children_cpu_s': round(children, 6),
+            'peak_rss_mb': round(self.peak / 1024, 1), 'peak_scope': self.peak_scope,
+            'rss_delta_mb': round((memory.get('VmRSS', 0) - self.rss_start) / 1024, 1),
+            'items': self.items,
+            'status': 'ok' if exc_type is None else f'error: {exc_type.__name__}',
+            **self.fields,
+        }
+        try:
+            _write(record, self.file)
+        except OSError as e:
+            print(f"⚠️  Profil konnte nicht geschrieben werden ({self.file}): {e}", file=sys.stderr)
+        return False
+
+
+def stage(name: str, items: Optional[int] = None, **fields):
+    """
+    Kontextmanager für eine Stufe. Im Block kann s.items (Anzahl verarbeiteter Einträge)
+    und s.fields (zusätzliche JSON-Felder) gesetzt werden.
+    """
+    path = profile_path()
+    if path is None:
+        return _NULL_STAGE
+    return _Stage(name, path, items, **fields)
+
+
+def _count_items(items, result, func: Callable, args, kwargs) -> Optional[int]:
+    """items: Funktion auf dem Rückgabewert oder Name eines Arguments (dessen len())"""
+    try:
+        if callable(items):
+            return int(items(result))
+        import inspect
+        bound = inspect.signature(func).bind_partial(*args, **kwargs)
+        return len(bound.arguments[items])
+    except Exception:
+        return None
+
+
+def instrumented(name: Union[str, Callable, None] = None, items: Union[Callable, str, None] = None):
+    """
+    Decorator: jeder Aufruf ist eine Stufe (Name Standard: modul.funktion).
+        @instrumented
+        @instrumented('qc.stats', items='df')        # len(df) als items
+        @instrumented('qc.parse', items=len)         # len(Rückgabewert)
+    """
+    def decorate(func):
+        stage_name = name if isinstance(name, str) else f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            path = profile_path()
+            if path is None:
+                return func(*args, **kwargs)
+            with _Stage(stage_name, path) as s:
+                result = func(*args, **kwargs)
+                if items is not None:
+                    s.items = _count_items(items, result, func, args, kwargs)
+            return result
+        return wrapper
+
+    return decorate(name) if callable(name) else decorate
+
+
+def read_profile(paths) -> list:
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def summarize(records: list, by: str = 'path'):
+    """Pro Stufe: Aufrufe, Wall-/CPU-Summen, Mittel, max. Peak-RSS, Einträge/s (sortiert nach Wall-Zeit)"""
+    import pandas as pd
+
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    df['total_cpu_s'] = df['cpu_s'] + df['children_cpu_s']
+    df['items'] = pd.to_numeric(df['items'], errors='coerce')
+    summary = df.groupby(by).agg(calls=('wall_s', 'size'), wall_s=('wall_s', 'sum'), wall_mean_s=('wall_s', 'mean'),
+                                 wall_max_s=('wall_s', 'max'), cpu_s=('total_cpu_s', 'sum'),
+                                 peak_rss_mb=('peak_rss_mb', 'max'), items=('items', 'sum'),
+                                 errors=('status', lambda s: int((s != 'ok').sum())))
+    summary['items_per_s'] = (summary['items'] / summary['wall_s']).where(summary['items'] > 0)
+    return summary.sort_values('wall_s', ascending=False)
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Auswertung der Stufen-Profile (CAT12_PROFILE JSONL)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary_parser = subparsers.add_parser('summary', help="Top-Stufen nach Wall-Zeit")
+    summary_parser.add_argument('files', nargs='*', type=Path, default=[Path(DEFAULT_PROFILE_FILE)])
+    summary_parser.add_argument('--run', default='latest', help="Run-ID, 'latest' oder 'all'")
+    summary_parser.add_argument('--top', type=int, default=15)
+    summary_parser.add_argument('--by', choices=['path', 'stage'], default='path',
+                                help="path: verschachtelte Stufen getrennt, stage: nur nach Namen")
+    args = parser.parse_args()
+
+    records = read_profile(args.files)
+    if not records:
+        print("Keine Einträge im Profil.")
+        sys.exit(0)
+    runs = sorted({r['run'] for r in records})
+    if args.run == 'latest':
+        records = [r for r in records if r['run'] == runs[-1]]
+    elif args.run != 'all':
+        records = [r for r in records if r['run'] == args.run]
+    if not records:
+        print(f"Run {args.run} nicht gefunden (vorhanden: {', '.join(runs)})")
+        sys.exit(1)
+
+    selected = sorted({r['run'] for r in records})
+    top_level = sum(r['wall_s'] for r in records if r['depth'] == 0)
+    print("="*80)
+    print(f"PROFIL: {len(records)} Stufen aus {len(selected)} Run(s) ({', '.join(selected[-3:])})")
+    print(f"Wall-Zeit der obersten Stufen: {top_level:.2f} s")
+    print("="*80)
+    import pandas as pd
+    with pd.option_context('display.width', 200, 'display.max_colwidth', 60):
+        print(summarize(records, by=args.by).head(args.top).to_string(float_format=lambda v: f'{v:.3f}'))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metadaten-Ingestion für neue Datensätze
+Jede Quelle ist ein kleiner deklarativer Adapter (Reader, ID-Spalte, Dateinamen-Vorlage,
+Alters-Spalten, Sex-Kodierung, Dataset/Diagnose). Alle Transformationen laufen spaltenweise.
+Die Master-Tabelle wird nicht neu geschrieben: nur Header und Filename-Spalte werden gelesen,
+die neuen Zeilen werden nach Schema-Prüfung angehängt, bereits vorhandene Filenames abgelehnt.
+
+    python metadata/ingest.py SALD --source sub_information.xlsx
+    python metadata/ingest.py ds004856 --source ds004856/participants.tsv
+    python metadata/ingest.py bids --dataset NEW --source participants.tsv --template "{id}_T1w"
+"""
+
+import argparse
+import copy
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import METADATA_PATHS
+from instrumentation import instrumented
+
+#%% ========== KONFIGURATION ==========
+
+MASTER_FILE = Path(METADATA_PATHS[0])
+
+# Spalten, die jeder Adapter liefern muss (Reihenfolge der Master-Tabelle kommt aus deren Header)
+REQUIRED_COLUMNS = ['Filename', 'Dataset', 'Diagnosis', 'Age', 'Sex', 'Sex_int']
+
+# Rohwerte (klein geschrieben, ohne Leerzeichen) -> Sex; Adapter können eigene Kodierungen ergänzen
+SEX_CODES = {'f': 'Female', 'female': 'Female', 'w': 'Female', 'weiblich': 'Female',
+             'm': 'Male', 'male': 'Male', 'männlich': 'Male'}
+SEX_INT = {'Female': 0.0, 'Male': 1.0}
+
+AGE_RANGE = (0, 120)
+
+READERS = {
+    'excel': pd.read_excel,
+    'tsv': lambda path: pd.read_csv(path, sep='\t'),
+    'csv': pd.read_csv,
+}
+
+# id_width: numerische IDs mit führenden Nullen auffüllen (SALD: 31274 -> 031274)
+# age_columns: erste vorhandene Spalte wird verwendet
+ADAPTERS = {
+    'SALD': {
+        'reader': 'excel',
+        'id_column': 'Sub_ID',
+        'id_width': 6,
+        'template': 'sub-{id}_T1w',
+        'age_columns': ['Age'],
+        'sex_column': 'Sex',
+        'sex_codes': {'1': 'Female', '2': 'Male'},
+        'dataset': 'SALD',
+        'diagnosis': 'HC',
+    },
+    'ds004856': {
+        'reader': 'tsv',
+        'id_column': 'participant_id',
+        'template': '{id}_ses1_1_T1w',
+        'age_columns': ['AgeMRI_W1', 'AgeCog_W1', 'AgePETAmy_W1'],
+        'sex_column': 'Sex',
+        'dataset': 'openNeuro',
+        'diagnosis': 'HC',
+    },
+    # generischer BIDS participants.tsv, Dataset/Vorlage über die Kommandozeile
+    'bids': {
+        'reader': 'tsv',
+        'id_column': 'participant_id',
+        'template': '{id}_T1w',
+        'age_columns': ['age', 'Age'],
+        'sex_column': ['sex', 'Sex'],
+        'dataset': None,
+        'diagnosis': 'HC',
+    },
+}
+
+#%% ========== FUNKTIONEN ==========
+
+def _first_present(df: pd.DataFrame, columns) -> Optional[str]:
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    return next((c for c in columns if c in df.columns), None)
+
+
+def _normalized(values: pd.Series) -> pd.Series:
+    """Rohwerte als klein geschriebene Strings ohne Leerzeichen (1.0 -> '1')"""
+    if pd.api.types.is_numeric_dtype(values):
+        values = values.astype('Int64')
+    return values.astype('string').str.strip().str.lower()
+
+
+@instrumented('ingest.transform', items=len)
+def transform(raw: pd.DataFrame, adapter: Dict) -> pd.DataFrame:
+    """Quelle -> Zeilen im Master-Schema (vektorisiert, keine Zeilen-Lambdas)"""
+    ids = raw[adapter['id_column']]
+    if adapter.get('id_width') and pd.api.types.is_numeric_dtype(ids):
+        ids = ids.astype('Int64').astype('string').str.zfill(adapter['id_width'])
+    else:
+        ids = ids.astype('string').str.strip()
+    prefix, suffix = adapter['template'].split('{id}')
+
+    out = pd.DataFrame({'Filename': prefix + ids + suffix})
+    out['Dataset'] = adapter['dataset']
+    out['Diagnosis'] = adapter['diagnosis']
+
+    age_column = _first_present(raw, adapter['age_columns'])
+    if age_column is None:
+        print(f"  ⚠️  Keine Alters-Spalte gefunden ({adapter['age_columns']})")
+    else:
+        print(f"  ✓ Alter aus Spalte: {age_column}")
+    out['Age'] = pd.to_numeric(raw[age_column], errors='coerce') if age_column else np.nan
+
+    sex_column = _first_present(raw, adapter['sex_column'])
+    if sex_column is None:
+        print(f"  ⚠️  Keine Sex-Spalte gefunden ({adapter['sex_column']})")
+        out['Sex'] = None
+    else:
+        codes = {**SEX_CODES, **adapter.get('sex_codes', {})}
+        out['Sex'] = _normalized(raw[sex_column]).map(codes).astype(object)
+        unmapped = raw[sex_column][out['Sex'].isna() & raw[sex_column].notna()].unique()
+        if len(unmapped):
+            print(f"  ⚠️  Unbekannte Sex-Werte (-> NaN): {list(unmapped)}")
+    out['Sex_int'] = out['Sex'].map(SEX_INT).astype(np.float64)
+    return out
+
+
+@instrumented('ingest.read_master_schema', items=lambda result: len(result[1]))
+def read_master_schema(master_file: Path):
+    """Nur Header und Filename-Spalte der Master-Tabelle"""
+    columns = list(pd.read_csv(master_file, nrows=0).columns)
+    existing = pd.read_csv(master_file, usecols=['Filename'])['Filename']
+    return columns, set(existing.dropna())
+
+
+@instrumented('ingest.validate', items=len)
+def validate(new: pd.DataFrame, columns, existing) -> pd.DataFrame:
+    """
+    Schema-Prüfung: Pflichtspalten vorhanden, keine unbekannten Spalten, Alter numerisch im
+    plausiblen Bereich, Sex/Sex_int konsistent, Filenames eindeutig.
+    Bereits in der Master-Tabelle vorhandene Filenames werden abgelehnt (nicht angehängt).
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in new.columns]
+    unknown = [c for c in new.columns if c not in columns]
+    if missing or unknown:
+        raise ValueError(f"Schema passt nicht zur Master-Tabelle (fehlend: {missing}, unbekannt: {unknown})")
+    if new['Filename'].isna().any() or (new['Filename'] == '').any():
+        raise ValueError(f"{new['Filename'].isna().sum()} Zeilen ohne Filename")
+    if new['Dataset'].isna().any() or new['Diagnosis'].isna().any():
+        raise ValueError("Dataset und Diagnosis müssen gesetzt sein")
+    duplicated = new['Filename'][new['Filename'].duplicated()]
+    if len(duplicated):
+        raise ValueError(f"{len(duplicated)} doppelte Filenames in der Quelle, z.B. {list(duplicated[:5])}")
+    out_of_range = new['Age'].notna() & ~new['Age'].between(*AGE_RANGE)
+    if out_of_range.any():
+        raise ValueError(f"{out_of_range.sum()} Alterswerte außerhalb {AGE_RANGE}: {list(new['Age'][out_of_range][:5])}")
+    if not new['Sex'].dropna().isin(list(SEX_INT)).all() or \
+            (new['Sex'].map(SEX_INT).fillna(-1) != new['Sex_int'].fillna(-1)).any():
+        raise ValueError("Sex/Sex_int inkonsistent")
+
+    rejected = new['Filename'].isin(existing)
+    if rejected.any():
+        print(f"  ⚠️  {rejected.sum()} Filenames bereits in der Master-Tabelle -> abgelehnt "
+              f"(z.B. {list(new['Filename'][rejected][:3])})")
+    return new[~rejected]
+
+
+@instrumented('ingest.append_rows', items='new')
+def append_rows(master_file: Path, new: pd.DataFrame, columns):
+    """Hängt die Zeilen in Header-Reihenfolge an (fehlende Spalten leer), ein einziger Schreibvorgang"""
+    with open(master_file, 'rb') as f:
+        needs_newline = False
+        if f.seek(0, 2) > 0:
+            f.seek(-1, 2)
+            needs_newline = f.read(1) != b'\n'
+    with open(master_file, 'a', newline='') as f:
+        if needs_newline:
+            f.write('\n')
+        new.reindex(columns=columns).to_csv(f, header=False, index=False)
+
+
+@instrumented('ingest.ingest', items=len)
+def ingest(adapter_name: str, source: Path, master_file: Path = MASTER_FILE, dataset: Optional[str] = None,
+           template: Optional[str] = None, dry_run: bool = False) -> pd.DataFrame:
+    """Quelle einlesen, transformieren, prüfen und an die Master-Tabelle anhängen"""
+    adapter = copy.deepcopy(ADAPTERS[adapter_name])
+    if dataset:
+        adapter['dataset'] = dataset
+    if template:
+        adapter['template'] = template
+    if not adapter['dataset']:
+        raise ValueError(f"Adapter '{adapter_name}' braucht --dataset")
+
+    print("=" * 70)
+    print(f"METADATA INGESTION: {adapter['dataset']} ({adapter_name})")
+    print("=" * 70)
+
+    raw = READERS[adapter['reader']](source)
+    print(f"  ✓ {len(raw)} Subjects aus {source}")
+    new = transform(raw, adapter)
+
+    columns, existing = read_master_schema(master_file)
+    new = validate(new, columns, existing)
+
+    print(f"\n  Neue Einträge: {len(new)}")
+    print(f"  Fehlend - Age: {new['Age'].isna().sum()}, Sex: {new['Sex'].isna().sum()}")
+    if len(new):
+        print(new.head(3).to_string(index=False))
+
+    if dry_run:
+        print("\n(dry run - nichts geschrieben)")
+    elif len(new):
+        append_rows(master_file, new, columns)
+        print(f"\n✓ {len(new)} Zeilen angehängt an: {master_file}")
+    else:
+        print("\nNichts anzuhängen.")
+    return new
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+def main(argv: Optional[List[str]] = None):
+    """Kommandozeile (auch über cat12.py ingest)"""
+    parser = argparse.ArgumentParser(description="Neue Datensätze an die Metadaten-Master-Tabelle anhängen")
+    parser.add_argument('adapter', choices=sorted(ADAPTERS))
+    parser.add_argument('--source', type=Path, required=True, help="Excel/TSV/CSV der Quelle")
+    parser.add_argument('--master', type=Path, default=MASTER_FILE)
+    parser.add_argument('--dataset', default=None, help="Dataset-Name (überschreibt den Adapter)")
+    parser.add_argument('--template', default=None, help="Filename-Vorlage mit {id}, z.B. '{id}_ses-01_T1w'")
+    parser.add_argument('--dry-run', action='store_true', help="nur prüfen und anzeigen")
+    args = parser.parse_args(argv)
+
+    try:
+        ingest(args.adapter, args.source, args.master, args.dataset, args.template, args.dry_run)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,175 +1,178 @@
-import pandas as pd
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metadaten nachbearbeiten: Sex_int, ICD10 -> Co_Diagnosis, CTT-x und BP Diagnosen
+Die ICD10-Codes werden einmal vektorisiert geparst und über eine Regeltabelle (np.select,
+erste passende Regel gewinnt) ausgewertet. CTT- und BP-Vorrang werden in einem Durchlauf
+aufgelöst; alle Änderungen landen in einer Änderungstabelle statt einer Zeile pro Patient.
+"""
+
+import sys
+from pathlib import Path
+
 import numpy as np
-import re
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from instrumentation import instrumented, stage
+
+#%% ========== KONFIGURATION ==========
 
 # Dateipfade
 input_path = '/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/metadata/merged_metadata.csv'
 output_path = '/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/metadata/merged_metadata_processed.csv'
 
-# Daten einlesen
-print("Lade merged metadata...")
-df = pd.read_csv(input_path)
-print(f"Daten geladen: {len(df)} Zeilen, {len(df.columns)} Spalten")
-
-# ==================== STEP 1: Usage_original entfernen ====================
-print("\n" + "="*60)
-print("STEP 1: Entferne Usage_original Spalte")
-print("="*60)
-
-if 'Usage_original' in df.columns:
-    df = df.drop(columns=['Usage_original'])
-    print("✓ Usage_original Spalte entfernt")
-else:
-    print("Info: Usage_original Spalte nicht vorhanden")
-
-# ==================== STEP 2: Sex_int erstellen ====================
-print("\n" + "="*60)
-print("STEP 2: Erstelle Sex_int (0.0=female, 1.0=male)")
-print("="*60)
-
-df['Sex_int'] = df['Sex'].apply(lambda x: 
-    0.0 if pd.notna(x) and str(x).strip().lower() in ['female', 'f'] 
-    else (1.0 if pd.notna(x) and str(x).strip().lower() in ['male', 'm'] 
-    else np.nan)
-)
-print("✓ Sex_int Spalte erstellt")
-print(f"  Female (0.0): {(df['Sex_int'] == 0.0).sum()}")
-print(f"  Male (1.0): {(df['Sex_int'] == 1.0).sum()}")
-print(f"  Missing: {df['Sex_int'].isna().sum()}")
-
-# ==================== STEP 3: ICD10 Codes auswerten ====================
-print("\n" + "="*60)
-print("STEP 3: Werte ICD10 Codes aus")
-print("="*60)
-
-def evaluate_icd10_to_codiagnosis(code):
+# Änderungsprotokoll (eine Zeile pro geänderter Zelle)
+changes_path = str(Path(output_path).with_name(Path(output_path).stem + '_changes.csv'))
+
+# ICD10 -> Co_Diagnosis, in Reihenfolge geprüft (erste passende Regel gewinnt):
+#   prefix: Code beginnt mit (F31 auch F31.x, F310 ...)
+#   range : F-Nummer im Bereich (inklusive)
+ICD10_RULES = [
+    {'label': 'BP', 'prefix': 'F31'},
+    {'label': 'SCHZ', 'range': (20, 25)},
+    {'label': 'MDD', 'range': (32, 34)},
+    {'label': 'FSCOREMISSING', 'range': (0, np.inf)},  # andere F-Codes
+]
+
+SEX_INT_CODES = {'female': 0.0, 'f': 0.0, 'male': 1.0, 'm': 1.0}
+
+#%% ========== FUNKTIONEN ==========
+
+def derive_sex_int(sex: pd.Series) -> pd.Series:
+    """Sex_int (0.0=female, 1.0=male, sonst NaN)"""
+    return sex.astype('string').str.strip().str.lower().map(SEX_INT_CODES).astype(np.float64)
+
+
+def evaluate_icd10(codes: pd.Series, rules=ICD10_RULES) -> pd.Series:
     """
-    Wertet ICD10 Codes aus für Co_Diagnosis:
-    F20-F25: SCHZ
-    F31: BP
-    F32-F34: MDD
-    Andere F-Codes: FSCOREMISSING
-    Kein Wert: leer lassen
+    ICD10 Codes -> Co_Diagnosis für alle Zeilen auf einmal.
+    Codes ohne F-Nummer oder leer -> None (bestehende Co_Diagnosis bleibt).
     """
-    if pd.isna(code):
-        return None
-    
-    # Code als String behandeln
-    code_str = str(code).strip().upper()
-    
-    # Prüfe auf F31 (inkl. F31.x)
-    if code_str.startswith('F31'):
-        return 'BP'
-    
-    # Extrahiere F-Code Nummer
-    match = re.match(r'F(\d+)', code_str)
-    if not match:
-        return None
-    
-    f_number = int(match.group(1))
-    
-    if 20 <= f_number <= 25:
-        return 'SCHZ'
-    elif 32 <= f_number <= 34:
-        return 'MDD'
+    code = codes.astype('string').str.strip().str.upper()
+    number = pd.to_numeric(code.str.extract(r'^F(\d+)', expand=False), errors='coerce')
+
+    conditions = []
+    for rule in rules:
+        if 'prefix' in rule:
+            conditions.append(code.str.startswith(rule['prefix']).fillna(False).to_numpy(dtype=bool))
+        else:
+            low, high = rule['range']
+            conditions.append(number.between(low, high).fillna(False).to_numpy(dtype=bool))
+    labels = [rule['label'] for rule in rules]
+    return pd.Series(np.select(conditions, labels, default=None), index=codes.index, dtype=object)
+
+
+def _record(changes: list, df: pd.DataFrame, mask: np.ndarray, column: str, new, step: str):
+    """Hängt die tatsächlich geänderten Zellen an das Änderungsprotokoll an"""
+    old = df.loc[mask, column]
+    new = pd.Series(new, index=df.index)[mask] if not np.isscalar(new) else pd.Series(new, index=old.index)
+    changed = ~((old == new) | (old.isna() & new.isna()))
+    if changed.any():
+        changes.append(pd.DataFrame({
+            'row': old.index[changed],
+            'Filename': df.loc[old.index[changed], 'Filename'] if 'Filename' in df.columns else None,
+            'column': column,
+            'old': old[changed].to_numpy(dtype=object),
+            'new': new[changed].to_numpy(dtype=object),
+            'step': step,
+        }))
+
+
+@instrumented('metadata_joining.process_metadata', items='df')
+def process_metadata(df: pd.DataFrame):
+    """
+    Alle Schritte auf einer Kopie. Rückgabe: (verarbeitete Tabelle, Änderungsprotokoll)
+    """
+    df = df.copy()
+    changes = []
+
+    # STEP 1: Usage_original entfernen
+    if 'Usage_original' in df.columns:
+        df = df.drop(columns=['Usage_original'])
+        print("✓ Usage_original Spalte entfernt")
     else:
-        return 'FSCOREMISSING'
-
-# Erstelle Co_Diagnosis Spalte falls nicht vorhanden
-if 'Co_Diagnosis' not in df.columns:
-    df['Co_Diagnosis'] = ''
-
-# Werte ICD10 Codes aus und schreibe in Co_Diagnosis
-icd_processed = 0
-for idx in df.index:
-    icd_code = df.loc[idx, 'ICD10_Code']
-    
-    # Nur verarbeiten wenn ICD10_Code vorhanden
-    if pd.notna(icd_code):
-        codiagnosis = evaluate_icd10_to_codiagnosis(icd_code)
-        if codiagnosis:
-            df.loc[idx, 'Co_Diagnosis'] = codiagnosis
-            icd_processed += 1
-
-print(f"✓ {icd_processed} ICD10 Codes ausgewertet und in Co_Diagnosis geschrieben")
-
-# Zeige Co_Diagnosis Verteilung
-print("\nCo_Diagnosis Verteilung:")
-codiag_counts = df[df['Co_Diagnosis'] != '']['Co_Diagnosis'].value_counts()
-print(codiag_counts)
-
-# ==================== STEP 4: CTT Patienten verarbeiten ====================
-print("\n" + "="*60)
-print("STEP 4: Verarbeite CTT Patienten")
-print("="*60)
-
-# Identifiziere CTT Patienten
-ctt_mask = df['Diagnosis'] == 'CTT'
-ctt_count = ctt_mask.sum()
-
-print(f"Gefundene CTT Patienten: {ctt_count}")
-
-if ctt_count > 0:
-    updated_count = 0
-    for idx in df[ctt_mask].index:
-        codiagnosis = df.loc[idx, 'Co_Diagnosis']
-        
-        if pd.notna(codiagnosis) and codiagnosis != '':
-            # Setze Diagnosis auf CTT-{Codiagnosis}
-            df.loc[idx, 'Diagnosis'] = f'CTT-{codiagnosis}'
-            updated_count += 1
-            print(f"  Patient {idx}: CTT → CTT-{codiagnosis} (Co_Diagnosis: {codiagnosis})")
-    
-    print(f"\n✓ {updated_count} CTT Patienten mit Co_Diagnosis aktualisiert")
-    
-    # Zeige CTT Patienten ohne Co_Diagnosis
-    ctt_no_codiag = df[(df['Diagnosis'] == 'CTT') & ((df['Co_Diagnosis'] == '') | df['Co_Diagnosis'].isna())]
-    if len(ctt_no_codiag) > 0:
-        print(f"\nWarnung: {len(ctt_no_codiag)} CTT Patienten haben keine Co_Diagnosis")
-else:
-    print("Keine CTT Patienten gefunden")
-
-# ==================== STEP 5: F31.x Codes → BP in Diagnosis ====================
-print("\n" + "="*60)
-print("STEP 5: Setze BP Diagnose für alle F31.x Codes")
-print("="*60)
-
-bp_count = 0
-for idx in df.index:
-    icd_code = df.loc[idx, 'ICD10_Code']
-    
-    # Prüfe ob ICD10_Code mit F31 beginnt
-    if pd.notna(icd_code):
-        code_str = str(icd_code).strip().upper()
-        if code_str.startswith('F31'):
-            current_diagnosis = df.loc[idx, 'Diagnosis']
-            
-            # Nur überschreiben wenn nicht bereits CTT-BP ist
-            if not (pd.notna(current_diagnosis) and 'CTT-' in str(current_diagnosis)):
-                df.loc[idx, 'Diagnosis'] = 'BP'
-                bp_count += 1
-                print(f"  Patient {idx}: {current_diagnosis} → BP (ICD10: {icd_code})")
-
-print(f"\n✓ {bp_count} Patienten mit F31.x Code auf BP Diagnose gesetzt")
-
-# ==================== SPEICHERN ====================
-print("\n" + "="*60)
-print("SPEICHERN")
-print("="*60)
-
-print(f"\nSpeichere verarbeitete Daten nach: {output_path}")
-df.to_csv(output_path, index=False)
-
-print("\n✓ Fertig!")
-
-# ==================== ZUSAMMENFASSUNG ====================
-print("\n" + "="*60)
-print("ZUSAMMENFASSUNG")
-print("="*60)
-print(f"Gesamt Patienten: {len(df)}")
-print(f"\nDiagnose-Verteilung:")
-print(df['Diagnosis'].value_counts())
-print(f"\nCo_Diagnosis Verteilung (nicht leer):")
-print(df[df['Co_Diagnosis'] != '']['Co_Diagnosis'].value_counts())
-print(f"\nSex_int Verteilung:")
-print(df['Sex_int'].value_counts())
\ No newline at end of file
+        print("Info: Usage_original Spalte nicht vorhanden")
+
+    # STEP 2: Sex_int (0.0=female, 1.0=male)
+    sex_int = derive_sex_int(df['Sex'])
+    if 'Sex_int' in df.columns:
+        _record(changes, df, np.ones(len(df), dtype=bool), 'Sex_int', sex_int, 'sex_int')
+    df['Sex_int'] = sex_int
+    print(f"✓ Sex_int: Female {(sex_int == 0.0).sum()}, Male {(sex_int == 1.0).sum()}, Missing {sex_int.isna().sum()}")
+
+    # STEP 3: ICD10 -> Co_Diagnosis
+    if 'Co_Diagnosis' not in df.columns:
+        df['Co_Diagnosis'] = ''
+    df['Co_Diagnosis'] = df['Co_Diagnosis'].astype(object)
+    codiagnosis = evaluate_icd10(df['ICD10_Code'])
+    has_code = codiagnosis.notna().to_numpy()
+    _record(changes, df, has_code, 'Co_Diagnosis', codiagnosis, 'icd10')
+    df.loc[has_code, 'Co_Diagnosis'] = codiagnosis[has_code]
+    print(f"✓ {has_code.sum()} ICD10 Codes ausgewertet und in Co_Diagnosis geschrieben")
+
+    # STEP 4 + 5 in einem Durchlauf:
+    #   CTT mit Co_Diagnosis -> CTT-{Co_Diagnosis}
+    #   F31.x -> BP, außer die Diagnose ist (danach) CTT-x
+    diagnosis = df['Diagnosis'].astype(object)
+    co = df['Co_Diagnosis']
+    has_co = (co.notna() & (co != '')).to_numpy()
+    is_ctt = (diagnosis == 'CTT').to_numpy()
+    is_f31 = df['ICD10_Code'].astype('string').str.strip().str.upper().str.startswith('F31').fillna(False).to_numpy(dtype=bool)
+
+    ctt_update = is_ctt & has_co
+    after_ctt = np.where(ctt_update, 'CTT-' + co.astype(str), diagnosis)
+    is_ctt_x = pd.Series(after_ctt).astype('string').str.contains('CTT-', regex=False).fillna(False).to_numpy(dtype=bool)
+    bp_update = is_f31 & ~is_ctt_x
+
+    new_diagnosis = np.select([bp_update, ctt_update], ['BP', after_ctt], default=diagnosis)
+    _record(changes, df, ctt_update | bp_update, 'Diagnosis', new_diagnosis, 'diagnosis')
+    df['Diagnosis'] = new_diagnosis
+
+    print(f"✓ {ctt_update.sum()} von {is_ctt.sum()} CTT Patienten mit Co_Diagnosis aktualisiert")
+    if (is_ctt & ~has_co).any():
+        print(f"Warnung: {(is_ctt & ~has_co).sum()} CTT Patienten haben keine Co_Diagnosis")
+    print(f"✓ {bp_update.sum()} Patienten mit F31.x Code auf BP Diagnose gesetzt")
+
+    columns = ['row', 'Filename', 'column', 'old', 'new', 'step']
+    change_log = pd.concat(changes, ignore_index=True) if changes else pd.DataFrame(columns=columns)
+    return df, change_log
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    print("Lade merged metadata...")
+    with stage('metadata_joining.read_csv') as s:
+        df = pd.read_csv(input_path)
+        s.items = len(df)
+    print(f"Daten geladen: {len(df)} Zeilen, {len(df.columns)} Spalten")
+
+    print("\n" + "="*60)
+    print("VERARBEITUNG")
+    print("="*60)
+    df, change_log = process_metadata(df)
+
+    print("\n" + "="*60)
+    print("SPEICHERN")
+    print("="*60)
+    print(f"\nSpeichere verarbeitete Daten nach: {output_path}")
+    with stage('metadata_joining.write_csv', items=len(df)):
+        df.to_csv(output_path, index=False)
+        change_log.to_csv(changes_path, index=False)
+    print(f"Änderungsprotokoll ({len(change_log)} Änderungen): {changes_path}")
+    print("\n✓ Fertig!")
+
+    print("\n" + "="*60)
+    print("ZUSAMMENFASSUNG")
+    print("="*60)
+    print(f"Gesamt Patienten: {len(df)}")
+    print("\nÄnderungen pro Schritt und Spalte:")
+    if not change_log.empty:
+        print(change_log.groupby(['step', 'column', 'new'], dropna=False).size().to_string())
+    print("\nDiagnose-Verteilung:")
+    print(df['Diagnosis'].value_counts())
+    print("\nCo_Diagnosis Verteilung (nicht leer):")
+    print(df[df['Co_Diagnosis'] != '']['Co_Diagnosis'].value_counts())
+    print("\nSex_int Verteilung:")
+    print(df['Sex_int'].value_counts())
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Versionierter Metadaten-Store
+Statt mehrerer kompletter CSV-Kopien: typisierte Parquet-Partitionen pro Dataset
+(Diagnosis/Sex/Dataset/Co_Diagnosis kategorisch). Partitionen sind inhaltsadressiert -
+ein Snapshot schreibt nur Datasets, die sich geändert haben, alle anderen werden von der
+Vorversion übernommen. Pro Version gibt es einen kleinen Index (Filename, Dataset, Zeilen-Hash):
+Filename-Abfragen lesen nur die betroffenen Partitionen, diff() vergleicht nur die Indizes.
+
+    python metadata/metadata_store.py snapshot --csv complete_metadata_all.csv -m "SALD ergänzt"
+    python metadata/metadata_store.py list
+    python metadata/metadata_store.py diff <alt> <neu>
+    python metadata/metadata_store.py export --csv complete_metadata_all.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import METADATA_PATHS
+from instrumentation import instrumented
+
+#%% ========== KONFIGURATION ==========
+
+METADATA_STORE_PATH = Path(METADATA_PATHS[0]).parent / 'metadata_store'
+
+CATEGORICAL_COLUMNS = ['Dataset', 'Diagnosis', 'Sex', 'Co_Diagnosis']
+STRING_COLUMNS = ['Filename', 'ICD10_Code']
+
+# Alte Index-Spalten aus früheren to_csv(index=True) Aufrufen
+DROP_COLUMNS = ['Unnamed: 0']
+
+#%% ========== FUNKTIONEN ==========
+
+def normalize_types(df: pd.DataFrame) -> pd.DataFrame:
+    """Einheitliche Typen (Voraussetzung für stabile Zeilen-Hashes zwischen Versionen)"""
+    df = df.drop(columns=[c for c in DROP_COLUMNS if c in df.columns])
+    out = {}
+    for column in df.columns:
+        values = df[column]
+        if column in CATEGORICAL_COLUMNS:
+            out[column] = values.astype('string').astype('category')
+        elif column in STRING_COLUMNS or not pd.api.types.is_numeric_dtype(values):
+            out[column] = values.astype('string')
+        else:
+            out[column] = values.astype(np.float64)
+    return pd.DataFrame(out, index=df.index)
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """64-bit Hash pro Zeile über alle Spalten (Spaltenname fließt mit ein)"""
+    # Kategorien als Strings hashen, damit unterschiedliche Kategorie-Listen nicht stören
+    plain = df.apply(lambda s: s.astype('string') if isinstance(s.dtype, pd.CategoricalDtype) else s)
+    plain.columns = [str(c) for c in plain.columns]
+    hashes = pd.util.hash_pandas_object(plain, index=False).to_numpy()
+    salt = int(hashlib.sha1('|'.join(plain.columns).encode()).hexdigest()[:15], 16)
+    return hashes ^ np.uint64(salt)
+
+
+def _partition_key(rows: np.ndarray) -> str:
+    return hashlib.sha1(np.sort(rows).tobytes()).hexdigest()[:16]
+
+
+class MetadataStore:
+    """
+    Layout:
+        partitions/<Dataset>/<inhalts-hash>.parquet   (geteilt zwischen Versionen)
+        versions/<version>.json                       (Partition pro Dataset, Nachricht, Vorgänger)
+        index/<version>.parquet                       (Filename, Dataset, row_hash)
+        LATEST
+    """
+
+    def __init__(self, path: Path = METADATA_STORE_PATH):
+        self.path = Path(path)
+
+    # ---------- Versionen ----------
+
+    def versions(self) -> List[str]:
+        version_dir = self.path / 'versions'
+        return sorted(p.stem for p in version_dir.glob('*.json')) if version_dir.exists() else []
+
+    @property
+    def latest(self) -> Optional[str]:
+        latest_file = self.path / 'LATEST'
+        return latest_file.read_text().strip() if latest_file.exists() else None
+
+    def manifest(self, version: Optional[str] = None) -> Dict:
+        version = version or self.latest
+        if version is None:
+            raise FileNotFoundError(f"Keine Version im Metadaten-Store: {self.path}")
+        with open(self.path / 'versions' / f'{version}.json') as f:
+            return json.load(f)
+
+    def index(self, version: Optional[str] = None) -> pd.DataFrame:
+        """Filename, Dataset, row_hash der Version (klein, ohne die eigentlichen Daten)"""
+        return pd.read_parquet(self.path / 'index' / f'{self.manifest(version)["version"]}.parquet')
+
+    # ---------- Schreiben ----------
+
+    @instrumented('metadata_store.snapshot', items='df')
+    def snapshot(self, df: pd.DataFrame, message: str = '') -> str:
+        """
+        Neue Version aus einer kompletten Metadaten-Tabelle. Unveränderte Datasets verweisen auf
+        die vorhandene Partition; ist nichts geändert, wird keine Version angelegt.
+        """
+        df = normalize_types(df)
+        duplicated = df['Filename'].duplicated()
+        if duplicated.any():
+            raise ValueError(f"{duplicated.sum()} doppelte Filenames, z.B. {list(df['Filename'][duplicated][:5])}")
+        if df['Dataset'].isna().any():
+            raise ValueError(f"{df['Dataset'].isna().sum()} Zeilen ohne Dataset")
+
+        hashes = row_hashes(df)
+        partitions, written = {}, 0
+        for dataset, rows in df.groupby('Dataset', observed=True).indices.items():
+            key = _partition_key(hashes[rows])
+            target = self.path / 'partitions' / str(dataset) / f'{key}.parquet'
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                tmp = target.with_suffix('.tmp')
+                df.iloc[rows].sort_values('Filename').to_parquet(tmp, index=False)
+                os.replace(tmp, target)
+                written += 1
+            partitions[str(dataset)] = {'file': str(target.relative_to(self.path)), 'rows': int(len(rows))}
+
+        parent = self.latest
+        if parent and self.manifest(parent)['partitions'] == partitions \
+                and self.manifest(parent)['columns'] == list(df.columns):
+            print(f"✓ Keine Änderungen gegenüber {parent}")
+            return parent
+
+        content = hashlib.sha1(json.dumps(partitions, sort_keys=True).encode()).hexdigest()[:8]
+        version = f"{datetime.now():%Y%m%d-%H%M%S}_{content}"
+        (self.path / 'index').mkdir(parents=True, exist_ok=True)
+        pd.DataFrame({'Filename': df['Filename'].to_numpy(), 'Dataset': df['Dataset'].astype('string').to_numpy(),
+                      'row_hash': hashes}).to_parquet(self.path / 'index' / f'{version}.parquet', index=False)
+
+        manifest = {'version': version, 'parent': parent, 'message': message,
+                    'created': datetime.now().isoformat(timespec='seconds'),
+                    'n_rows': int(len(df)), 'columns': list(df.columns), 'partitions': partitions}
+        (self.path / 'versions').mkdir(parents=True, exist_ok=True)
+        with open(self.path / 'versions' / f'{version}.json', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        (self.path / 'LATEST').write_text(version)
+        print(f"✓ Version {version}: {len(df)} Zeilen, {written}/{len(partitions)} Partitionen neu geschrieben")
+        return version
+
+    def import_csv(self, csv_path: Path, message: str = '') -> str:
+        return self.snapshot(pd.read_csv(csv_path), message or f"Import {csv_path}")
+
+    # ---------- Lesen ----------
+
+    def _read_partitions(self, manifest: Dict, datasets: Optional[List[str]], columns: Optional[List[str]],
+                         filters=None) -> pd.DataFrame:
+        frames = [pd.read_parquet(self.path / part['file'], columns=columns, filters=filters)
+                  for dataset, part in manifest['partitions'].items()
+                  if datasets is None or dataset in datasets]
+        if not frames:
+            return pd.DataFrame(columns=columns or manifest['columns'])
+        df = pd.concat(frames, ignore_index=True)
+        # Kategorien über alle Partitionen vereinheitlichen
+        for column in CATEGORICAL_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype('string').astype('category')
+        return df
+
+    @instrumented('metadata_store.load', items=len)
+    def load(self, version: Optional[str] = None, datasets: Optional[List[str]] = None,
+             columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Ganze Version oder nur einzelne Datasets/Spalten"""
+        return self._read_partitions(self.manifest(version), datasets, columns)
+
+    def lookup(self, filenames, version: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Zeilen zu Filenames - über den Index werden nur die betroffenen Partitionen gelesen"""
+        filenames = list(pd.unique(pd.Series(list(filenames), dtype='string').dropna()))
+        index = self.index(version)
+        hit = index[index['Filename'].isin(filenames)]
+        if hit.empty:
+            return pd.DataFrame(columns=columns or self.manifest(version)['columns'])
+        return self._read_partitions(self.manifest(version), list(hit['Dataset'].unique()), columns,
+                                     filters=[('Filename', 'in', list(hit['Filename']))])
+
+    def diff(self, old: str, new: Optional[str] = None, changed_columns: bool = False) -> pd.DataFrame:
+        """
+        Zeilen, die zwischen zwei Versionen hinzugekommen, entfernt oder geändert sind
+        (Vergleich nur über die Indizes). changed_columns=True liest die geänderten Zeilen
+        beider Versionen und listet die betroffenen Spalten.
+        """
+        a = self.index(old).set_index('Filename')
+        b = self.index(new).set_index('Filename')
+        added = b.index.difference(a.index)
+        removed = a.index.difference(b.index)
+        common = a.index.intersection(b.index)
+        changed = common[a.loc[common, 'row_hash'].to_numpy() != b.loc[common, 'row_hash'].to_numpy()]
+
+        result = pd.concat([
+            pd.DataFrame({'Filename': added, 'Dataset': b.loc[added, 'Dataset'].to_numpy(), 'status': 'added'}),
+            pd.DataFrame({'Filename': removed, 'Dataset': a.loc[removed, 'Dataset'].to_numpy(), 'status': 'removed'}),
+            pd.DataFrame({'Filename': changed, 'Dataset': b.loc[changed, 'Dataset'].to_numpy(), 'status': 'changed'}),
+        ], ignore_index=True)
+
+        if changed_columns and len(changed):
+            before = self.lookup(changed, old).set_index('Filename')
+            after = self.lookup(changed, new).set_index('Filename').reindex(before.index)
+            shared = [c for c in after.columns if c in before.columns]
+            differs = ~((before[shared].astype('string') == after[shared].astype('string')).fillna(False)
+                        | (before[shared].isna() & after[shared].isna()))
+            columns = differs.apply(lambda row: ','.join(row.index[row]), axis=1)
+            new_columns = [c for c in after.columns if c not in before.columns]
+            if new_columns:
+                columns = columns.where(columns == '', columns + ',') + ','.join(new_columns)
+            result['columns'] = result['Filename'].map(columns)
+        return result
+
+
+def read_metadata(path) -> pd.DataFrame:
+    """Metadaten aus CSV oder aus dem Store (Verzeichnis, aktuelle Version)"""
+    path = Path(path)
+    if path.is_dir():
+        return MetadataStore(path).load()
+    return pd.read_csv(path)
+
+
+def metadata_signature(path) -> List[list]:
+    """Cache-Signatur: [[Store, Version]] oder [[Pfad, Größe, mtime]] der CSV"""
+    path = Path(path)
+    if path.is_dir():
+        return [[str(path), MetadataStore(path).latest]]
+    try:
+        st = os.stat(path)
+        return [[str(path), st.st_size, st.st_mtime_ns]]
+    except OSError:
+        return [[str(path), None, None]]
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versionierter Metadaten-Store")
+    parser.add_argument('--store', type=Path, default=METADATA_STORE_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_snapshot = sub.add_parser('snapshot', help="CSV als neue Version übernehmen")
+    p_snapshot.add_argument('--csv', type=Path, default=Path(METADATA_PATHS[0]))
+    p_snapshot.add_argument('-m', '--message', default='')
+
+    sub.add_parser('list', help="alle Versionen")
+
+    p_diff = sub.add_parser('diff', help="hinzugekommene/entfernte/geänderte Zeilen")
+    p_diff.add_argument('old')
+    p_diff.add_argument('new', nargs='?', default=None)
+    p_diff.add_argument('--output', type=Path, default=None)
+
+    p_export = sub.add_parser('export', help="Version als CSV schreiben")
+    p_export.add_argument('--version', default=None)
+    p_export.add_argument('--csv', type=Path, required=True)
+
+    args = parser.parse_args()
+    store = MetadataStore(args.store)
+
+    if args.command == 'snapshot':
+        store.import_csv(args.csv, args.message)
+    elif args.command == 'list':
+        for version in store.versions():
+            m = store.manifest(version)
+            marker = '*' if version == store.latest else ' '
+            print(f"{marker} {version}  {m['n_rows']:6d} Zeilen  {len(m['partitions']):3d} Datasets  {m['message']}")
+    elif args.command == 'diff':
+        result = store.diff(args.old, args.new, changed_columns=True)
+        print(result['status'].value_counts().to_string() if not result.empty else "Keine Unterschiede")
+        print(result.groupby(['Dataset', 'status']).size().to_string() if not result.empty else "")
+        if args.output:
+            result.to_csv(args.output, index=False)
+            print(f"✓ Gespeichert: {args.output}")
+    elif args.command == 'export':
+        store.load(args.version).to_csv(args.csv, index=False)
+        print(f"✓ {args.csv}")
@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Feature-Matrix Builder für das normative VAE
+Verbindet die CAT12-Ergebnisse (<SUBJECT>_cat12_results.csv) mit Metadaten und
+QC-Ratings und schreibt einen versionierten, gecachten Feature-Store:
+float32-Matrix (Subjects x Features) als .npy-Memmap plus ausgerichtete Kovariaten.
+Mit dem Metadaten-Store (--metadata <Verzeichnis>) werden nach einem neuen Snapshot nur
+die hinzugekommenen, geänderten und entfernten Subjects neu verbunden (MetadataStore.diff).
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import shutil
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import normalize_subject_id
+from instrumentation import instrumented
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'metadata'))
+from metadata_store import MetadataStore, metadata_signature, read_metadata
+
+#%% ========== KONFIGURATION ==========
+
+# CAT12 Output (1 Ordner pro Subject)
+DATA_OUTPUT_ROOT = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/data_output")
+
+# Metadaten (CSV oder Verzeichnis des Metadaten-Stores, metadata/metadata_store.py) & QC-Tabelle
+METADATA_PATH = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/metadata/complete_metadata_all.csv")
+QC_PATH = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/quality_assessment/complete_data.csv")
+
+# Ziel für den Feature-Store (eine Unterordner-Version pro Input-Stand)
+FEATURE_STORE_PATH = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/feature_store")
+
+# QC-Spalten, die als Kovariaten mitgeführt werden
+QC_COLUMNS = ['IQR_rating', 'SIQR_rating', 'SurfaceEulerNumber_rating', 'SurfaceDefectArea_rating', 'NCR', 'ICR']
+
+# Spalten aus der Ergebnis-CSV, die keine Features sind (QC bzw. TIV als Kovariate)
+NON_FEATURE_COLUMNS = ['Subject', 'IQR', 'NCR', 'ICR', 'res_RMS', 'TIV']
+
+# Volumen-Spalten, die bei TIV-Normalisierung durch TIV geteilt werden
+GLOBAL_VOLUME_COLUMNS = ['GM_vol', 'WM_vol', 'CSF_vol', 'WMH_vol']
+VOLUME_MEASURES = ['Vgm', 'Vwm', 'Vcsf']
+
+# Spaltenformat: <Messung>_<Atlas>_<Region>, z.B. Vgm_Neurom_lAmy, T_DK40_lh_bankssts
+FEATURE_PATTERN = re.compile(r'^(Vgm|Vwm|Vcsf|T|G)_([A-Za-z0-9]+)_(.+)$')
+
+# Bei Änderungen am Store-Format hochzählen -> invalidiert alle Caches
+BUILDER_VERSION = 1
+
+#%% ========== FUNKTIONEN ==========
+
+def find_result_files(output_root: Path) -> List[Path]:
+    """
+    Findet alle <SUBJECT>/<SUBJECT>_cat12_results.csv ohne rekursiven Glob
+    (eine Verzeichnisebene + ein stat pro Subject)
+    """
+    result_files = []
+    with os.scandir(output_root) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            csv_path = Path(entry.path) / f"{entry.name}_cat12_results.csv"
+            if csv_path.is_file():
+                result_files.append(csv_path)
+    return sorted(result_files)
+
+
+@instrumented('features.aggregate_subject_results', items=len)
+def aggregate_subject_results(result_files: List[Path], n_workers: int = 8) -> pd.DataFrame:
+    """
+    Liest alle Einzel-CSVs (je 1 Zeile) parallel ein und fügt sie zu einer Tabelle zusammen
+    """
+    def _read(path):
+        try:
+            frame = pd.read_csv(path)
+            if 'Subject' not in frame.columns:
+                frame['Subject'] = path.parent.name
+            return frame
+        except Exception as e:
+            print(f"Fehler beim Lesen von {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        frames = [f for f in pool.map(_read, result_files) if f is not None and not f.empty]
+
+    if not frames:
+        return pd.DataFrame()
+
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+
+def _file_signature(paths: List[Path]) -> List[list]:
+    """(Name, Größe, mtime) pro Datei - Grundlage für die Cache-Version"""
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            signature.append([str(path), st.st_size, st.st_mtime_ns])
+        except OSError:
+            signature.append([str(path), None, None])
+    return signature
+
+
+def compute_store_version(result_files: List[Path], metadata_path: Path, qc_path: Optional[Path],
+                          tiv_normalize: bool) -> str:
+    """Hash über alle Inputs + Builder-Parameter"""
+    payload = {
+        'builder_version': BUILDER_VERSION,
+        'tiv_normalize': tiv_normalize,
+        'results': _file_signature(result_files),
+        'metadata': metadata_signature(metadata_path),
+        'qc': _file_signature([qc_path]) if qc_path else None,
+    }
+    digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    return f"v{BUILDER_VERSION}_{digest[:12]}"
+
+
+def compute_base_key(result_files: List[Path], qc_path: Optional[Path], tiv_normalize: bool) -> str:
+    """Hash über alle Inputs außer den Metadaten - gleiche Basis erlaubt inkrementelle Metadaten-Updates"""
+    payload = {
+        'builder_version': BUILDER_VERSION,
+        'tiv_normalize': tiv_normalize,
+        'results': _file_signature(result_files),
+        'qc': _file_signature([qc_path]) if qc_path else None,
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def feature_blocks(feature_columns: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Index-Arrays pro Atlas/Messung:
+    'Vgm_Neurom' (Messung + Atlas), 'atlas:Neurom', 'measure:Vgm' und 'global'
+    """
+    blocks = {}
+    for idx, col in enumerate(feature_columns):
+        match = FEATURE_PATTERN.match(col)
+        if match:
+            measure, atlas = match.group(1), match.group(2)
+            keys = [f"{measure}_{atlas}", f"atlas:{atlas}", f"measure:{measure}"]
+        else:
+            keys = ['global']
+        for key in keys:
+            blocks.setdefault(key, []).append(idx)
+    return {key: np.asarray(idx, dtype=np.int32) for key, idx in blocks.items()}
+
+
+def _block_sort_key(col: str) -> str:
+    match = FEATURE_PATTERN.match(col)
+    return f"{match.group(2)}_{match.group(1)}" if match else ''
+
+
+@instrumented('features.join_results_metadata_qc', items=len)
+def join_results_metadata_qc(results: pd.DataFrame, metadata: pd.DataFrame,
+                             qc: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Verbindet Ergebnisse, Metadaten und QC über die normalisierte Subject-ID
+    """
+    # NCR/ICR aus der Ergebnis-CSV sind Ratings - die QC-Spalten kommen aus der QC-Tabelle
+    results = results.drop(columns=[c for c in QC_COLUMNS if c in results.columns])
+    results['subject_id'] = normalize_subject_id(results['Subject'])
+
+    metadata = metadata.drop(columns=['Unnamed: 0'], errors='ignore').copy()
+    metadata['subject_id'] = normalize_subject_id(metadata['Filename'])
+    duplicated = metadata['subject_id'].duplicated()
+    if duplicated.any():
+        print(f"⚠️  {duplicated.sum()} doppelte Subjects in Metadaten - erster Eintrag wird verwendet")
+        metadata = metadata[~duplicated]
+
+    merged = results.merge(metadata[['subject_id', 'Age', 'Sex_int', 'Diagnosis', 'Dataset']],
+                           on='subject_id', how='inner')
+    n_missing = len(results) - len(merged)
+    if n_missing > 0:
+        print(f"⚠️  {n_missing} Subjects ohne Metadaten werden ausgelassen")
+
+    if qc is not None and not qc.empty:
+        qc = qc.copy()
+        qc['subject_id'] = normalize_subject_id(qc['filename'])
+        qc = qc.drop_duplicates('subject_id')
+        qc_cols = ['subject_id'] + [c for c in QC_COLUMNS if c in qc.columns]
+        merged = merged.merge(qc[qc_cols], on='subject_id', how='left')
+
+    return merged.sort_values('subject_id').reset_index(drop=True)
+
+
+def _encode_categories(values: pd.Series):
+    """Kategorien -> int16 Codes (-1 = fehlend) + Liste der Kategorien"""
+    cat = pd.Categorical(values)
+    return cat.codes.astype(np.int16), [str(c) for c in cat.categories]
+
+
+def _feature_columns(merged: pd.DataFrame) -> List[str]:
+    excluded = set(NON_FEATURE_COLUMNS) | {'subject_id', 'Age', 'Sex_int', 'Diagnosis', 'Dataset'} | set(QC_COLUMNS)
+    feature_columns = [c for c in merged.columns
+                       if c not in excluded and pd.api.types.is_numeric_dtype(merged[c])]
+    return sorted(feature_columns, key=_block_sort_key)
+
+
+def _feature_values(merged: pd.DataFrame, feature_columns: List[str], tiv_normalize: bool):
+    """Feature-Matrix (float64, optional Volumina / TIV) und TIV-Vektor"""
+    features = merged.reindex(columns=feature_columns).to_numpy(dtype=np.float64)
+    tiv = merged['TIV'].to_numpy(dtype=np.float64) if 'TIV' in merged.columns else np.full(len(merged), np.nan)
+
+    if tiv_normalize:
+        volume_idx = [i for i, c in enumerate(feature_columns)
+                      if c in GLOBAL_VOLUME_COLUMNS or c.split('_', 1)[0] in VOLUME_MEASURES]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features[:, volume_idx] /= tiv[:, None]
+    return features, tiv
+
+
+def _sex_codes(sex: pd.Series) -> np.ndarray:
+    sex = sex.to_numpy(dtype=np.float64)
+    return np.where(np.isnan(sex), -1, sex).astype(np.int8)
+
+
+def _make_tmp_dir(version_dir: Path) -> Path:
+    tmp_dir = version_dir.with_name(version_dir.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    return tmp_dir
+
+
+def _finish_store(tmp_dir: Path, version_dir: Path, covariates: Dict[str, np.ndarray], feature_columns: List[str],
+                  qc_columns: List[str], tiv_normalize: bool, inputs: Dict) -> Path:
+    """
+    Kovariaten, Blöcke und Manifest neben die schon geschriebene features.npy legen,
+    dann das temporäre Verzeichnis an die Stelle der Version setzen
+    """
+    diagnosis_codes, diagnosis_categories = _encode_categories(pd.Series(covariates['diagnosis'], dtype=object))
+    dataset_codes, dataset_categories = _encode_categories(pd.Series(covariates['dataset'], dtype=object))
+
+    np.save(tmp_dir / 'subject_ids.npy', covariates['subject_ids'].astype(str))
+    np.save(tmp_dir / 'age.npy', covariates['age'].astype(np.float32))
+    np.save(tmp_dir / 'sex.npy', covariates['sex'].astype(np.int8))
+    np.save(tmp_dir / 'diagnosis.npy', diagnosis_codes)
+    np.save(tmp_dir / 'dataset.npy', dataset_codes)
+    np.save(tmp_dir / 'tiv.npy', covariates['tiv'].astype(np.float32))
+    np.save(tmp_dir / 'qc.npy', covariates['qc'].astype(np.float32))
+    np.savez(tmp_dir / 'blocks.npz', **feature_blocks(feature_columns))
+
+    manifest = {
+        'version': version_dir.name,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'n_subjects': int(len(covariates['subject_ids'])),
+        'n_features': len(feature_columns),
+        'feature_columns': feature_columns,
+        'qc_columns': qc_columns,
+        'diagnosis_categories': diagnosis_categories,
+        'dataset_categories': dataset_categories,
+        'tiv_normalized': tiv_normalize,
+        'inputs': inputs,
+    }
+    with open(tmp_dir / 'manifest.json', 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    if version_dir.exists():
+        shutil.rmtree(version_dir)
+    os.replace(tmp_dir, version_dir)
+    return version_dir
+
+
+@instrumented('features.write_feature_store', items='merged')
+def write_feature_store(merged: pd.DataFrame, version_dir: Path, tiv_normalize: bool,
+                        inputs: Dict) -> Path:
+    """
+    Schreibt Features (float32 .npy), Kovariaten und Manifest.
+    Es wird zuerst in ein temporäres Verzeichnis geschrieben und dann umbenannt,
+    damit abgebrochene Läufe keinen halben Store hinterlassen.
+    """
+    feature_columns = _feature_columns(merged)
+    features, tiv = _feature_values(merged, feature_columns, tiv_normalize)
+
+    tmp_dir = _make_tmp_dir(version_dir)
+    out = np.lib.format.open_memmap(tmp_dir / 'features.npy', mode='w+', dtype=np.float32,
+                                    shape=features.shape)
+    out[:] = features
+    out.flush()
+    del out
+
+    qc_columns = [c for c in QC_COLUMNS if c in merged.columns]
+    covariates = {
+        'subject_ids': merged['subject_id'].to_numpy(dtype=str),
+        'age': merged['Age'].to_numpy(dtype=np.float64),
+        'sex': _sex_codes(merged['Sex_int']),
+        'diagnosis': merged['Diagnosis'].to_numpy(dtype=object),
+        'dataset': merged['Dataset'].to_numpy(dtype=object),
+        'tiv': tiv,
+        'qc': merged[qc_columns].to_numpy(dtype=np.float64) if qc_columns else np.empty((len(merged), 0)),
+    }
+    return _finish_store(tmp_dir, version_dir, covariates, feature_columns, qc_columns, tiv_normalize, inputs)
+
+
+def find_incremental_base(store_path: Path, base_key: str, metadata_store: MetadataStore) -> Optional[Tuple[Path, str]]:
+    """
+    Jüngste Store-Version mit denselben Ergebnissen/QC/Parametern, die aus einer (anderen)
+    Version des Metadaten-Stores gebaut wurde -> (Verzeichnis, Metadaten-Version)
+    """
+    known = set(metadata_store.versions())
+    candidates = []
+    for manifest_file in Path(store_path).glob('*/manifest.json'):
+        if manifest_file.parent.name.endswith('.tmp'):
+            continue
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        inputs = manifest.get('inputs', {})
+        if inputs.get('base_key') == base_key and inputs.get('metadata_version') in known:
+            candidates.append((manifest['created'], str(manifest_file.parent), inputs['metadata_version']))
+    if not candidates:
+        return None
+    _, path, metadata_version = max(candidates)
+    return Path(path), metadata_version
+
+
+@instrumented('features.update_feature_store', items='merged_new')
+def update_feature_store(previous: 'FeatureStore', version_dir: Path, affected: set, merged_new: pd.DataFrame,
+                         tiv_normalize: bool, inputs: Dict) -> Path:
+    """
+    Neue Store-Version aus einer vorhandenen: Zeilen der betroffenen Subjects (affected) fallen weg,
+    merged_new (neu verbundene Zeilen dieser Subjects) kommt hinzu. Unveränderte Zeilen werden
+    blockweise aus dem alten Memmap kopiert, nur merged_new wird neu berechnet.
+    """
+    feature_columns = previous.feature_columns
+    qc_columns = previous.manifest['qc_columns']
+    new_features, new_tiv = _feature_values(merged_new, feature_columns, tiv_normalize)
+
+    keep = np.flatnonzero(~np.isin(previous.subject_ids, list(affected)))
+    subject_ids = np.concatenate([previous.subject_ids[keep], merged_new['subject_id'].to_numpy(dtype=str)])
+    order = np.argsort(subject_ids, kind='stable')  # wie sort_values('subject_id') beim vollen Build
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+
+    tmp_dir = _make_tmp_dir(version_dir)
+    out = np.lib.format.open_memmap(tmp_dir / 'features.npy', mode='w+', dtype=np.float32,
+                                    shape=(len(subject_ids), len(feature_columns)))
+    block = 4096
+    for start in range(0, len(keep), block):
+        stop = min(start + block, len(keep))
+        out[position[start:stop]] = previous.features[keep[start:stop]]
+    out[position[len(keep):]] = new_features
+    out.flush()
+    del out
+
+    def _decode(codes, categories):
+        return np.array(list(categories) + [None], dtype=object)[codes]
+
+    covariates = {
+        'subject_ids': subject_ids,
+        'age': np.concatenate([previous.age[keep], merged_new['Age'].to_numpy(dtype=np.float64)]),
+        'sex': np.concatenate([previous.sex[keep], _sex_codes(merged_new['Sex_int'])]),
+        'diagnosis': np.concatenate([_decode(previous.diagnosis[keep], previous.manifest['diagnosis_categories']),
+                                     merged_new['Diagnosis'].to_numpy(dtype=object)]),
+        'dataset': np.concatenate([_decode(previous.dataset[keep], previous.manifest['dataset_categories']),
+                                   merged_new['Dataset'].to_numpy(dtype=object)]),
+        'tiv': np.concatenate([previous.tiv[keep], new_tiv]),
+        'qc': np.concatenate([previous.qc[keep], merged_new.reindex(columns=qc_columns).to_numpy(dtype=np.float64)]),
+    }
+    covariates = {key: values[order] for key, values in covariates.items()}
+    return _finish_store(tmp_dir, version_dir, covariates, feature_columns, qc_columns, tiv_normalize, inputs)
+
+
+def _incremental_update(result_files: List[Path], metadata_path: Path, qc_path: Optional[Path],
+                        store_path: Path, version_dir: Path, tiv_normalize: bool, inputs: Dict) -> Optional[Path]:
+    """
+    Nur Metadaten-Snapshot geändert: betroffene Subjects aus MetadataStore.diff neu verbinden.
+    None, wenn keine passende Vorversion existiert (dann voller Build).
+    """
+    metadata_store = MetadataStore(metadata_path)
+    base = find_incremental_base(store_path, inputs['base_key'], metadata_store)
+    if base is None:
+        return None
+    previous_dir, previous_version = base
+    previous = FeatureStore(previous_dir)
+
+    changes = metadata_store.diff(previous_version, inputs['metadata_version'])
+    affected = set(normalize_subject_id(changes['Filename']))
+    print(f"Metadaten {previous_version} -> {inputs['metadata_version']}: "
+          f"{changes['status'].value_counts().to_dict() if len(changes) else 'keine Zeilen'} geändert, "
+          f"{len(affected)} Subjects werden neu verbunden (Basis: {previous_dir.name})")
+
+    # alle Metadaten-Zeilen dieser Subjects (auch unveränderte Duplikate) und ihre Ergebnis-CSVs
+    index = metadata_store.index(inputs['metadata_version'])
+    in_affected = normalize_subject_id(index['Filename']).isin(affected).to_numpy()
+    metadata = metadata_store.lookup(index.loc[in_affected, 'Filename'], inputs['metadata_version'])
+    folder_ids = normalize_subject_id(pd.Series([p.parent.name for p in result_files], dtype=str))
+    files = [p for p, i in zip(result_files, folder_ids) if i in affected]
+    results = aggregate_subject_results(files) if files else pd.DataFrame()
+
+    if results.empty or metadata.empty:
+        merged_new = pd.DataFrame(columns=['subject_id', 'Age', 'Sex_int', 'Diagnosis', 'Dataset'])
+    else:
+        qc = pd.read_csv(qc_path) if qc_path else None
+        merged_new = join_results_metadata_qc(results, metadata, qc)
+    unknown = [c for c in _feature_columns(merged_new) if c not in set(previous.feature_columns)]
+    if unknown:
+        print(f"⚠️  {len(unknown)} neue Feature-Spalten (z.B. {unknown[0]}) - voller Neubau")
+        return None
+    return update_feature_store(previous, version_dir, affected, merged_new, tiv_normalize, inputs)
+
+
+@instrumented('features.build_feature_store')
+def build_feature_store(output_root: Path = DATA_OUTPUT_ROOT, metadata_path: Path = METADATA_PATH,
+                        qc_path: Optional[Path] = QC_PATH, store_path: Path = FEATURE_STORE_PATH,
+                        tiv_normalize: bool = True, force: bool = False) -> Path:
+    """
+    Baut den Feature-Store - oder gibt die vorhandene Version zurück, wenn sich
+    weder Ergebnisse, Metadaten, QC noch Parameter geändert haben
+    """
+    result_files = find_result_files(output_root)
+    print(f"Gefundene Ergebnis-CSVs: {len(result_files)}")
+    if not result_files:
+        raise FileNotFoundError(f"Keine *_cat12_results.csv in {output_root}")
+
+    if qc_path is not None and not Path(qc_path).exists():
+        print(f"Warnung: QC-Tabelle nicht gefunden: {qc_path} - QC-Spalten bleiben leer")
+        qc_path = None
+
+    version = compute_store_version(result_files, metadata_path, qc_path, tiv_normalize)
+    version_dir = Path(store_path) / version
+
+    if not force and (version_dir / 'manifest.json').exists():
+        print(f"✓ Feature-Store aktuell: {version_dir}")
+    else:
+        inputs = {'output_root': str(output_root), 'metadata': str(metadata_path),
+                  'qc': str(qc_path) if qc_path else None, 'n_result_files': len(result_files),
+                  'base_key': compute_base_key(result_files, qc_path, tiv_normalize),
+                  'metadata_version': MetadataStore(metadata_path).latest if Path(metadata_path).is_dir() else None}
+        updated = None
+        if not force and inputs['metadata_version'] is not None:
+            updated = _incremental_update(result_files, metadata_path, qc_path, store_path, version_dir,
+                                          tiv_normalize, inputs)
+        if updated is not None:
+            print(f"✓ {len(FeatureStore(updated))} Subjects gespeichert (inkrementell): {version_dir}")
+        else:
+            print(f"Baue Feature-Store {version}...")
+            results = aggregate_subject_results(result_files)
+            metadata = read_metadata(metadata_path)
+            qc = pd.read_csv(qc_path) if qc_path else None
+            merged = join_results_metadata_qc(results, metadata, qc)
+            write_feature_store(merged, version_dir, tiv_normalize, inputs)
+            print(f"✓ {len(merged)} Subjects gespeichert: {version_dir}")
+
+    with open(Path(store_path) / 'LATEST', 'w') as f:
+        f.write(version)
+    return version_dir
+
+
+class FeatureStore:
+    """
+    Lesezugriff auf eine Store-Version. Die Feature-Matrix ist ein read-only Memmap,
+    die Kovariaten sind kleine Arrays in derselben Zeilenreihenfolge.
+    """
+
+    def __init__(self, version_dir: Path):
+        self.path = Path(version_dir)
+        with open(self.path / 'manifest.json') as f:
+            self.manifest = json.load(f)
+        self.features = np.load(self.path / 'features.npy', mmap_mode='r')
+        self.subject_ids = np.load(self.path / 'subject_ids.npy')
+        self.age = np.load(self.path / 'age.npy')
+        self.sex = np.load(self.path / 'sex.npy')
+        self.diagnosis = np.load(self.path / 'diagnosis.npy')
+        self.dataset = np.load(self.path / 'dataset.npy')
+        self.tiv = np.load(self.path / 'tiv.npy')
+        self.qc = np.load(self.path / 'qc.npy')
+        with np.load(self.path / 'blocks.npz') as blocks:
+            self.blocks = {key: blocks[key] for key in blocks.files}
+
+    @property
+    def feature_columns(self) -> List[str]:
+        return self.manifest['feature_columns']
+
+    def __len__(self) -> int:
+        return self.features.shape[0]
+
+    def columns(self, atlas: Optional[str] = None, measure: Optional[str] = None) -> np.ndarray:
+        """Spaltenindizes für einen Atlas und/oder eine Messung (z.B. atlas='DK40', measure='T')"""
+        if atlas and measure:
+            key = f"{measure}_{atlas}"
+        elif atlas:
+            key = f"atlas:{atlas}"
+        elif measure:
+            key = f"measure:{measure}"
+        else:
+            return np.arange(self.features.shape[1], dtype=np.int32)
+        return self.blocks.get(key, np.empty(0, dtype=np.int32))
+
+    def mask(self, diagnosis: Optional[List[str]] = None, dataset: Optional[List[str]] = None) -> np.ndarray:
+        """Bool-Maske über die Zeilen, z.B. mask(diagnosis=['HC'])"""
+        keep = np.ones(len(self), dtype=bool)
+        if diagnosis is not None:
+            codes = [self.manifest['diagnosis_categories'].index(d) for d in diagnosis
+                     if d in self.manifest['diagnosis_categories']]
+            keep &= np.isin(self.diagnosis, codes)
+        if dataset is not None:
+            codes = [self.manifest['dataset_categories'].index(d) for d in dataset
+                     if d in self.manifest['dataset_categories']]
+            keep &= np.isin(self.dataset, codes)
+        return keep
+
+    def to_frame(self, columns: Optional[np.ndarray] = None, rows: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Teilmatrix als DataFrame (nur für kleinere Auswahlen gedacht)"""
+        columns = np.arange(self.features.shape[1]) if columns is None else columns
+        rows = np.arange(len(self)) if rows is None else rows
+        data = self.features[rows][:, columns]
+        names = [self.feature_columns[i] for i in columns]
+        return pd.DataFrame(data, columns=names, index=self.subject_ids[rows])
+
+
+def load_feature_store(store_path: Path = FEATURE_STORE_PATH, version: Optional[str] = None) -> FeatureStore:
+    """Lädt die angegebene (oder die zuletzt gebaute) Version"""
+    store_path = Path(store_path)
+    if version is None:
+        version = (store_path / 'LATEST').read_text().strip()
+    return FeatureStore(store_path / version)
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+def main(argv: Optional[List[str]] = None):
+    """Kommandozeile (auch über cat12.py aggregate)"""
+    parser = argparse.ArgumentParser(description="Baut den Feature-Store für das normative Modell")
+    parser.add_argument('--output-root', type=Path, default=DATA_OUTPUT_ROOT)
+    parser.add_argument('--metadata', type=Path, default=METADATA_PATH)
+    parser.add_argument('--qc', type=Path, default=QC_PATH)
+    parser.add_argument('--store', type=Path, default=FEATURE_STORE_PATH)
+    parser.add_argument('--no-tiv', action='store_true', help="Volumina nicht durch TIV teilen")
+    parser.add_argument('--force', action='store_true', help="Cache ignorieren und neu bauen")
+    args = parser.parse_args(argv)
+
+    print("=" * 80)
+    print("FEATURE-STORE FÜR DAS NORMATIVE MODELL")
+    print("=" * 80)
+    version_dir = build_feature_store(args.output_root, args.metadata, args.qc, args.store,
+                                      tiv_normalize=not args.no_tiv, force=args.force)
+
+    store = FeatureStore(version_dir)
+    print(f"\nSubjects: {len(store)}, Features: {store.features.shape[1]}")
+    print("Blöcke (Messung_Atlas):")
+    for key, idx in sorted(store.blocks.items()):
+        if ':' not in key:
+            print(f"  {key}: {len(idx)} Spalten")
+
+
+if __name__ == "__main__":
+    main()
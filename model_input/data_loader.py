@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch-Loader für das Training des normativen Modells
+Liest den Feature-Store (build_feature_matrix.py) in zusammenhängenden Chunks über
+Memmaps, stratifiziert die Batches nach Dataset/Diagnose und lädt im Hintergrund vor.
+Es wird nie die ganze (gefilterte) Matrix in den Speicher kopiert.
+"""
+
+import queue
+import hashlib
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from build_feature_matrix import FeatureStore, load_feature_store
+
+#%% ========== KONFIGURATION ==========
+
+# Zeilen pro zusammenhängendem Lesezugriff auf den Memmap
+CHUNK_SIZE = 2048
+
+# Anzahl Chunks, die gemeinsam gemischt werden (Shuffle-Puffer)
+BUFFER_CHUNKS = 4
+
+# Maximale Anzahl vorgeladener Batches
+PREFETCH_BATCHES = 4
+
+#%% ========== FUNKTIONEN ==========
+
+def _as_row_index(store: FeatureStore, rows) -> np.ndarray:
+    """Bool-Maske oder Index-Array -> sortiertes int64 Index-Array"""
+    if rows is None:
+        return np.arange(len(store), dtype=np.int64)
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        return np.flatnonzero(rows)
+    return np.unique(rows.astype(np.int64))
+
+
+def _iter_row_chunks(rows: np.ndarray, chunk_size: int) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """
+    Teilt die (sortierten) Zeilen in Chunks fester Größe der Gesamtmatrix auf.
+    Liefert (start, stop, lokale Indizes) nur für Chunks, die ausgewählte Zeilen enthalten.
+    """
+    if len(rows) == 0:
+        return
+    chunk_ids = rows // chunk_size
+    boundaries = np.flatnonzero(np.diff(chunk_ids)) + 1
+    for part in np.split(rows, boundaries):
+        start = int(part[0] // chunk_size) * chunk_size
+        yield start, start + chunk_size, part - start
+
+
+def compute_normalization_stats(store: FeatureStore, rows=None, columns: Optional[np.ndarray] = None,
+                                chunk_size: int = CHUNK_SIZE, use_cache: bool = True) -> Dict[str, np.ndarray]:
+    """
+    Mittelwert/Standardabweichung pro Feature über die gewählten Zeilen (z.B. nur HC).
+    Wird einmal berechnet und als norm_stats_<hash>.npz neben dem Store abgelegt.
+    """
+    rows = _as_row_index(store, rows)
+    columns = np.arange(store.features.shape[1]) if columns is None else np.asarray(columns)
+
+    # 'v2': Caches der alten Summenformel (NaN-Mittelwert bei leeren Features) nicht wiederverwenden
+    key = hashlib.sha1(b'v2' + rows.tobytes() + np.asarray(columns, dtype=np.int64).tobytes()).hexdigest()[:12]
+    cache_file = store.path / f"norm_stats_{key}.npz"
+    if use_cache and cache_file.exists():
+        with np.load(cache_file) as cached:
+            return {name: cached[name] for name in cached.files}
+
+    mean = np.zeros(len(columns))
+    m2 = np.zeros(len(columns))  # Summe der quadrierten Abweichungen vom Mittelwert
+    count = np.zeros(len(columns))
+
+    # Chunk-Mittelwert und -Abweichungen, dann paarweise kombiniert (Chan et al.):
+    # numerisch stabil auch bei großen Mittelwerten im Verhältnis zur Streuung
+    for start, stop, local in _iter_row_chunks(rows, chunk_size):
+        block = np.asarray(store.features[start:stop], dtype=np.float64)[local][:, columns]
+        valid = ~np.isnan(block)
+        n_block = valid.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_block = np.where(n_block > 0, np.where(valid, block, 0.0).sum(axis=0) / n_block, 0.0)
+        m2_block = (np.where(valid, block - mean_block, 0.0) ** 2).sum(axis=0)
+
+        n_total = count + n_block
+        weight = np.divide(n_block, n_total, out=np.zeros_like(n_total), where=n_total > 0)
+        delta = mean_block - mean
+        mean += delta * weight
+        m2 += m2_block + delta ** 2 * count * weight
+        count = n_total
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = m2 / count
+    mean[count == 0] = 0.0  # leere Features bleiben nach der Normierung 0 statt NaN
+    std = np.sqrt(np.clip(var, 0.0, None))
+    std[~(std > 0)] = 1.0  # konstante/leere Features nicht aufblasen
+
+    stats = {'mean': mean.astype(np.float32), 'std': std.astype(np.float32),
+             'count': count.astype(np.int64), 'columns': np.asarray(columns, dtype=np.int32)}
+    if use_cache:
+        np.savez(cache_file, **stats)
+    return stats
+
+
+def stratified_order(strata: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Reihenfolge, in der jede Schicht (Dataset x Diagnose) gleichmäßig über den Puffer
+    verteilt ist: Position innerhalb der Schicht (zufällig) / Größe der Schicht + Jitter
+    """
+    n = len(strata)
+    perm = rng.permutation(n)
+    _, inverse, counts = np.unique(strata[perm], return_inverse=True, return_counts=True)
+    # Rang jedes Elements innerhalb seiner Schicht (in permutierter Reihenfolge)
+    order = np.argsort(inverse, kind='stable')
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    position = (rank + rng.random(n)) / counts[inverse]
+    return perm[np.argsort(position, kind='stable')]
+
+
+class BatchLoader:
+    """
+    Iterator über Batches (x, rows) aus dem Feature-Store.
+
+    x    : float32 (batch_size x n_columns), optional normalisiert
+    rows : globale Zeilenindizes -> store.age[rows], store.sex[rows], ...
+
+    Beispiel (nur HC, DK40-Dicke):
+        store = load_feature_store()
+        loader = BatchLoader(store, rows=store.mask(diagnosis=['HC']),
+                             columns=store.columns(atlas='DK40', measure='T'))
+        for epoch in range(n_epochs):
+            for x, rows in loader:
+                ...
+    """
+
+    def __init__(self, store: FeatureStore, batch_size: int = 64, rows=None,
+                 columns: Optional[np.ndarray] = None, stratify: bool = True,
+                 shuffle: bool = True, normalize: bool = True, norm_stats: Optional[Dict] = None,
+                 chunk_size: int = CHUNK_SIZE, buffer_chunks: int = BUFFER_CHUNKS,
+                 prefetch: int = PREFETCH_BATCHES, drop_last: bool = False, seed: int = 0):
+        self.store = store
+        self.batch_size = batch_size
+        self.rows = _as_row_index(store, rows)
+        self.columns = np.arange(store.features.shape[1]) if columns is None else np.asarray(columns)
+        self.stratify = stratify
+        self.shuffle = shuffle
+        self.chunk_size = chunk_size
+        self.buffer_chunks = buffer_chunks
+        self.prefetch = prefetch
+        self.drop_last = drop_last
+        self.rng = np.random.default_rng(seed)
+
+        self.norm_stats = None
+        if normalize:
+            self.norm_stats = norm_stats or compute_normalization_stats(store, self.rows, self.columns, chunk_size)
+
+        # Schicht-Label pro Zeile: Dataset x Diagnose
+        n_diagnosis = len(store.manifest['diagnosis_categories']) + 1
+        self.strata = store.dataset.astype(np.int64) * n_diagnosis + (store.diagnosis.astype(np.int64) + 1)
+
+    def __len__(self) -> int:
+        n = len(self.rows)
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def _read_buffer(self, chunks) -> Tuple[np.ndarray, np.ndarray]:
+        """Liest mehrere Chunks zusammenhängend und gibt (x, globale Zeilen) zurück"""
+        blocks, rows = [], []
+        for start, stop, local in chunks:
+            block = np.asarray(self.store.features[start:stop])
+            blocks.append(block[local][:, self.columns])
+            rows.append(local + start)
+        x = np.concatenate(blocks).astype(np.float32, copy=False)
+        if self.norm_stats is not None:
+            x = (x - self.norm_stats['mean']) / self.norm_stats['std']
+        return x, np.concatenate(rows)
+
+    def _generate(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Erzeugt die Batches einer Epoche (läuft im Prefetch-Thread)"""
+        chunks = list(_iter_row_chunks(self.rows, self.chunk_size))
+        if self.shuffle:
+            chunks = [chunks[i] for i in self.rng.permutation(len(chunks))]
+
+        carry_x = np.empty((0, len(self.columns)), dtype=np.float32)
+        carry_rows = np.empty(0, dtype=np.int64)
+
+        for b in range(0, len(chunks), self.buffer_chunks):
+            x, rows = self._read_buffer(chunks[b:b + self.buffer_chunks])
+            if self.shuffle and self.stratify:
+                order = stratified_order(self.strata[rows], self.rng)
+            elif self.shuffle:
+                order = self.rng.permutation(len(rows))
+            else:
+                order = np.arange(len(rows))
+            x = np.concatenate([carry_x, x[order]])
+            rows = np.concatenate([carry_rows, rows[order]])
+
+            n_full = len(rows) // self.batch_size * self.batch_size
+            for i in range(0, n_full, self.batch_size):
+                yield x[i:i + self.batch_size], rows[i:i + self.batch_size]
+            carry_x, carry_rows = x[n_full:], rows[n_full:]
+
+        if len(carry_rows) and not self.drop_last:
+            yield carry_x, carry_rows
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Batches einer Epoche, vorgeladen in einem Hintergrund-Thread mit begrenzter Queue"""
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def _producer():
+            try:
+                for batch in self._generate():
+                    while not stop.is_set():
+                        try:
+                            batches.put(batch, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+                batches.put(done)
+            except Exception as e:  # an den Konsumenten weiterreichen
+                batches.put(e)
+
+        thread = threading.Thread(target=_producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join(timeout=1.0)
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    import time
+
+    store = load_feature_store()
+    hc_rows = store.mask(diagnosis=['HC'])
+    print(f"Feature-Store: {store.path} ({len(store)} Subjects, davon {hc_rows.sum()} HC)")
+
+    loader = BatchLoader(store, batch_size=64, rows=hc_rows)
+    start = time.perf_counter()
+    n_batches = sum(1 for _ in loader)
+    print(f"1 Epoche: {n_batches} Batches in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Massen-univariate Gruppenvergleiche über alle Features (ROI oder Vertex)
+Lineares Modell Feature ~ Gruppe + Kovariaten (Alter, Alter², Sex, Dataset) für alle
+Features gleichzeitig als Matrixoperation, optional auf Rängen. FWE-Kontrolle über
+Max-Statistik-Permutationen: Aufgaben (Feature-Block x Permutations-Serie) des float32-Memmaps
+werden parallel in Worker-Prozessen bearbeitet, jede Permutationsserie als ein Matrixprodukt.
+Auch bei wenigen Features (ROI, ein Block) werden so alle Kerne genutzt.
+"""
+
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from build_feature_matrix import FeatureStore, load_feature_store
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import normalize_subject_id
+
+#%% ========== KONFIGURATION ==========
+
+# Anzahl Permutationen für die FWE-korrigierten p-Werte
+N_PERMUTATIONS = 5000
+
+# Permutationen pro Matrixprodukt
+PERMUTATION_BATCH = 500
+
+# Features pro Worker-Aufgabe
+FEATURE_BLOCK = 4096
+
+# Obergrenze für Worker-Prozesse (geteilter Knoten) und Speicher aller Worker zusammen
+MAX_WORKERS = 16
+MEMORY_BUDGET_GB = 16
+
+N_WORKERS = min(os.cpu_count() or 1, MAX_WORKERS)
+
+#%% ========== FUNKTIONEN ==========
+
+def _residualize(y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """Residuen von y nach Regression auf z (alle Spalten gleichzeitig)"""
+    beta, *_ = np.linalg.lstsq(z, y, rcond=None)
+    return y - z @ beta
+
+
+def _permutations(n: int, seed: int, start: int, count: int) -> np.ndarray:
+    """
+    Deterministische Permutationen start..start+count - jede Permutation hat ihren eigenen
+    Seed, das Ergebnis hängt also nicht von Serien-Größe oder Worker-Anzahl ab
+    """
+    return np.stack([np.random.default_rng([seed, i]).permutation(n) for i in range(start, start + count)])
+
+
+def _block_statistics(features_path: str, rows: np.ndarray, columns: np.ndarray, x_res: np.ndarray,
+                      z: np.ndarray, rank: bool, perm_start: int, perm_count: int, batch_size: int, seed: int):
+    """
+    Worker: t-Werte eines Feature-Blocks und maximales |t| dieses Blocks für die Permutationen
+    perm_start..perm_start+perm_count. Permutiert wird der auf die Kovariaten residualisierte Gruppenvektor.
+    """
+    features = np.load(features_path, mmap_mode='r')
+    y = np.asarray(features[np.ix_(rows, columns)], dtype=np.float64)
+    incomplete = ~np.isfinite(y).all(axis=0)  # Features mit fehlenden Werten -> t = NaN
+    y[:, incomplete] = 0.0
+    if rank:
+        y = stats.rankdata(y, axis=0)
+    y = _residualize(y, z)
+
+    dof = len(rows) - z.shape[1] - 1
+    y_ss = (y ** 2).sum(axis=0)
+    x_ss = x_res @ x_res
+
+    def _t(xy):
+        beta = xy / x_ss
+        sse = np.clip(y_ss - beta * xy, 1e-12, None)
+        return beta / np.sqrt(sse / dof / x_ss)
+
+    t_obs = _t(x_res @ y)
+    t_obs[incomplete] = np.nan
+
+    max_null = np.empty(perm_count)
+    for offset in range(0, perm_count, batch_size):
+        size = min(batch_size, perm_count - offset)
+        x_perm = x_res[_permutations(len(x_res), seed, perm_start + offset, size)]
+        max_null[offset:offset + size] = np.abs(_t(x_perm @ y)).max(axis=1)
+
+    return t_obs, max_null
+
+
+def _worker_limit(n_rows: int, block: int, batch_size: int, n_workers: int,
+                  budget_gb: float = MEMORY_BUDGET_GB) -> int:
+    """Worker-Anzahl, bei der alle Worker zusammen ungefähr im Speicherbudget bleiben"""
+    # y (float64, beim Ranken doppelt) + Permutations-Produkt + permutierte Gruppenvektoren
+    per_worker = 8 * (2 * n_rows * block + batch_size * block + batch_size * n_rows)
+    return max(1, min(n_workers, int(budget_gb * 1024 ** 3 // per_worker)))
+
+
+def group_difference_test(features_path: Path, rows: np.ndarray, group: np.ndarray,
+                          covariates: Optional[np.ndarray] = None, columns: Optional[np.ndarray] = None,
+                          rank: bool = False, n_permutations: int = N_PERMUTATIONS,
+                          batch_size: int = PERMUTATION_BATCH, block: int = FEATURE_BLOCK,
+                          n_workers: int = N_WORKERS, seed: int = 0) -> pd.DataFrame:
+    """
+    Zwei-Gruppen-Vergleich für alle Features eines (n x p) float32 .npy (wird als Memmap gelesen).
+
+    rows       : Zeilen der Matrix, die in den Vergleich eingehen
+    group      : 0/1 pro Zeile in rows (1 = Gruppe A)
+    covariates : (len(rows) x q) Störvariablen, Intercept wird ergänzt
+    rank       : Features vorher pro Spalte ranken (robust, ~ Mann-Whitney ohne Kovariaten)
+
+    Rückgabe: DataFrame mit t, p_unc (parametrisch), p_fwe (Max-t Permutation), cohens_d
+    """
+    features = np.load(features_path, mmap_mode='r')
+    rows = np.asarray(rows)
+    columns = np.arange(features.shape[1]) if columns is None else np.asarray(columns)
+    group = np.asarray(group, dtype=np.float64)
+
+    z = np.ones((len(rows), 1))
+    if covariates is not None and np.size(covariates):
+        z = np.hstack([z, np.asarray(covariates, dtype=np.float64)])
+    x_res = _residualize(group[:, None], z)[:, 0]
+    dof = len(rows) - z.shape[1] - 1
+
+    blocks = [columns[i:i + block] for i in range(0, len(columns), block)]
+    n_workers = _worker_limit(len(rows), min(block, len(columns)), batch_size, n_workers)
+
+    # Permutationen so auf Serien verteilen, dass es mindestens so viele Aufgaben wie Worker gibt
+    # (wenige Blöcke -> Permutationen aufteilen, viele Blöcke -> jeder Block alle Permutationen)
+    n_splits = max(1, min(math.ceil(n_workers / len(blocks)), n_permutations))
+    split_size = math.ceil(n_permutations / n_splits) if n_permutations else 0
+    splits = [(start, min(split_size, n_permutations - start)) for start in range(0, n_permutations, split_size or 1)]
+    splits = splits or [(0, 0)]
+
+    args = [(str(features_path), rows, b, x_res, z, rank, start, count, batch_size, seed)
+            for b in blocks for start, count in splits]
+    print(f"Gruppenvergleich: {int(group.sum())} vs {int(len(group) - group.sum())} Subjects, "
+          f"{len(columns)} Features in {len(blocks)} Blöcken, {n_permutations} Permutationen "
+          f"in {len(args)} Aufgaben ({n_workers} Worker)")
+
+    if n_workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_block_statistics, *zip(*args)))
+    else:
+        results = [_block_statistics(*a) for a in args]
+
+    # Aufgaben liegen blockweise hintereinander: t aus der ersten Serie jedes Blocks,
+    # Nullverteilung = Maximum über Blöcke, aneinandergehängt über Serien
+    per_block = [results[i:i + len(splits)] for i in range(0, len(results), len(splits))]
+    t_obs = np.concatenate([r[0][0] for r in per_block])
+    max_null = np.max([np.concatenate([r[1] for r in block_results]) for block_results in per_block], axis=0)
+
+    # FWE: Anteil der Permutationen, deren Maximum das beobachtete |t| erreicht
+    sorted_null = np.sort(max_null)
+    exceed = len(sorted_null) - np.searchsorted(sorted_null, np.abs(np.nan_to_num(t_obs)), side='left')
+    n_a, n_b = group.sum(), len(group) - group.sum()
+
+    return pd.DataFrame({
+        'column': columns,
+        't': t_obs,
+        'p_unc': 2 * stats.t.sf(np.abs(t_obs), dof),
+        'p_fwe': (exceed + 1) / (len(sorted_null) + 1),
+        'cohens_d': t_obs * np.sqrt(1 / n_a + 1 / n_b),
+    })
+
+
+def store_design(store: FeatureStore, by: str, group_a: str, group_b: str) -> Dict[str, np.ndarray]:
+    """
+    Zeilen, Gruppenvektor und Kovariaten (Alter, Alter², Sex, bei Diagnose-Vergleich
+    zusätzlich Dataset-Dummies) für einen Vergleich group_a vs group_b aus dem Feature-Store
+    """
+    in_a = store.mask(**{by: [group_a]})
+    in_b = store.mask(**{by: [group_b]})
+    rows = np.flatnonzero((in_a | in_b) & ~np.isnan(store.age) & (store.sex >= 0))
+    if not in_a.any() or not in_b.any():
+        raise ValueError(f"Gruppe ohne Subjects: {group_a}={in_a.sum()}, {group_b}={in_b.sum()}")
+
+    age = store.age[rows] - store.age[rows].mean()
+    covariates = [age, age ** 2, store.sex[rows].astype(np.float64)]
+    if by == 'diagnosis':
+        datasets = np.unique(store.dataset[rows])
+        covariates += [(store.dataset[rows] == d).astype(np.float64) for d in datasets[1:]]
+    return {'rows': rows, 'group': in_a[rows].astype(np.float64), 'covariates': np.column_stack(covariates)}
+
+
+def align_vertex_store(store: FeatureStore, vertex_dir: Path, design: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Überträgt ein Store-Design auf die Zeilen eines Vertex-Stores (resample_surfaces.py)"""
+    vertex_ids = normalize_subject_id(pd.Series(np.load(Path(vertex_dir) / 'subject_ids.npy'))).to_numpy()
+    position = {s: i for i, s in enumerate(vertex_ids)}
+    store_ids = store.subject_ids[design['rows']]
+    keep = np.array([s in position for s in store_ids])
+    print(f"{keep.sum()}/{len(keep)} Subjects im Vertex-Store gefunden")
+    return {'rows': np.array([position[s] for s in store_ids[keep]], dtype=np.int64),
+            'group': design['group'][keep], 'covariates': design['covariates'][keep]}
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Massen-univariater Gruppenvergleich mit Max-t Permutationen")
+    parser.add_argument('--by', choices=['diagnosis', 'dataset'], default='diagnosis')
+    parser.add_argument('--group-a', default='SCHZ')
+    parser.add_argument('--group-b', default='HC')
+    parser.add_argument('--atlas', default=None)
+    parser.add_argument('--measure', default=None)
+    parser.add_argument('--features', default='features.npy',
+                        help="Matrix im Store (z.B. combat_features.npy)")
+    parser.add_argument('--vertex-store', type=Path, default=None,
+                        help="Vertex-Store (resample_surfaces.py) statt ROI-Features")
+    parser.add_argument('--rank', action='store_true', help="rangbasiert statt linear")
+    parser.add_argument('--permutations', type=int, default=N_PERMUTATIONS)
+    parser.add_argument('--workers', type=int, default=N_WORKERS)
+    args = parser.parse_args()
+
+    store = load_feature_store()
+    design = store_design(store, args.by, args.group_a, args.group_b)
+
+    if args.vertex_store:
+        design = align_vertex_store(store, args.vertex_store, design)
+        features_path, columns, names = args.vertex_store / 'features.npy', None, None
+        out_dir = args.vertex_store
+    else:
+        features_path = store.path / args.features
+        columns = store.columns(atlas=args.atlas, measure=args.measure)
+        names = [store.feature_columns[c] for c in columns]
+        out_dir = store.path
+
+    result = group_difference_test(features_path, design['rows'], design['group'], design['covariates'],
+                                   columns=columns, rank=args.rank, n_permutations=args.permutations,
+                                   n_workers=args.workers)
+    if names is not None:
+        result.insert(1, 'feature', names)
+
+    out_file = out_dir / f"groupdiff_{args.group_a}_vs_{args.group_b}{'_rank' if args.rank else ''}.csv"
+    result.to_csv(out_file, index=False)
+    print(f"{(result['p_fwe'] < 0.05).sum()} Features mit p_FWE < 0.05")
+    print(f"✓ Ergebnisse gespeichert: {out_file}")
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Site-Harmonisierung (ComBat, empirical Bayes) für alle ROI-Features gleichzeitig
+Location/Scale-Effekte pro Dataset werden mit Alter/Geschlecht (und Diagnose als
+geschützter Kovariate) für alle Features in einem Schritt als Matrixoperation geschätzt.
+Die gefitteten Parameter werden gespeichert - neue Subjects eines bekannten Datasets
+werden ohne Refit in O(Features) harmonisiert.
+"""
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from build_feature_matrix import FeatureStore, load_feature_store
+
+#%% ========== KONFIGURATION ==========
+
+# Konvergenzkriterium der EB-Iteration
+EB_TOLERANCE = 1e-4
+EB_MAX_ITER = 1000
+
+# Zeilen pro Block beim Schreiben der harmonisierten Matrix
+BLOCK_ROWS = 2048
+
+#%% ========== FUNKTIONEN ==========
+
+def build_covariates(age: np.ndarray, sex: np.ndarray, age_center: float,
+                     diagnosis: Optional[np.ndarray] = None,
+                     diagnosis_levels: Optional[List[int]] = None) -> np.ndarray:
+    """
+    Kovariaten-Matrix: Alter (zentriert), Alter², Geschlecht und optional
+    Diagnose-Dummies (Referenz = erste Stufe), damit Krankheitseffekte erhalten bleiben
+    """
+    age_c = np.asarray(age, dtype=np.float64) - age_center
+    columns = [age_c, age_c ** 2, np.asarray(sex, dtype=np.float64)]
+    if diagnosis is not None and diagnosis_levels:
+        for level in diagnosis_levels[1:]:
+            columns.append((np.asarray(diagnosis) == level).astype(np.float64))
+    return np.column_stack(columns)
+
+
+def _site_indicator(sites: np.ndarray, site_levels: np.ndarray) -> np.ndarray:
+    """One-hot Matrix (n x k); unbekannte Sites -> Fehler"""
+    index = np.searchsorted(site_levels, sites)
+    index = np.clip(index, 0, len(site_levels) - 1)
+    unknown = site_levels[index] != sites
+    if unknown.any():
+        raise ValueError(f"Unbekannte Sites (Refit nötig): {sorted(set(np.asarray(sites)[unknown].tolist()))}")
+    indicator = np.zeros((len(sites), len(site_levels)))
+    indicator[np.arange(len(sites)), index] = 1.0
+    return indicator
+
+
+def _eb_site_estimates(s_data: np.ndarray, indicator: np.ndarray, gamma_hat: np.ndarray,
+                       delta_hat: np.ndarray):
+    """
+    Empirical-Bayes Shrinkage von gamma/delta: parametrische Priors pro Site,
+    Fixpunkt-Iteration gleichzeitig für alle Features
+    """
+    gamma_bar = gamma_hat.mean(axis=1, keepdims=True)
+    tau2 = gamma_hat.var(axis=1, ddof=1, keepdims=True)
+    m = delta_hat.mean(axis=1, keepdims=True)
+    s2 = delta_hat.var(axis=1, ddof=1, keepdims=True)
+    a_prior = (2 * s2 + m ** 2) / s2
+    b_prior = (m * s2 + m ** 3) / s2
+
+    gamma_star = np.empty_like(gamma_hat)
+    delta_star = np.empty_like(delta_hat)
+    for k in range(indicator.shape[1]):
+        site_data = s_data[indicator[:, k] == 1]
+        n = site_data.shape[0]
+        g_old, d_old = gamma_hat[k], delta_hat[k]
+        for _ in range(EB_MAX_ITER):
+            g_new = (tau2[k] * n * gamma_hat[k] + d_old * gamma_bar[k]) / (tau2[k] * n + d_old)
+            sum2 = ((site_data - g_new) ** 2).sum(axis=0)
+            d_new = (0.5 * sum2 + b_prior[k]) / (n / 2.0 + a_prior[k] - 1.0)
+            change = max(np.max(np.abs(g_new - g_old) / np.maximum(np.abs(g_old), 1e-12)),
+                         np.max(np.abs(d_new - d_old) / np.maximum(d_old, 1e-12)))
+            g_old, d_old = g_new, d_new
+            if change < EB_TOLERANCE:
+                break
+        gamma_star[k], delta_star[k] = g_old, d_old
+    return gamma_star, delta_star
+
+
+def fit_combat(y: np.ndarray, sites: np.ndarray, covariates: np.ndarray, eb: bool = True) -> Dict:
+    """
+    ComBat-Fit über alle Features gleichzeitig.
+
+    y          : (n x f) Features
+    sites      : (n,) Site-Label (z.B. Dataset-Codes)
+    covariates : (n x q) zu erhaltende Kovariaten (build_covariates)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    sites = np.asarray(sites)
+    site_levels = np.unique(sites)
+    indicator = _site_indicator(sites, site_levels)
+    n_per_site = indicator.sum(axis=0)
+    if len(site_levels) < 2:
+        raise ValueError("Harmonisierung benötigt mindestens 2 Sites")
+    if (n_per_site < 2).any():
+        raise ValueError(f"Sites mit < 2 Subjects: {site_levels[n_per_site < 2].tolist()}")
+
+    # Ein lstsq für alle Features: [Site-Indikatoren | Kovariaten] -> Koeffizienten (p x f)
+    design = np.hstack([indicator, covariates])
+    beta, *_ = np.linalg.lstsq(design, y, rcond=None)
+    n_sites = len(site_levels)
+
+    grand_mean = (n_per_site / n_per_site.sum()) @ beta[:n_sites]
+    residuals = y - design @ beta
+    var_pooled = (residuals ** 2).mean(axis=0)
+    var_pooled[var_pooled == 0] = np.median(var_pooled[var_pooled > 0]) if (var_pooled > 0).any() else 1.0
+
+    stand_mean = grand_mean + covariates @ beta[n_sites:]
+    s_data = (y - stand_mean) / np.sqrt(var_pooled)
+
+    # Site-Effekte auf standardisierten Daten: Mittelwert & Varianz pro Site (k x f)
+    gamma_hat = (indicator.T @ s_data) / n_per_site[:, None]
+    delta_hat = np.vstack([s_data[indicator[:, k] == 1].var(axis=0, ddof=1) for k in range(n_sites)])
+
+    if eb and y.shape[1] < 2:
+        print("⚠️  Nur 1 Feature - EB-Priors nicht schätzbar, verwende L/S-Schätzer ohne Shrinkage")
+        eb = False
+    if eb:
+        gamma_star, delta_star = _eb_site_estimates(s_data, indicator, gamma_hat, delta_hat)
+    else:
+        gamma_star, delta_star = gamma_hat, delta_hat
+
+    return {
+        'site_levels': site_levels,
+        'n_per_site': n_per_site,
+        'grand_mean': grand_mean,
+        'var_pooled': var_pooled,
+        'beta_covariates': beta[n_sites:],
+        'gamma_star': gamma_star,
+        'delta_star': delta_star,
+    }
+
+
+def apply_combat(params: Dict, y: np.ndarray, sites: np.ndarray, covariates: np.ndarray) -> np.ndarray:
+    """
+    Harmonisiert (neue) Subjects mit gespeicherten Parametern - kein Refit,
+    pro Subject nur elementweise Operationen über die Features
+    """
+    y = np.asarray(y, dtype=np.float64)
+    indicator = _site_indicator(np.asarray(sites), params['site_levels'])
+    site_index = indicator.argmax(axis=1)
+
+    sd_pooled = np.sqrt(params['var_pooled'])
+    stand_mean = params['grand_mean'] + covariates @ params['beta_covariates']
+    s_data = (y - stand_mean) / sd_pooled
+    adjusted = (s_data - params['gamma_star'][site_index]) / np.sqrt(params['delta_star'][site_index])
+    return adjusted * sd_pooled + stand_mean
+
+
+def save_combat_params(params: Dict, path: Path, **extra):
+    """Parameter (+ z.B. age_center, Spalten) als .npz speichern"""
+    np.savez(path, **params, **extra)
+
+
+def load_combat_params(path: Path) -> Dict:
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def harmonize_feature_store(store: FeatureStore, columns: Optional[np.ndarray] = None,
+                            preserve_diagnosis: bool = True, name: str = 'combat') -> Path:
+    """
+    Fit über alle Subjects des Stores mit vollständigen Kovariaten (Site = Dataset),
+    speichert <name>_params.npz und schreibt <name>_features.npy (float32) in die Store-Version
+    """
+    columns = np.arange(store.features.shape[1]) if columns is None else np.asarray(columns)
+    y = np.asarray(store.features[:, columns], dtype=np.float64)
+
+    complete = (~np.isnan(store.age)) & (store.sex >= 0) & (store.dataset >= 0) & np.isfinite(y).all(axis=1)
+    if (~complete).any():
+        print(f"⚠️  {(~complete).sum()} Subjects mit fehlenden Werten werden nicht für den Fit verwendet")
+
+    age_center = float(np.mean(store.age[complete]))
+    diagnosis_levels = sorted(np.unique(store.diagnosis[complete]).tolist()) if preserve_diagnosis else None
+    diagnosis = store.diagnosis if preserve_diagnosis else None
+    covariates = build_covariates(store.age, store.sex, age_center, diagnosis, diagnosis_levels)
+
+    params = fit_combat(y[complete], store.dataset[complete], covariates[complete])
+    params_path = store.path / f"{name}_params.npz"
+    save_combat_params(params, params_path, age_center=np.float64(age_center), columns=columns,
+                       diagnosis_levels=np.asarray(diagnosis_levels or [], dtype=np.int64))
+    print(f"✓ ComBat-Parameter gespeichert: {params_path}")
+
+    out = np.lib.format.open_memmap(store.path / f"{name}_features.npy", mode='w+', dtype=np.float32,
+                                    shape=(len(store), len(columns)))
+    out[:] = np.nan
+    rows = np.flatnonzero(complete)
+    for start in range(0, len(rows), BLOCK_ROWS):
+        block = rows[start:start + BLOCK_ROWS]
+        out[block] = apply_combat(params, y[block], store.dataset[block], covariates[block])
+    out.flush()
+    return params_path
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ComBat-Harmonisierung des Feature-Stores über Datasets")
+    parser.add_argument('--atlas', default=None, help="nur Spalten dieses Atlas (z.B. Neurom)")
+    parser.add_argument('--measure', default=None, help="nur diese Messung (z.B. Vgm)")
+    parser.add_argument('--no-diagnosis', action='store_true', help="Diagnose nicht als Kovariate schützen")
+    args = parser.parse_args()
+
+    store = load_feature_store()
+    columns = store.columns(atlas=args.atlas, measure=args.measure)
+    print(f"Harmonisiere {len(columns)} Features über {len(store.manifest['dataset_categories'])} Datasets...")
+    harmonize_feature_store(store, columns, preserve_diagnosis=not args.no_diagnosis)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Normative Referenztabellen aus den HC des Feature-Stores
+Schätzt alters- und geschlechtsabhängigen Mittelwert/SD pro Feature (gleitendes,
+Gauss-gewichtetes Altersfenster auf einem festen Altersgitter) einmalig und speichert
+sie als kompakte Lookup-Tabelle. Neue Subjects werden per linearer Interpolation
+vektorisiert in z-Werte und Zentile übersetzt - ohne Neuberechnung über alle HC.
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from build_feature_matrix import FeatureStore, load_feature_store
+
+#%% ========== KONFIGURATION ==========
+
+# Altersgitter der Lookup-Tabelle (Jahre)
+AGE_GRID = np.arange(0.0, 101.0, 1.0)
+
+# Breite (SD) des Gauss-Fensters in Jahren
+AGE_BANDWIDTH = 5.0
+
+# Mindestens so viele (effektive) HC pro Gitterpunkt, sonst NaN
+MIN_EFFECTIVE_N = 20
+
+# Sex-Codes im Feature-Store (sex.npy, -1 = fehlend)
+SEX_CODES = (0, 1)
+
+REFERENCE_NAME = 'normative_reference.npz'
+
+#%% ========== FUNKTIONEN ==========
+
+def fit_normative_reference(age: np.ndarray, sex: np.ndarray, y: np.ndarray,
+                            age_grid: np.ndarray = AGE_GRID, bandwidth: float = AGE_BANDWIDTH,
+                            min_effective_n: float = MIN_EFFECTIVE_N) -> Dict[str, np.ndarray]:
+    """
+    Gewichteter Mittelwert/SD pro (Sex, Altersgitterpunkt, Feature).
+    Alle Features und Gitterpunkte gleichzeitig: Gewichtsmatrix W (Gitter x Subjects) @ Y.
+
+    Rückgabe: age_grid, mean/std (n_sex x n_grid x n_features), n_effective (n_sex x n_grid)
+    """
+    age = np.asarray(age, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    y0 = np.where(valid, y, 0.0)
+
+    n_grid, n_features = len(age_grid), y.shape[1]
+    mean = np.full((len(SEX_CODES), n_grid, n_features), np.nan)
+    std = np.full_like(mean, np.nan)
+    n_effective = np.zeros((len(SEX_CODES), n_grid))
+
+    for s, code in enumerate(SEX_CODES):
+        rows = (np.asarray(sex) == code) & ~np.isnan(age)
+        if not rows.any():
+            print(f"⚠️  Keine HC mit Sex={code} - Tabelle bleibt NaN")
+            continue
+        w = np.exp(-0.5 * ((age_grid[:, None] - age[rows][None, :]) / bandwidth) ** 2)
+        w_sum = w @ valid[rows]                                  # Gewichtssumme pro Feature
+        with np.errstate(divide='ignore', invalid='ignore'):
+            m = (w @ y0[rows]) / w_sum
+            m2 = (w @ (y0[rows] ** 2)) / w_sum
+            n_eff = w.sum(axis=1) ** 2 / (w ** 2).sum(axis=1)
+        sd = np.sqrt(np.clip(m2 - m ** 2, 0.0, None))
+        sparse = n_eff < min_effective_n
+        m[sparse], sd[sparse] = np.nan, np.nan
+        sd[sd == 0] = np.nan
+        mean[s], std[s], n_effective[s] = m, sd, n_eff
+
+    return {'age_grid': np.asarray(age_grid, dtype=np.float64), 'mean': mean.astype(np.float32),
+            'std': std.astype(np.float32), 'n_effective': n_effective,
+            'bandwidth': np.float64(bandwidth)}
+
+
+def score_subjects(reference: Dict[str, np.ndarray], y: np.ndarray, age: np.ndarray,
+                   sex: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    z-Werte und Zentile (0-100) für beliebig viele Subjects: Lookup der beiden
+    benachbarten Gitterpunkte (searchsorted) und lineare Interpolation.
+    Alter außerhalb des Gitters wird auf den Rand gesetzt, fehlendes Sex -> NaN.
+    """
+    grid = reference['age_grid']
+    age = np.clip(np.asarray(age, dtype=np.float64), grid[0], grid[-1])
+    sex = np.asarray(sex)
+
+    upper = np.clip(np.searchsorted(grid, age), 1, len(grid) - 1)
+    lower = upper - 1
+    frac = ((age - grid[lower]) / (grid[upper] - grid[lower]))[:, None]
+
+    sex_index = np.searchsorted(SEX_CODES, sex).clip(0, len(SEX_CODES) - 1)
+    known = np.isin(sex, SEX_CODES) & ~np.isnan(age)
+
+    mean = (1 - frac) * reference['mean'][sex_index, lower] + frac * reference['mean'][sex_index, upper]
+    std = (1 - frac) * reference['std'][sex_index, lower] + frac * reference['std'][sex_index, upper]
+    z = (np.asarray(y, dtype=np.float64) - mean) / std
+    z[~known] = np.nan
+    return {'z': z.astype(np.float32), 'centile': (100.0 * ndtr(z)).astype(np.float32)}
+
+
+def save_reference(reference: Dict[str, np.ndarray], path: Path, **extra):
+    np.savez_compressed(path, **reference, **extra)
+
+
+def load_reference(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def build_reference_from_store(store: FeatureStore, columns: Optional[np.ndarray] = None,
+                               feature_file: str = 'features.npy',
+                               hc_label: str = 'HC') -> Path:
+    """
+    Referenz aus den HC-Zeilen des Stores (optional harmonisierte Matrix, z.B.
+    combat_features.npy) -> <store>/normative_reference.npz
+    """
+    features = np.load(store.path / feature_file, mmap_mode='r')
+    columns = np.arange(features.shape[1]) if columns is None else np.asarray(columns)
+
+    # Spaltennamen: harmonisierte Matrizen enthalten nur die Spalten aus <name>_params.npz
+    store_columns = np.arange(len(store.feature_columns))
+    params_file = store.path / feature_file.replace('_features.npy', '_params.npz')
+    if feature_file != 'features.npy' and params_file.exists():
+        with np.load(params_file) as params:
+            store_columns = params['columns']
+    names = np.array([store.feature_columns[c] for c in store_columns[columns]])
+    hc = store.mask(diagnosis=[hc_label])
+    print(f"Normative Referenz aus {hc.sum()} HC, {len(columns)} Features ({feature_file})")
+
+    reference = fit_normative_reference(store.age[hc], store.sex[hc],
+                                        np.asarray(features[hc][:, columns]))
+    path = store.path / REFERENCE_NAME
+    save_reference(reference, path, columns=np.asarray(columns, dtype=np.int64),
+                   feature_names=names, feature_file=np.array(feature_file))
+    print(f"✓ Referenztabelle gespeichert: {path}")
+    return path
+
+
+def reference_outdated(store: FeatureStore, feature_file: str, path: Optional[Path] = None) -> Optional[str]:
+    """Grund für eine Neuberechnung (fehlt, andere Feature-Matrix, Matrix neuer) oder None"""
+    path = store.path / REFERENCE_NAME if path is None else Path(path)
+    if not path.exists():
+        return "keine Referenz vorhanden"
+    with np.load(path, allow_pickle=False) as data:
+        built_from = str(data['feature_file']) if 'feature_file' in data.files else None
+    if built_from != feature_file:
+        return f"Referenz aus {built_from}, angefordert {feature_file}"
+    if (store.path / feature_file).stat().st_mtime > path.stat().st_mtime:
+        return f"{feature_file} ist neuer als die Referenz"
+    return None
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normative Referenztabellen (HC) und z-Scoring")
+    parser.add_argument('--features', default='features.npy',
+                        help="Matrix im Store, z.B. combat_features.npy nach harmonization.py")
+    parser.add_argument('--rebuild', action='store_true', help="Referenz neu berechnen")
+    parser.add_argument('--output', type=Path, default=None,
+                        help="CSV mit z-Werten aller Nicht-HC Subjects")
+    args = parser.parse_args()
+
+    store = load_feature_store()
+    reference_path = store.path / REFERENCE_NAME
+    reason = 'rebuild' if args.rebuild else reference_outdated(store, args.features, reference_path)
+    if reason:
+        if not args.rebuild:
+            print(f"⚠️  Referenz wird neu berechnet: {reason}")
+        build_reference_from_store(store, feature_file=args.features)
+    reference = load_reference(reference_path)
+
+    columns = reference['columns']
+    features = np.load(store.path / str(reference['feature_file']), mmap_mode='r')
+    patients = ~store.mask(diagnosis=['HC'])
+
+    start = time.perf_counter()
+    scores = score_subjects(reference, np.asarray(features[patients][:, columns]),
+                            store.age[patients], store.sex[patients])
+    print(f"{patients.sum()} Subjects gescored in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.output:
+        df = pd.DataFrame(scores['z'], columns=reference['feature_names'])
+        df.insert(0, 'subject_id', store.subject_ids[patients])
+        df.to_csv(args.output, index=False)
+        print(f"✓ z-Werte gespeichert: {args.output}")
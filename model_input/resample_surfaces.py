@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Downsampling vertex-weiser Oberflächendaten (Dicke, Gyrifizierung) für das normative Modell
+1. Full-Resolution Store: alle Subjects auf dem CAT12-Template-Mesh (32k/164k) als
+   float32-Matrix (Subjects x Vertices, lh|rh) in einem .npy-Memmap
+2. Einmalig eine dünnbesetzte Interpolationsmatrix Template-Sphere -> fsaverage5/6 bauen und cachen
+3. Matrix blockweise mit einem Sparse-Dense-Produkt auf alle Subjects anwenden und
+   das Ergebnis neben den Full-Resolution Store schreiben
+"""
+
+import os
+import io
+import json
+import gzip
+import zlib
+import base64
+import hashlib
+import argparse
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+#%% ========== KONFIGURATION ==========
+
+# CAT12 Output (1 Ordner pro Subject)
+DATA_OUTPUT_ROOT = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/data_output")
+
+# Vertex-Stores liegen neben dem ROI-Feature-Store
+VERTEX_STORE_PATH = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/feature_store/vertex")
+
+# Cache für die Interpolationsmatrizen
+OPERATOR_CACHE_PATH = VERTEX_STORE_PATH / "operators"
+
+# Auf das Template-Mesh resamplete Subject-Daten (Output von CAT12 "Resample and Smooth Surface Data")
+SUBJECT_FILE_PATTERN = "surf/{hemi}.{measure}.resampled_{mesh}.{subject}.gii"
+
+CAT12_DIR = Path("/net/data.isilon/ag-cherrmann/stumrani/caton/spm12/toolbox/cat12")
+FSAVERAGE_DIR = Path(os.environ.get('SUBJECTS_DIR', '/opt/freesurfer/subjects'))
+
+# Quell-Meshes (CAT12 Templates)
+TEMPLATE_SPHERES = {
+    '32k': {hemi: CAT12_DIR / 'templates_surfaces_32k' / f'{hemi}.sphere.freesurfer.gii' for hemi in ('lh', 'rh')},
+    '164k': {hemi: CAT12_DIR / 'templates_surfaces' / f'{hemi}.sphere.freesurfer.gii' for hemi in ('lh', 'rh')},
+}
+
+# Ziel-Meshes (niedrigere Auflösung)
+TARGET_SPHERES = {
+    'fsaverage5': {hemi: FSAVERAGE_DIR / 'fsaverage5' / 'surf' / f'{hemi}.sphere' for hemi in ('lh', 'rh')},
+    'fsaverage6': {hemi: FSAVERAGE_DIR / 'fsaverage6' / 'surf' / f'{hemi}.sphere' for hemi in ('lh', 'rh')},
+}
+
+# Subjects pro Block beim Anwenden der Matrix
+BLOCK_ROWS = 256
+
+#%% ========== OBERFLÄCHEN LESEN ==========
+
+GIFTI_DTYPES = {'NIFTI_TYPE_FLOAT32': np.float32, 'NIFTI_TYPE_FLOAT64': np.float64,
+                'NIFTI_TYPE_INT32': np.int32, 'NIFTI_TYPE_UINT8': np.uint8}
+
+
+def read_gifti(path: Path) -> Dict[str, np.ndarray]:
+    """
+    Minimaler GIfTI-Reader: gibt {'pointset', 'triangle', 'data'} zurück (soweit vorhanden)
+    """
+    arrays = {}
+    for darray in ET.parse(path).getroot().iter('DataArray'):
+        dtype = np.dtype(GIFTI_DTYPES[darray.get('DataType')])
+        if darray.get('Endian', 'LittleEndian') == 'BigEndian':
+            dtype = dtype.newbyteorder('>')
+        dims = [int(darray.get(f'Dim{i}')) for i in range(int(darray.get('Dimensionality', 1)))]
+        text = (darray.find('Data').text or '').strip()
+        encoding = darray.get('Encoding')
+
+        if encoding == 'ASCII':
+            values = np.array(text.split(), dtype=dtype)
+        else:
+            raw = base64.b64decode(text)
+            if encoding == 'GZipBase64Binary':
+                raw = zlib.decompress(raw)
+            values = np.frombuffer(raw, dtype=dtype)
+        order = 'F' if darray.get('ArrayIndexingOrder') == 'ColumnMajorOrder' else 'C'
+        values = values.reshape(dims, order=order)
+
+        intent = darray.get('Intent', '')
+        key = 'pointset' if intent.endswith('POINTSET') else 'triangle' if intent.endswith('TRIANGLE') else 'data'
+        arrays.setdefault(key, values)
+    return arrays
+
+
+def _open(path: Path):
+    return gzip.open(path, 'rb') if str(path).endswith('.gz') else open(path, 'rb')
+
+
+def read_surface(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    """Mesh (Vertices, Faces) aus GIfTI oder FreeSurfer-Surface (lh.sphere etc.)"""
+    if str(path).endswith(('.gii', '.gii.gz')):
+        arrays = read_gifti(path)
+        return arrays['pointset'].astype(np.float64), arrays['triangle'].astype(np.int64)
+
+    with _open(path) as f:
+        magic = f.read(3)
+        if magic != b'\xff\xff\xfe':
+            raise ValueError(f"Kein FreeSurfer-Triangle-Surface: {path}")
+        f.readline()
+        f.readline()
+        n_vertices, n_faces = np.frombuffer(f.read(8), dtype='>i4')
+        vertices = np.frombuffer(f.read(n_vertices * 12), dtype='>f4').reshape(n_vertices, 3)
+        faces = np.frombuffer(f.read(n_faces * 12), dtype='>i4').reshape(n_faces, 3)
+    return vertices.astype(np.float64), faces.astype(np.int64)
+
+
+def read_surface_data(path: Path) -> np.ndarray:
+    """Vertex-Werte aus GIfTI oder FreeSurfer-Curv (lh.thickness.<SUBJECT>)"""
+    if str(path).endswith(('.gii', '.gii.gz')):
+        return read_gifti(path)['data'].ravel().astype(np.float32)
+
+    with _open(path) as f:
+        magic = f.read(3)
+        if magic != b'\xff\xff\xff':
+            raise ValueError(f"Kein FreeSurfer-Curv (new format): {path}")
+        n_vertices, _, n_values = np.frombuffer(f.read(12), dtype='>i4')
+        values = np.frombuffer(f.read(n_vertices * n_values * 4), dtype='>f4')
+    return values.astype(np.float32)
+
+
+def read_vertex_count(path: Path) -> int:
+    """Anzahl Vertices nur aus dem Header (GIfTI-Attribute bzw. Curv-Kopf), ohne die Daten zu dekodieren"""
+    if str(path).endswith(('.gii', '.gii.gz')):
+        with _open(path) as f:
+            for _, element in ET.iterparse(f, events=('start',)):
+                if element.tag == 'DataArray' and not element.get('Intent', '').endswith(('POINTSET', 'TRIANGLE')):
+                    return int(element.get('Dim0'))
+        raise ValueError(f"Keine Daten in {path}")
+
+    with _open(path) as f:
+        if f.read(3) != b'\xff\xff\xff':
+            raise ValueError(f"Kein FreeSurfer-Curv (new format): {path}")
+        return int(np.frombuffer(f.read(4), dtype='>i4')[0])
+
+
+#%% ========== INTERPOLATIONSMATRIX ==========
+
+def _unit_sphere(vertices: np.ndarray) -> np.ndarray:
+    centered = vertices - vertices.mean(axis=0)
+    return centered / np.linalg.norm(centered, axis=1, keepdims=True)
+
+
+def build_interpolation_matrix(source_vertices: np.ndarray, target_vertices: np.ndarray,
+                               method: str = 'average', k: int = 3) -> sparse.csr_matrix:
+    """
+    Dünnbesetzte Matrix (n_target x n_source), die Werte auf dem Quell-Sphere
+    auf den Ziel-Sphere abbildet.
+
+    method:
+        'average' : jeder Quell-Vertex wird seinem nächsten Ziel-Vertex zugeordnet und dort
+                    gemittelt (Downsampling ohne Aliasing); Ziel-Vertices ohne Zuordnung
+                    bekommen den nächsten Quell-Vertex
+        'nearest' : nächster Quell-Vertex
+        'idw'     : inverse Distanzgewichtung der k nächsten Quell-Vertices
+    """
+    source = _unit_sphere(source_vertices)
+    target = _unit_sphere(target_vertices)
+    n_source, n_target = len(source), len(target)
+
+    if method == 'average':
+        _, owner = cKDTree(target).query(source)
+        counts = np.bincount(owner, minlength=n_target).astype(np.float64)
+        rows, cols = owner, np.arange(n_source)
+        weights = 1.0 / counts[owner]
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            _, nearest = cKDTree(source).query(target[empty])
+            rows = np.concatenate([rows, empty])
+            cols = np.concatenate([cols, nearest])
+            weights = np.concatenate([weights, np.ones(len(empty))])
+    elif method == 'nearest':
+        _, nearest = cKDTree(source).query(target)
+        rows, cols, weights = np.arange(n_target), nearest, np.ones(n_target)
+    elif method == 'idw':
+        dist, nearest = cKDTree(source).query(target, k=k)
+        inv = 1.0 / np.maximum(dist, 1e-12)
+        inv /= inv.sum(axis=1, keepdims=True)
+        rows, cols, weights = np.repeat(np.arange(n_target), k), nearest.ravel(), inv.ravel()
+    else:
+        raise ValueError(f"Unbekannte Methode: {method}")
+
+    matrix = sparse.csr_matrix((weights, (rows, cols)), shape=(n_target, n_source), dtype=np.float32)
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def operator_cache_file(source_mesh: str, target_mesh: str, method: str = 'average',
+                        cache_path: Path = OPERATOR_CACHE_PATH) -> Path:
+    """Cache-Datei der Matrix, Schlüssel aus Methode und Inhalt der Mesh-Dateien"""
+    sources, targets = TEMPLATE_SPHERES[source_mesh], TARGET_SPHERES[target_mesh]
+    key_parts = [method] + [_file_hash(sources[h]) + _file_hash(targets[h]) for h in ('lh', 'rh')]
+    key = hashlib.sha1('_'.join(key_parts).encode()).hexdigest()[:12]
+    return Path(cache_path) / f"{source_mesh}_to_{target_mesh}_{method}_{key}.npz"
+
+
+def load_or_build_operator(source_mesh: str, target_mesh: str, method: str = 'average',
+                           cache_path: Path = OPERATOR_CACHE_PATH) -> sparse.csr_matrix:
+    """
+    Block-diagonale Matrix für lh|rh. Wird pro (Quelle, Ziel, Methode, Mesh-Dateien)
+    einmal gebaut und als .npz gecacht.
+    """
+    sources, targets = TEMPLATE_SPHERES[source_mesh], TARGET_SPHERES[target_mesh]
+    cache_file = operator_cache_file(source_mesh, target_mesh, method, cache_path)
+
+    if cache_file.exists():
+        return sparse.load_npz(cache_file).tocsr()
+
+    print(f"Baue Interpolationsmatrix {source_mesh} -> {target_mesh} ({method})...")
+    blocks = []
+    for hemi in ('lh', 'rh'):
+        source_vertices, _ = read_surface(sources[hemi])
+        target_vertices, _ = read_surface(targets[hemi])
+        blocks.append(build_interpolation_matrix(source_vertices, target_vertices, method))
+    operator = sparse.block_diag(blocks, format='csr', dtype=np.float32)
+
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    sparse.save_npz(cache_file, operator)
+    print(f"✓ Gespeichert: {cache_file} ({operator.shape[0]} x {operator.shape[1]}, nnz={operator.nnz})")
+    return operator
+
+
+#%% ========== STORES ==========
+
+def find_subjects(output_root: Path) -> List[str]:
+    """Subject-Ordner im CAT12 Output"""
+    with os.scandir(output_root) as entries:
+        return sorted(entry.name for entry in entries if entry.is_dir())
+
+
+def _truncate_rows(path: Path, n_rows: int):
+    """
+    .npy-Matrix auf die ersten n_rows Zeilen kürzen, ohne sie zu laden: Header mit neuer
+    Shape an Ort und Stelle schreiben und die Datei abschneiden (Fallback: blockweise kopieren)
+    """
+    array = np.load(path, mmap_mode='r')
+    shape, dtype, offset = (n_rows,) + array.shape[1:], array.dtype, array.offset
+    del array
+
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                  'fortran_order': False, 'shape': shape})
+    if header.tell() == offset:
+        with open(path, 'r+b') as f:
+            f.write(header.getvalue())
+            f.truncate(offset + int(np.prod(shape)) * dtype.itemsize)
+        return
+
+    source = np.load(path, mmap_mode='r')
+    tmp_path = path.with_name(path.stem + '.trunc.npy')
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+    for row in range(0, n_rows, BLOCK_ROWS):
+        out[row:row + BLOCK_ROWS] = source[row:row + BLOCK_ROWS]
+    out.flush()
+    del out, source
+    os.replace(tmp_path, path)
+
+
+def build_vertex_store(subjects: List[str], measure: str = 'thickness', mesh: str = '32k',
+                       output_root: Path = DATA_OUTPUT_ROOT, store_path: Path = VERTEX_STORE_PATH,
+                       force: bool = False) -> Path:
+    """
+    Schreibt alle Subjects (lh|rh auf dem Template-Mesh) in einen float32-Memmap.
+    Subjects ohne resamplete Dateien oder mit abweichender Vertexzahl werden ausgelassen.
+    Die Vertexzahlen kommen vorab aus den Datei-Headern, der Memmap wird direkt mit der
+    endgültigen Zeilenzahl angelegt. Geschrieben wird in temporäre Dateien, das Manifest
+    zuletzt - ein abgebrochener Lauf hinterlässt keinen halben Store neben einem alten Manifest.
+    """
+    store_dir = Path(store_path) / f"{measure}_{mesh}"
+    manifest_file = store_dir / 'manifest.json'
+
+    available = []
+    for subject in subjects:
+        paths = [Path(output_root) / subject / SUBJECT_FILE_PATTERN.format(hemi=h, measure=measure, mesh=mesh, subject=subject)
+                 for h in ('lh', 'rh')]
+        if all(p.exists() for p in paths):
+            available.append((subject, paths))
+    print(f"{len(available)}/{len(subjects)} Subjects mit {measure} auf {mesh}-Mesh")
+
+    if not force and manifest_file.exists():
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        # ausgelassene Subjects (Vertexzahl) stehen mit im Manifest, sonst nie ein Cache-Treffer
+        if sorted(manifest['subjects'] + manifest.get('skipped', [])) == sorted(s for s, _ in available):
+            print(f"✓ Vertex-Store aktuell: {store_dir}")
+            return store_dir
+
+    if not available:
+        raise FileNotFoundError(f"Keine {measure}-Dateien auf dem {mesh}-Mesh gefunden")
+
+    counts = [tuple(read_vertex_count(p) for p in paths) for _, paths in available]
+    n_lh, n_rh = counts[0]
+    selected, skipped = [], []
+    for (subject, paths), (lh_count, rh_count) in zip(available, counts):
+        if (lh_count, rh_count) == (n_lh, n_rh):
+            selected.append((subject, paths))
+        else:
+            print(f"⚠️  {subject}: Vertexzahl passt nicht ({lh_count}/{rh_count}) - ausgelassen")
+            skipped.append(subject)
+
+    store_dir.mkdir(parents=True, exist_ok=True)
+    if manifest_file.exists():
+        manifest_file.unlink()  # altes Manifest passt ab hier nicht mehr zum Store
+    tmp_features = store_dir / 'features.tmp.npy'
+    out = np.lib.format.open_memmap(tmp_features, mode='w+', dtype=np.float32,
+                                    shape=(len(selected), n_lh + n_rh))
+    kept = []
+    for subject, (lh_path, rh_path) in selected:
+        try:
+            lh, rh = read_surface_data(lh_path), read_surface_data(rh_path)
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"⚠️  {subject}: nicht lesbar ({e}) - ausgelassen")
+            skipped.append(subject)
+            continue
+        if len(lh) != n_lh or len(rh) != n_rh:  # Header und Daten widersprechen sich
+            print(f"⚠️  {subject}: Daten passen nicht zum Header ({len(lh)}/{len(rh)}) - ausgelassen")
+            skipped.append(subject)
+            continue
+        out[len(kept), :n_lh] = lh
+        out[len(kept), n_lh:] = rh
+        kept.append(subject)
+    out.flush()
+    del out
+
+    if len(kept) < len(selected):
+        _truncate_rows(tmp_features, len(kept))
+
+    np.save(store_dir / 'subject_ids.tmp.npy', np.array(kept, dtype=str))
+    os.replace(tmp_features, store_dir / 'features.npy')
+    os.replace(store_dir / 'subject_ids.tmp.npy', store_dir / 'subject_ids.npy')
+    manifest = {'measure': measure, 'mesh': mesh, 'n_vertices': {'lh': n_lh, 'rh': n_rh},
+                'subjects': kept, 'skipped': skipped, 'created': datetime.now().isoformat(timespec='seconds')}
+    with open(store_dir / 'manifest.tmp.json', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(store_dir / 'manifest.tmp.json', manifest_file)
+    print(f"✓ Vertex-Store geschrieben: {store_dir} ({len(kept)} x {n_lh + n_rh})")
+    return store_dir
+
+
+def _source_key(store_dir: Path, manifest: Dict) -> str:
+    """Stand des Full-Resolution Stores: Manifest-Zeitstempel plus Größe/mtime von features.npy"""
+    stat = (store_dir / 'features.npy').stat()
+    return f"{manifest['created']}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def resample_store(store_dir: Path, target_mesh: str, method: str = 'average',
+                   block_rows: int = BLOCK_ROWS, force: bool = False) -> Path:
+    """
+    Wendet die gecachte Interpolationsmatrix blockweise auf den Full-Resolution Store an
+    und schreibt <store>_<target>/features.npy daneben. Übersprungen, wenn das Ergebnis
+    schon aus demselben Store-Stand mit derselben Matrix stammt; geschrieben wird über
+    temporäre Dateien, das Manifest zuletzt.
+    """
+    store_dir = Path(store_dir)
+    with open(store_dir / 'manifest.json') as f:
+        manifest = json.load(f)
+
+    out_dir = store_dir.with_name(f"{store_dir.name}_{target_mesh}")
+    operator_file = operator_cache_file(manifest['mesh'], target_mesh, method)
+    out_manifest = out_dir / 'manifest.json'
+    source_key = _source_key(store_dir, manifest)
+    if not force and out_manifest.exists():
+        with open(out_manifest) as f:
+            previous = json.load(f)
+        if previous.get('source_key') == source_key and previous.get('operator') == operator_file.name:
+            print(f"✓ Resampling aktuell: {out_dir}")
+            return out_dir
+
+    operator = load_or_build_operator(manifest['mesh'], target_mesh, method)
+    features = np.load(store_dir / 'features.npy', mmap_mode='r')
+    if operator.shape[1] != features.shape[1]:
+        raise ValueError(f"Operator erwartet {operator.shape[1]} Vertices, Store hat {features.shape[1]}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if out_manifest.exists():
+        out_manifest.unlink()  # altes Manifest passt ab hier nicht mehr zum Ergebnis
+    tmp_features = out_dir / 'features.tmp.npy'
+    out = np.lib.format.open_memmap(tmp_features, mode='w+', dtype=np.float32,
+                                    shape=(features.shape[0], operator.shape[0]))
+
+    # ein Sparse-Dense-Produkt pro Block: (Ziel x Quelle) @ (Quelle x Subjects)
+    for start in range(0, features.shape[0], block_rows):
+        block = np.asarray(features[start:start + block_rows], dtype=np.float32)
+        out[start:start + len(block)] = (operator @ block.T).T
+    out.flush()
+    del out
+
+    np.save(out_dir / 'subject_ids.tmp.npy', np.load(store_dir / 'subject_ids.npy'))
+    os.replace(tmp_features, out_dir / 'features.npy')
+    os.replace(out_dir / 'subject_ids.tmp.npy', out_dir / 'subject_ids.npy')
+    # block-diagonal: Ziel-Zeilen mit Einträgen in den lh-Spalten gehören zu lh
+    n_lh = int((operator[:, :manifest['n_vertices']['lh']].getnnz(axis=1) > 0).sum())
+    resampled = dict(manifest, mesh=target_mesh, source_mesh=manifest['mesh'], method=method,
+                     n_vertices={'lh': n_lh, 'rh': int(operator.shape[0] - n_lh)},
+                     source_key=source_key, operator=operator_file.name,
+                     created=datetime.now().isoformat(timespec='seconds'))
+    with open(out_dir / 'manifest.tmp.json', 'w') as f:
+        json.dump(resampled, f)
+    os.replace(out_dir / 'manifest.tmp.json', out_manifest)
+    print(f"✓ Resampled: {out_dir} ({features.shape[0]} x {operator.shape[0]})")
+    return out_dir
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vertex-Daten auf niedrigere Mesh-Auflösung bringen")
+    parser.add_argument('--measure', default='thickness', help="thickness, gyrification, ...")
+    parser.add_argument('--mesh', default='32k', choices=sorted(TEMPLATE_SPHERES))
+    parser.add_argument('--target', default='fsaverage5', choices=sorted(TARGET_SPHERES))
+    parser.add_argument('--method', default='average', choices=['average', 'nearest', 'idw'])
+    parser.add_argument('--output-root', type=Path, default=DATA_OUTPUT_ROOT)
+    parser.add_argument('--force', action='store_true', help="Full-Resolution Store und Resampling neu bauen")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"SURFACE RESAMPLING: {args.measure} {args.mesh} -> {args.target}")
+    print("=" * 80)
+
+    subjects = find_subjects(args.output_root)
+    store_dir = build_vertex_store(subjects, args.measure, args.mesh, args.output_root, force=args.force)
+    resample_store(store_dir, args.target, args.method, force=args.force)
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paralleler, fortsetzbarer Download der T1-Scans (OpenNeuro ds004856, SALD)
+Ersetzt die while-read Schleifen in download_openNeuro.sh / download_sald.sh:
+- begrenzter Thread-Pool für Transfers, Retries mit exponentiellem Backoff
+- eine Listing-Anfrage pro Subject statt nacheinander probierter Kandidaten-Pfade
+- Größe / MD5 (ETag) werden beim Streamen geprüft
+- Dekomprimieren + NIfTI-Header-Prüfung in einem Prozess-Pool (Netz und CPU überlappen)
+- Zustand als JSONL im Zielordner -> abgebrochene Läufe machen dort weiter
+- Speicher-Backend austauschbar: S3 (anonym, optional eigener Endpoint) oder lokales Verzeichnis
+
+    python new_hc_data/downloader.py ds004856
+    python new_hc_data/downloader.py SALD --max-subjects 5
+    python new_hc_data/downloader.py SALD --backend local --source /tmp/fake_bucket --target /tmp/SALD
+    python new_hc_data/downloader.py SALD --endpoint-url http://localhost:9000   # z.B. MinIO
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import struct
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+#%% ========== KONFIGURATION ==========
+
+DATASETS = {
+    'ds004856': {
+        'bucket': 'openneuro.org',
+        'prefix': 'ds004856',
+        'target': Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/new_hc_data/ds004856"),
+        # in dieser Reihenfolge (erste vorhandene Datei wird geladen)
+        'candidates': ['{subject}/ses-wave1/anat/{subject}_ses-wave1_acq-MPRAGE_run-1_T1w.nii.gz',
+                       '{subject}/ses-wave1/anat/{subject}_ses-wave1_acq-MPRAGE_T1w.nii.gz',
+                       '{subject}/ses-wave1/anat/{subject}_ses-wave1_T1w.nii.gz',
+                       '{subject}/ses-wave1/anat/{subject}_ses-wave1_run-1_T1w.nii.gz'],
+        'listing': '{subject}/ses-wave1/anat/',
+        'name': '{subject}_ses1_1_T1w',  # kurze Namen wie RENAME_SHORT=true
+    },
+    'SALD': {
+        'bucket': 'fcp-indi',
+        'prefix': 'data/Projects/INDI/SALD/RawData_BIDS',
+        'target': Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/new_hc_data/SALD"),
+        'candidates': ['{subject}/anat/{subject}_T1w.nii.gz'],
+        'listing': '{subject}/anat/',
+        'name': '{subject}_T1w',
+    },
+}
+
+# gleichzeitige Transfers (Netz) und Prozesse (Dekomprimieren/Prüfen)
+N_TRANSFERS = 8
+N_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+
+RETRIES = 4
+BACKOFF_SECONDS = 1.0
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+STATE_FILE = 'download_state.jsonl'
+
+# true = .nii (30MB/Datei), false = .nii.gz (10MB/Datei)
+DECOMPRESS = False
+
+#%% ========== BACKENDS ==========
+
+class LocalBackend:
+    """Verzeichnis mit derselben Struktur wie der Bucket (Tests, gemountete Kopien)"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def list_subjects(self) -> List[str]:
+        with os.scandir(self.root) as it:
+            return sorted(e.name for e in it if e.is_dir() and e.name.startswith('sub-'))
+
+    def list_files(self, prefix: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        """key -> (Größe, ETag). Lokal ohne ETag (MD5 würde die Datei komplett lesen)."""
+        directory = self.root / prefix
+        if not directory.is_dir():
+            return {}
+        files = {}
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                files[f"{prefix.rstrip('/')}/{entry.name}"] = (entry.stat().st_size, None)
+        return files
+
+    def open(self, key: str):
+        return open(self.root / key, 'rb')
+
+
+class S3Backend:
+    """Anonymer S3-Zugriff (boto3 wird erst bei Verwendung importiert); endpoint_url für S3-kompatible Server"""
+
+    def __init__(self, bucket: str, prefix: str, endpoint_url: Optional[str] = None):
+        import boto3
+        from botocore import UNSIGNED
+        from botocore.config import Config
+        self.bucket, self.prefix = bucket, prefix.strip('/')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                                   config=Config(signature_version=UNSIGNED, max_pool_connections=N_TRANSFERS * 2,
+                                                 retries={'max_attempts': 1}))
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def list_subjects(self) -> List[str]:
+        subjects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(''), Delimiter='/'):
+            for common in page.get('CommonPrefixes', []):
+                name = common['Prefix'].rstrip('/').rsplit('/', 1)[-1]
+                if name.startswith('sub-'):
+                    subjects.append(name)
+        return sorted(subjects)
+
+    def list_files(self, prefix: str) -> Dict[str, Tuple[int, Optional[str]]]:
+        files = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        strip = len(self._key(''))
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for obj in page.get('Contents', []):
+                files[obj['Key'][strip:]] = (obj['Size'], obj['ETag'].strip('"'))
+        return files
+
+    def open(self, key: str):
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+
+def make_backend(dataset: Dict, backend: str, source: Optional[str] = None, endpoint_url: Optional[str] = None):
+    if backend == 'local':
+        if not source:
+            raise ValueError("--source (lokales Verzeichnis) fehlt")
+        return LocalBackend(source)
+    return S3Backend(dataset['bucket'], dataset['prefix'], endpoint_url)
+
+#%% ========== FUNKTIONEN ==========
+
+class DownloadError(Exception):
+    pass
+
+
+def read_state(state_path: Path) -> Dict[str, Dict]:
+    """Letzter Eintrag pro Subject aus der JSONL-Zustandsdatei"""
+    state = {}
+    if state_path.exists():
+        with open(state_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # abgeschnittene letzte Zeile nach Abbruch
+                state[record['subject']] = record
+    return state
+
+
+def find_t1(backend, dataset: Dict, subject: str) -> Optional[Tuple[str, int, Optional[str]]]:
+    """Eine Listing-Anfrage pro Subject, dann erster vorhandener Kandidat"""
+    files = backend.list_files(dataset['listing'].format(subject=subject))
+    for template in dataset['candidates']:
+        key = template.format(subject=subject)
+        if key in files:
+            return (key,) + files[key]
+    return None
+
+
+def _stream_to_file(backend, key: str, dest: Path, size: int, etag: Optional[str]):
+    """Streamt in eine .part-Datei, prüft Größe und (bei einfachem ETag) MD5, dann Umbenennen"""
+    tmp = dest.with_name(dest.name + '.part')
+    md5 = hashlib.md5()
+    written = 0
+    body = backend.open(key)
+    try:
+        with open(tmp, 'wb') as f:
+            while True:
+                chunk = body.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                md5.update(chunk)
+                written += len(chunk)
+    finally:
+        body.close()
+    if written != size:
+        tmp.unlink(missing_ok=True)
+        raise DownloadError(f"Größe {written} != {size}")
+    # Multipart-ETags ('...-N') sind keine MD5-Summe -> nur Größe prüfen
+    if etag and '-' not in etag and md5.hexdigest() != etag:
+        tmp.unlink(missing_ok=True)
+        raise DownloadError(f"MD5 {md5.hexdigest()} != ETag {etag}")
+    os.replace(tmp, dest)
+
+
+def download_subject(backend, dataset: Dict, subject: str, target: Path,
+                     retries: int = RETRIES, backoff: float = BACKOFF_SECONDS) -> Dict:
+    """Thread-Worker: T1 finden und laden, Retries mit exponentiellem Backoff + Jitter"""
+    record = {'subject': subject}
+    for attempt in range(retries + 1):
+        try:
+            found = find_t1(backend, dataset, subject)
+            if found is None:
+                return {**record, 'status': 'missing', 'error': 'kein T1w gefunden'}
+            key, size, etag = found
+            dest = target / (dataset['name'].format(subject=subject) + '.nii.gz')
+            _stream_to_file(backend, key, dest, size, etag)
+            return {**record, 'status': 'downloaded', 'key': key, 'file': str(dest), 'size': size,
+                    'etag': etag, 'attempts': attempt + 1}
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+    return {**record, 'status': 'failed', 'error': error, 'attempts': retries + 1}
+
+
+# NIfTI datatype -> Bits pro Voxel
+NIFTI_BITPIX = {2: 8, 4: 16, 8: 32, 16: 32, 64: 64, 256: 8, 512: 16, 768: 32, 1024: 64, 1280: 64, 128: 24}
+
+
+def check_nifti_header(header: bytes) -> Dict:
+    """NIfTI-1 Header prüfen (Größe, Magic, Dimensionen, Datentyp); Rückgabe: Shape, Datentyp, vox_offset"""
+    if len(header) < 348:
+        raise ValueError("Header kürzer als 348 Bytes")
+    for endian in '<>':
+        if struct.unpack(endian + 'i', header[:4])[0] == 348:
+            break
+    else:
+        raise ValueError("sizeof_hdr != 348 (kein NIfTI-1)")
+    if header[344:348] not in (b'n+1\x00', b'ni1\x00'):
+        raise ValueError(f"ungültiges Magic {header[344:348]!r}")
+    dim = struct.unpack(endian + '8h', header[40:56])
+    if not 3 <= dim[0] <= 7 or min(dim[1:4]) < 1:
+        raise ValueError(f"ungültige Dimensionen {dim}")
+    datatype, bitpix = struct.unpack(endian + '2h', header[70:74])
+    if datatype not in NIFTI_BITPIX:
+        raise ValueError(f"unbekannter Datentyp {datatype}")
+    vox_offset = struct.unpack(endian + 'f', header[108:112])[0]
+    return {'shape': list(dim[1:1 + dim[0]]), 'datatype': datatype, 'bitpix': bitpix, 'vox_offset': vox_offset}
+
+
+def process_file(path: str, decompress: bool = DECOMPRESS) -> Dict:
+    """
+    Prozess-Worker: komplette gzip-Datei dekomprimierend lesen (prüft CRC und Länge),
+    Header prüfen und Datenmenge mit dem Header vergleichen. Mit decompress wird .nii geschrieben.
+    Bereits entpackte .nii (z.B. von download_*.sh) werden nur geprüft.
+    """
+    path = Path(path)
+    compressed = path.name.endswith('.gz')
+    out = path.with_suffix('') if decompress and compressed else None  # x.nii.gz -> x.nii
+    tmp = out.with_name(out.name + '.part') if out else None
+    total, header = 0, b''
+    with (gzip.open if compressed else open)(path, 'rb') as src:
+        sink = open(tmp, 'wb') if tmp else None
+        try:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(header) < 348:
+                    header += chunk[:348 - len(header)]
+                if sink:
+                    sink.write(chunk)
+                total += len(chunk)
+        finally:
+            if sink:
+                sink.close()
+
+    try:
+        info = check_nifti_header(header)
+        n_voxels = 1
+        for d in info['shape']:
+            n_voxels *= d
+        expected = int(info['vox_offset']) + n_voxels * info['bitpix'] // 8
+        if total < expected:
+            raise ValueError(f"Datei zu kurz: {total} < {expected} Bytes")
+    except ValueError:
+        if tmp:
+            tmp.unlink(missing_ok=True)
+        raise
+
+    if out:
+        os.replace(tmp, out)
+        path.unlink()
+    return {'file': str(out or path), 'shape': info['shape'], 'datatype': info['datatype']}
+
+
+def existing_file(dataset: Dict, subject: str, target: Path) -> Optional[Path]:
+    """Schon vorhandene Datei im Zielordner (z.B. von download_*.sh): <name>.nii oder <name>.nii.gz"""
+    name = dataset['name'].format(subject=subject)
+    for suffix in ('.nii', '.nii.gz'):
+        path = target / (name + suffix)
+        if path.exists():
+            return path
+    return None
+
+
+def quarantine(path: Path) -> Optional[Path]:
+    """Ungültige Datei umbenennen (<datei>.invalid), damit Shell-Skripte und CAT12-Suche sie nicht nehmen"""
+    if not path.exists():
+        return None
+    bad = path.with_name(path.name + '.invalid')
+    os.replace(path, bad)
+    return bad
+
+
+def run_download(dataset_name: str, backend, target: Path, n_transfers: int = N_TRANSFERS,
+                 n_workers: int = N_WORKERS, decompress: bool = DECOMPRESS, max_subjects: int = 0,
+                 retry_missing: bool = False, retries: int = RETRIES, backoff: float = BACKOFF_SECONDS) -> Dict[str, int]:
+    """
+    Download-Pipeline: Transfers im Thread-Pool, jede fertige Datei geht direkt in den
+    Prozess-Pool. Nur der Hauptthread schreibt die Zustandsdatei.
+    """
+    dataset = DATASETS[dataset_name]
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    state_path = target / STATE_FILE
+    state = read_state(state_path)
+
+    subjects = backend.list_subjects()
+    if max_subjects:
+        subjects = subjects[:max_subjects]
+    print(f"✓ {len(subjects)} Probanden gefunden")
+
+    done = {'done'} | (set() if retry_missing else {'missing'})
+    skip = [s for s in subjects if state.get(s, {}).get('status') in done]
+    # geladen, aber Verarbeitung nicht abgeschlossen -> nur Prozess-Stufe
+    reprocess = {s: state[s] for s in subjects if state.get(s, {}).get('status') == 'downloaded'
+                 and Path(state[s]['file']).exists()}
+    # ohne fertigen Zustand, aber Datei schon im Zielordner (frühere Läufe der Shell-Skripte)
+    # -> nicht neu laden, nur prüfen
+    for s in subjects:
+        if s not in reprocess and state.get(s, {}).get('status') not in done:
+            path = existing_file(dataset, s, target)
+            if path is not None:
+                reprocess[s] = {'subject': s, 'status': 'existing', 'file': str(path)}
+    todo = [s for s in subjects if s not in set(skip) | set(reprocess)]
+    print(f"  bereits fertig: {len(skip)}, nur verarbeiten: {len(reprocess)}, herunterladen: {len(todo)}")
+
+    counts = {'done': 0, 'missing': 0, 'failed': 0, 'invalid': 0, 'skipped': len(skip)}
+    lock = threading.Lock()
+    started = time.time()
+    downloaded_bytes = 0
+
+    with open(state_path, 'a') as state_file, \
+            ThreadPoolExecutor(max_workers=n_transfers) as transfers, \
+            ProcessPoolExecutor(max_workers=n_workers) as workers:
+
+        def log(record):
+            record['time'] = datetime.now().isoformat(timespec='seconds')
+            with lock:
+                state_file.write(json.dumps(record) + '\n')
+                state_file.flush()
+
+        pending = {}
+        for subject, record in reprocess.items():
+            pending[workers.submit(process_file, record['file'], decompress)] = ('process', record)
+        for subject in todo:
+            pending[transfers.submit(download_subject, backend, dataset, subject, target, retries, backoff)] = \
+                ('download', subject)
+
+        n_total = len(todo) + len(reprocess)
+        finished = 0
+        while pending:
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                stage, context = pending.pop(future)
+                if stage == 'download':
+                    record = future.result()
+                    log(dict(record))
+                    if record['status'] == 'downloaded':
+                        downloaded_bytes += record['size']
+                        pending[workers.submit(process_file, record['file'], decompress)] = ('process', record)
+                        continue
+                    counts[record['status']] += 1
+                    print(f"  ✗ {record['subject']}: {record['status']} ({record.get('error')})")
+                else:
+                    try:
+                        result = future.result()
+                        log({**context, 'status': 'done', **result})
+                        Path(context['file'] + '.invalid').unlink(missing_ok=True)  # alte, ungültige Kopie
+                        counts['done'] += 1
+                    except Exception as e:
+                        bad = quarantine(Path(context['file']))
+                        log({**context, 'status': 'invalid', 'error': f"{type(e).__name__}: {e}",
+                             'file': str(bad) if bad else context['file']})
+                        counts['invalid'] += 1
+                        print(f"  ✗ {context['subject']}: ungültig ({e})")
+                finished += 1
+                if finished % 25 == 0 or finished == n_total:
+                    elapsed = time.time() - started
+                    print(f"  [{finished}/{n_total}] {downloaded_bytes / 1e6:.0f} MB, "
+                          f"{downloaded_bytes / 1e6 / max(elapsed, 1e-9):.1f} MB/s")
+    return counts
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="T1-Download OpenNeuro/SALD (parallel, fortsetzbar)")
+    parser.add_argument('dataset', choices=sorted(DATASETS))
+    parser.add_argument('--target', type=Path, default=None)
+    parser.add_argument('--backend', choices=['s3', 'local'], default='s3')
+    parser.add_argument('--source', default=None, help="Verzeichnis für --backend local")
+    parser.add_argument('--endpoint-url', default=None, help="S3-kompatibler Server (z.B. lokales MinIO)")
+    parser.add_argument('--transfers', type=int, default=N_TRANSFERS)
+    parser.add_argument('--workers', type=int, default=N_WORKERS)
+    parser.add_argument('--decompress', action='store_true', default=DECOMPRESS, help=".nii statt .nii.gz behalten")
+    parser.add_argument('--max-subjects', type=int, default=0, help="0 = alle")
+    parser.add_argument('--retry-missing', action='store_true', help="Subjects ohne T1 erneut versuchen")
+    args = parser.parse_args()
+
+    dataset = DATASETS[args.dataset]
+    target = args.target or dataset['target']
+    print("=" * 64)
+    print(f"  {args.dataset} DOWNLOAD - T1w ONLY")
+    print("=" * 64)
+    print(f"Zielordner:     {target}")
+    print(f"Backend:        {args.backend} {args.source or args.endpoint_url or dataset['bucket']}")
+    print(f"Transfers:      {args.transfers}, Prozesse: {args.workers}, Dekomprimieren: {args.decompress}")
+    probe = Path(target) if Path(target).exists() else Path(target).parent
+    if probe.exists():
+        print(f"Freier Speicher: {shutil.disk_usage(probe).free / 1e9:.1f} GB")
+
+    started = time.time()
+    counts = run_download(args.dataset, make_backend(dataset, args.backend, args.source, args.endpoint_url),
+                          target, args.transfers, args.workers, args.decompress, args.max_subjects,
+                          args.retry_missing)
+
+    print("\n" + "=" * 64)
+    print("  ZUSAMMENFASSUNG")
+    print("=" * 64)
+    print(f"Erfolgreich:    {counts['done']}")
+    print(f"Übersprungen:   {counts['skipped']}")
+    print(f"Kein T1w:       {counts['missing']}")
+    print(f"Fehlgeschlagen: {counts['failed']}")
+    print(f"Ungültig:       {counts['invalid']}")
+    print(f"Dauer:          {time.time() - started:.0f} s")
+    print(f"Zustand:        {Path(target) / STATE_FILE}")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bootstrap-Konfidenzintervalle für die Kohorten-Zusammenfassungen
+Die Scans werden nach Kohorte sortiert (zusammenhängende Segmente). Alle Resamples aller
+Kohorten einer Metrik sind ein einziges Index-Array (Replikate x Scans), jede Kohorte zieht
+nur innerhalb ihres Segments. Mittelwerte/Anteile per np.add.reduceat, Mediane über die
+sortierten Indizes (Segmente bleiben beim Sortieren an ihrer Position).
+"""
+
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+#%% ========== KONFIGURATION ==========
+
+N_BOOTSTRAP = 5000
+
+# Konfidenzniveau der Perzentil-Intervalle
+CI_LEVEL = 0.95
+
+# Replikate pro Block (begrenzt den Speicher: Block x Scans Indizes)
+BOOTSTRAP_BATCH = 500
+
+SEED = 0
+
+#%% ========== FUNKTIONEN ==========
+
+def _segments(values: np.ndarray, groups: np.ndarray, group_order: List[str]):
+    """Gültige Werte nach (Kohorte, Wert) sortiert + Offsets/Größen der Kohorten-Segmente"""
+    valid = ~np.isnan(values)
+    lookup = {g: i for i, g in enumerate(group_order)}
+    codes = np.array([lookup.get(g, -1) for g in groups], dtype=np.int64)
+    keep = valid & (codes >= 0)
+    order = np.lexsort((values[keep], codes[keep]))
+    sorted_values = values[keep][order]
+    sizes = np.bincount(codes[keep], minlength=len(group_order))
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    return sorted_values, offsets, sizes
+
+
+def _resample_indices(offsets: np.ndarray, sizes: np.ndarray, n_boot: int, seed: int, batch_index: int) -> np.ndarray:
+    """
+    (n_boot x N) Indizes: Spalte j gehört zum Segment ihrer Kohorte und zieht mit
+    Zurücklegen nur aus diesem Segment. Sortiert pro Zeile.
+    """
+    segment = np.repeat(np.arange(len(sizes)), sizes)
+    rng = np.random.default_rng([seed, batch_index])
+    draws = (rng.random((n_boot, len(segment))) * sizes[segment]).astype(np.int64)
+    return np.sort(offsets[segment] + draws, axis=1)
+
+
+def _segment_statistics(sorted_values: np.ndarray, offsets: np.ndarray, sizes: np.ndarray,
+                        n_boot: int, seed: int, batch: int, median: bool = True):
+    """Bootstrap-Mittelwerte und -Mediane (n_boot x Kohorten), blockweise über die Replikate"""
+    present = sizes > 0
+    starts, counts = offsets[present], sizes[present]
+    lower_mid = starts + (counts - 1) // 2
+    upper_mid = starts + counts // 2
+
+    means = np.empty((n_boot, len(starts)))
+    medians = np.empty((n_boot, len(starts))) if median else None
+    for b, first in enumerate(range(0, n_boot, batch)):
+        size = min(batch, n_boot - first)
+        index = _resample_indices(offsets, sizes, size, seed, b)
+        sample = sorted_values[index]
+        means[first:first + size] = np.add.reduceat(sample, starts, axis=1) / counts
+        if median:
+            # sortierte Indizes -> sortierte Werte pro Segment, Mitte direkt ablesbar
+            medians[first:first + size] = 0.5 * (sample[:, lower_mid] + sample[:, upper_mid])
+    return present, means, medians
+
+
+def _percentiles(replicates: np.ndarray, ci: float):
+    tail = (1 - ci) / 2 * 100
+    return np.percentile(replicates, [tail, 100 - tail], axis=0)
+
+
+def bootstrap_cohort_stats(values: np.ndarray, groups: np.ndarray, group_order: List[str],
+                           n_boot: int = N_BOOTSTRAP, ci: float = CI_LEVEL, seed: int = SEED,
+                           batch: int = BOOTSTRAP_BATCH) -> pd.DataFrame:
+    """
+    Mittelwert und Median pro Kohorte mit Perzentil-Konfidenzintervallen (NaN ignoriert).
+    Rückgabe: DataFrame (Index = Kohorte) mit n, mean, mean_ci_low/high, median, median_ci_low/high
+    """
+    sorted_values, offsets, sizes = _segments(np.asarray(values, dtype=np.float64), np.asarray(groups), group_order)
+    present, means, medians = _segment_statistics(sorted_values, offsets, sizes, n_boot, seed, batch)
+    cohorts = np.array(group_order, dtype=object)[present]
+    starts, counts = offsets[present], sizes[present]
+
+    mean_ci, median_ci = _percentiles(means, ci), _percentiles(medians, ci)
+    return pd.DataFrame({
+        'n': counts,
+        'mean': np.add.reduceat(sorted_values, starts) / counts if len(starts) else [],
+        'mean_ci_low': mean_ci[0], 'mean_ci_high': mean_ci[1],
+        'median': 0.5 * (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]),
+        'median_ci_low': median_ci[0], 'median_ci_high': median_ci[1],
+    }, index=pd.Index(cohorts, name='cohort'))
+
+
+def bootstrap_rate(flags: np.ndarray, groups: np.ndarray, group_order: List[str],
+                   n_boot: int = N_BOOTSTRAP, ci: float = CI_LEVEL, seed: int = SEED,
+                   batch: int = BOOTSTRAP_BATCH) -> pd.DataFrame:
+    """Anteil (z.B. problematische Scans) pro Kohorte mit Bootstrap-Konfidenzintervall"""
+    sorted_values, offsets, sizes = _segments(np.asarray(flags, dtype=np.float64), np.asarray(groups), group_order)
+    present, rates, _ = _segment_statistics(sorted_values, offsets, sizes, n_boot, seed, batch, median=False)
+    starts, counts = offsets[present], sizes[present]
+    rate_ci = _percentiles(rates, ci)
+    return pd.DataFrame({
+        'n': counts,
+        'rate': np.add.reduceat(sorted_values, starts) / counts if len(starts) else [],
+        'rate_ci_low': rate_ci[0], 'rate_ci_high': rate_ci[1],
+    }, index=pd.Index(np.array(group_order, dtype=object)[present], name='cohort'))
+
+
+def bootstrap_summary(df: pd.DataFrame, metrics: List[str], flags: Optional[np.ndarray] = None,
+                      n_boot: int = N_BOOTSTRAP, ci: float = CI_LEVEL, seed: int = SEED) -> pd.DataFrame:
+    """
+    Lange Tabelle (cohort, metric, ...) für alle Metriken; mit flags zusätzlich die Zeilen
+    metric='problem_rate' (Anteil, CI in mean_ci_low/high, kein Median).
+    """
+    groups = df['cohort'].to_numpy()
+    group_order = sorted(df['cohort'].unique())
+    frames = []
+    for metric in metrics:
+        if metric not in df.columns:
+            continue
+        result = bootstrap_cohort_stats(df[metric].to_numpy(dtype=np.float64, na_value=np.nan),
+                                        groups, group_order, n_boot, ci, seed)
+        frames.append(result.reset_index().assign(metric=metric))
+    if flags is not None:
+        rate = bootstrap_rate(flags, groups, group_order, n_boot, ci, seed)
+        frames.append(rate.rename(columns={'rate': 'mean', 'rate_ci_low': 'mean_ci_low',
+                                           'rate_ci_high': 'mean_ci_high'})
+                      .reset_index().assign(metric='problem_rate'))
+
+    columns = ['cohort', 'metric', 'n', 'mean', 'mean_ci_low', 'mean_ci_high',
+               'median', 'median_ci_low', 'median_ci_high']
+    return pd.concat(frames, ignore_index=True).reindex(columns=columns) if frames else pd.DataFrame(columns=columns)
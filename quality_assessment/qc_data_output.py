@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+QC-Quelle für das CAT12 data_output Layout (<SUBJECT>/report/cat_<SUBJECT>.xml)
+Die Reports werden über das Run-Manifest (Liste der NIfTI-Pfade aus dem SLURM-Skript)
+lokalisiert statt über einen rekursiven Glob, die Kohorte kommt aus der Metadaten-Spalte
+'Dataset'. Im Follow-Modus werden während eines laufenden SLURM-Arrays fertige Subjects
+nachgeladen und die QC-Tabellen inkrementell aktualisiert.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import METADATA_PATHS, OUTPUT_FILE, normalize_subject_id
+from instrumentation import instrumented
+
+from qc_ingest import N_WORKERS
+from qc_store import QC_STORE_PATH, QCStore, update_store
+
+#%% ========== KONFIGURATION ==========
+
+# CAT12 Output auf bq-storage (1 Ordner pro Subject)
+DATA_OUTPUT_ROOT = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/data_output")
+
+# Run-Manifest (VALID_PATHS_FILE im SLURM-Skript, z.B. reprocess_subjects.txt)
+MANIFEST_PATH = Path(OUTPUT_FILE)
+
+METADATA_PATH = Path(METADATA_PATHS[0])
+
+# Sekunden zwischen zwei Abfragen im Follow-Modus
+POLL_INTERVAL = 300
+
+# Kohorte für Subjects ohne Metadaten-Eintrag
+UNKNOWN_COHORT = 'unknown'
+
+# ohne persistenten Store (--no-store): SQLite nur im Arbeitsspeicher
+MEMORY_STORE = ':memory:'
+
+#%% ========== FUNKTIONEN ==========
+
+def read_manifest(manifest_path: Path = MANIFEST_PATH) -> List[str]:
+    """Subject-Namen wie im SLURM-Skript: basename ohne .nii.gz/.nii/.gz"""
+    paths = pd.read_csv(manifest_path, header=None, names=['path'], dtype=str,
+                        skip_blank_lines=True)['path'].str.strip()
+    names = paths[paths != ''].str.replace(r'^.*/', '', regex=True)
+    names = names.str.replace(r'(\.nii\.gz|\.nii|\.gz)$', '', regex=True)
+    return names.drop_duplicates().tolist()
+
+
+def subject_cohorts(subjects: List[str], metadata_path: Path = METADATA_PATH) -> Dict[str, str]:
+    """Subject -> Metadaten-'Dataset' (Abgleich über normalize_subject_id)"""
+    metadata = pd.read_csv(metadata_path, usecols=['Filename', 'Dataset'])
+    dataset_of = dict(zip(normalize_subject_id(metadata['Filename']), metadata['Dataset']))
+    ids = normalize_subject_id(pd.Series(subjects, dtype=str))
+    cohorts = {s: dataset_of.get(i, UNKNOWN_COHORT) for s, i in zip(subjects, ids)}
+
+    n_unknown = sum(c == UNKNOWN_COHORT for c in cohorts.values())
+    if n_unknown:
+        print(f"⚠️  {n_unknown} Subjects ohne Metadaten -> Kohorte '{UNKNOWN_COHORT}'")
+    return cohorts
+
+
+def report_path(output_root: Path, subject: str) -> Path:
+    return Path(output_root) / subject / 'report' / f'cat_{subject}.xml'
+
+
+def is_finished(output_root: Path, subject: str) -> bool:
+    """Subject gilt als fertig, sobald die Ergebnis-CSV (letzter Schritt im MATLAB-Skript) existiert"""
+    return os.path.exists(Path(output_root) / subject / f'{subject}_cat12_results.csv')
+
+
+def sync_subjects(store: QCStore, subjects: List[str], cohorts: Dict[str, str],
+                  output_root: Path = DATA_OUTPUT_ROOT, n_workers: int = N_WORKERS) -> Tuple[List[str], List[str]]:
+    """
+    Übernimmt die Reports der fertigen Subjects in den QC-Store (nur neue/geänderte werden geparst).
+    Rückgabe: (fertige Subjects, noch offene Subjects)
+    """
+    finished, pending, reports = [], [], []
+    for subject in subjects:
+        if not is_finished(output_root, subject):
+            pending.append(subject)
+            continue
+        finished.append(subject)
+        path = report_path(output_root, subject)
+        if path.exists():
+            reports.append(path)
+        else:
+            print(f"Warnung: Report fehlt für fertiges Subject {subject}: {path}")
+
+    report_cohorts = [cohorts[p.parent.parent.name] for p in reports]
+    update_store(store, reports, report_cohorts, n_workers=n_workers)
+    return finished, pending
+
+
+def load_manifest_reports(store: QCStore, subjects: List[str], cohorts: Dict[str, str],
+                          output_root: Path = DATA_OUTPUT_ROOT) -> pd.DataFrame:
+    """
+    QC-Daten nur für die Reports dieser Subjects - der Store kann auch Subjects
+    früherer Läufe/Manifeste derselben Kohorten enthalten
+    """
+    df = store.load(sorted(set(cohorts.values())))
+    wanted = {str(report_path(output_root, s)) for s in subjects}
+    return df[df['filepath'].isin(wanted)].reset_index(drop=True)
+
+
+@instrumented('qc.collect_data_output', items=len)
+def collect_data_output(output_root: Path = DATA_OUTPUT_ROOT, manifest_path: Path = MANIFEST_PATH,
+                        metadata_path: Path = METADATA_PATH, store_path: Optional[Path] = QC_STORE_PATH,
+                        n_workers: int = N_WORKERS) -> pd.DataFrame:
+    """
+    Alle fertigen Subjects des Manifests -> QC-DataFrame (Spalten wie collect_data_from_cohorts).
+    store_path=None: alle Reports neu parsen (Store nur im Arbeitsspeicher)
+    """
+    subjects = read_manifest(manifest_path)
+    cohorts = subject_cohorts(subjects, metadata_path)
+    print(f"Manifest {manifest_path}: {len(subjects)} Subjects")
+
+    store = QCStore(MEMORY_STORE if store_path is None else store_path)
+    try:
+        finished, pending = sync_subjects(store, subjects, cohorts, output_root, n_workers)
+        print(f"  {len(finished)} fertig, {len(pending)} noch nicht fertig")
+        return load_manifest_reports(store, finished, cohorts, output_root)
+    finally:
+        store.close()
+
+
+def follow(on_update: Callable[[pd.DataFrame, List[str]], None], output_root: Path = DATA_OUTPUT_ROOT,
+           manifest_path: Path = MANIFEST_PATH, metadata_path: Path = METADATA_PATH,
+           store_path: Optional[Path] = QC_STORE_PATH, interval: float = POLL_INTERVAL,
+           n_workers: int = N_WORKERS, max_polls: Optional[int] = None):
+    """
+    Pollt während eines SLURM-Laufs nach neu fertigen Subjects (nur die noch offenen werden geprüft).
+    on_update(df, neue_filenames) wird nach jeder Aktualisierung mit allen QC-Daten aufgerufen.
+    Endet, wenn alle Subjects des Manifests fertig sind (oder nach max_polls Abfragen).
+    """
+    subjects = read_manifest(manifest_path)
+    cohorts = subject_cohorts(subjects, metadata_path)
+    pending = subjects
+    store = QCStore(MEMORY_STORE if store_path is None else store_path)
+    polls = 0
+
+    try:
+        while True:
+            finished, pending = sync_subjects(store, pending, cohorts, output_root, n_workers)
+            polls += 1
+            done = len(subjects) - len(pending)
+            print(f"[{time.strftime('%H:%M:%S')}] {done}/{len(subjects)} fertig ({len(finished)} neu)")
+
+            if finished:
+                new_files = [report_path(output_root, s).name for s in finished]
+                open_subjects = set(pending)
+                done_subjects = [s for s in subjects if s not in open_subjects]
+                on_update(load_manifest_reports(store, done_subjects, cohorts, output_root), new_files)
+
+            if not pending or (max_polls is not None and polls >= max_polls):
+                break
+            time.sleep(interval)
+    finally:
+        store.close()
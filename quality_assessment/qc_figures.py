@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+QC-Abbildungen (01-05) für CAT12_Quality_analysis.py
+Jede Abbildung wird in einem eigenen Worker-Prozess gerendert und nur neu erstellt,
+wenn sich der Hash ihrer Eingabedaten seit dem letzten Lauf geändert hat
+(.figure_cache.json im Output-Ordner). Preview-Modus: niedrige dpi, unterabgetastete Daten.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from instrumentation import instrumented
+
+from qc_stats import ALPHA, cohort_tests
+
+#%% ========== KONFIGURATION ==========
+
+FULL_DPI = 300
+PREVIEW_DPI = 72
+
+# Maximale Scans pro Kohorte im Preview-Modus
+PREVIEW_ROWS_PER_COHORT = 200
+
+CACHE_FILE = '.figure_cache.json'
+
+# Bei Änderungen an den Plot-Funktionen erhöhen -> alle Abbildungen werden neu erstellt
+FIGURE_VERSION = 1
+
+N_WORKERS = min(5, os.cpu_count() or 1)
+
+SURFACE_METRICS = [
+    ('SurfaceEulerNumber_rating', 'Surface Euler Number Rating\n(Niedriger = Besser, ~1-2 = gut)'),
+    ('SurfaceDefectArea_rating', 'Surface Defect Area Rating\n(Niedriger = Besser)'),
+    ('SurfaceIntensityRMSE', 'Surface Intensity RMSE\n(Niedriger = Besser)'),
+    ('SurfacePositionRMSE', 'Surface Position RMSE\n(Niedriger = Besser)')
+]
+
+CONTRAST_METRICS = [
+    ('NCR', 'Noise-to-Contrast Ratio\n(Niedriger = Besser)'),
+    ('ICR', 'Inhomogeneity-to-Contrast Ratio\n(Niedriger = Besser)'),
+    ('contrast', 'Contrast\n(Höher = Besser)')
+]
+
+HEATMAP_METRICS = ['IQR_rating', 'SurfaceEulerNumber_rating', 'SurfaceDefectArea_rating',
+                   'NCR', 'ICR', 'SurfaceIntensityRMSE']
+
+DISTRIBUTION_METRICS = ['IQR_rating', 'SurfaceEulerNumber_rating', 'NCR', 'ICR']
+
+#%% ========== FUNKTIONEN ==========
+
+def setup_style():
+    """Plotting Style (in jedem Worker-Prozess)"""
+    plt.style.use('seaborn-v0_8-darkgrid')
+    sns.set_palette("husl")
+
+
+def _annotate_kruskal(ax, kruskal_p: Dict[str, float], metric: str, label: str = "p", fontsize=None):
+    """Markiert signifikante Kohorten-Unterschiede (Kruskal-Wallis) im Plot"""
+    p = kruskal_p.get(metric)
+    if p is not None and p < ALPHA:
+        kwargs = {'fontsize': fontsize} if fontsize else {}
+        ax.text(0.02, 0.98, f"{label}={p:.4f} *", transform=ax.transAxes, verticalalignment='top',
+                bbox=dict(boxstyle='round', facecolor='yellow', alpha=0.5), **kwargs)
+
+
+def figure_iqr_distribution(df: pd.DataFrame, out_file: Path, dpi: int, kruskal_p: Dict[str, float]):
+    fig, axes = plt.subplots(2, 1, figsize=(14, 10))
+
+    if 'IQR_rating' in df.columns:
+        # Boxplot mit Signifikanz-Markierungen
+        df.boxplot(column='IQR_rating', by='cohort', ax=axes[0])
+        axes[0].set_title('IQR (Image Quality Rating) pro Kohorte\n(Niedriger = Besser)',
+                          fontsize=14, fontweight='bold')
+        axes[0].set_xlabel('Kohorte', fontsize=12)
+        axes[0].set_ylabel('IQR Rating', fontsize=12)
+        plt.sca(axes[0])
+        plt.xticks(rotation=45, ha='right')
+        _annotate_kruskal(axes[0], kruskal_p, 'IQR_rating', label="Kruskal-Wallis p")
+
+        # Violin plot
+        sns.violinplot(data=df, x='cohort', y='IQR_rating', ax=axes[1])
+        axes[1].set_title('IQR Verteilung (Violin Plot)', fontsize=14, fontweight='bold')
+        axes[1].set_xlabel('Kohorte', fontsize=12)
+        axes[1].set_ylabel('IQR Rating', fontsize=12)
+        axes[1].tick_params(axis='x', rotation=45)
+
+    plt.tight_layout()
+    plt.savefig(out_file, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+def figure_surface_metrics(df: pd.DataFrame, out_file: Path, dpi: int, kruskal_p: Dict[str, float]):
+    fig, axes = plt.subplots(2, 2, figsize=(16, 12))
+
+    for idx, (metric, title) in enumerate(SURFACE_METRICS):
+        if metric in df.columns:
+            ax = axes[idx // 2, idx % 2]
+            df.boxplot(column=metric, by='cohort', ax=ax)
+            ax.set_title(title, fontsize=11, fontweight='bold')
+            ax.set_xlabel('Kohorte', fontsize=10)
+            ax.set_ylabel(metric, fontsize=10)
+            ax.tick_params(axis='x', rotation=45)
+            _annotate_kruskal(ax, kruskal_p, metric, fontsize=8)
+
+    plt.tight_layout()
+    plt.savefig(out_file, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+def figure_noise_contrast(df: pd.DataFrame, out_file: Path, dpi: int, kruskal_p: Dict[str, float]):
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+
+    for idx, (metric, title) in enumerate(CONTRAST_METRICS):
+        if metric in df.columns:
+            df.boxplot(column=metric, by='cohort', ax=axes[idx])
+            axes[idx].set_title(title, fontsize=11, fontweight='bold')
+            axes[idx].set_xlabel('Kohorte', fontsize=10)
+            axes[idx].set_ylabel(metric, fontsize=10)
+            axes[idx].tick_params(axis='x', rotation=45)
+            _annotate_kruskal(axes[idx], kruskal_p, metric, fontsize=8)
+
+    plt.tight_layout()
+    plt.savefig(out_file, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+def figure_cohort_heatmap(df: pd.DataFrame, out_file: Path, dpi: int, kruskal_p: Dict[str, float]):
+    available = [m for m in HEATMAP_METRICS if m in df.columns]
+    if not available:
+        return
+    cohort_means = df.groupby('cohort')[available].mean()
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+    sns.heatmap(cohort_means.T, annot=True, fmt='.3f', cmap='RdYlGn_r',
+                ax=ax, cbar_kws={'label': 'Wert'})
+    ax.set_title('Durchschnittswerte pro Kohorte\n(Je nach Metrik: Rot = Schlechter, Grün = Besser)',
+                 fontsize=13, fontweight='bold')
+    ax.set_xlabel('Kohorte', fontsize=11)
+    ax.set_ylabel('Metrik', fontsize=11)
+    plt.tight_layout()
+    plt.savefig(out_file, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+def figure_distribution_overview(df: pd.DataFrame, out_file: Path, dpi: int, kruskal_p: Dict[str, float]):
+    available_metrics = [m for m in DISTRIBUTION_METRICS if m in df.columns]
+    if not available_metrics:
+        return
+
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+    axes = axes.flatten()
+
+    for idx, metric in enumerate(available_metrics[:4]):
+        df[metric].hist(bins=30, ax=axes[idx], edgecolor='black', alpha=0.7)
+        axes[idx].set_title(f'Verteilung: {metric}', fontsize=11, fontweight='bold')
+        axes[idx].set_xlabel(metric, fontsize=10)
+        axes[idx].set_ylabel('Häufigkeit', fontsize=10)
+        axes[idx].axvline(df[metric].mean(), color='red', linestyle='--',
+                          linewidth=2, label=f'Mean: {df[metric].mean():.2f}')
+        axes[idx].axvline(df[metric].median(), color='green', linestyle='--',
+                          linewidth=2, label=f'Median: {df[metric].median():.2f}')
+        axes[idx].legend()
+
+    plt.tight_layout()
+    plt.savefig(out_file, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+
+# Dateiname -> (Beschreibung, Funktion, verwendete Metriken)
+FIGURES = {
+    '01_IQR_distribution.png': ('IQR Verteilung mit Statistik', figure_iqr_distribution, ['IQR_rating']),
+    '02_surface_quality_metrics.png': ('Surface Quality Metriken', figure_surface_metrics,
+                                       [m for m, _ in SURFACE_METRICS]),
+    '03_noise_contrast_metrics.png': ('Noise und Contrast Metriken', figure_noise_contrast,
+                                      [m for m, _ in CONTRAST_METRICS]),
+    '04_cohort_comparison_heatmap.png': ('Kohorten-Vergleich Heatmap', figure_cohort_heatmap, HEATMAP_METRICS),
+    '05_distribution_overview.png': ('Verteilungsübersicht', figure_distribution_overview, DISTRIBUTION_METRICS),
+}
+
+
+def _data_hash(df: pd.DataFrame, columns: List[str], dpi: int, preview: bool) -> str:
+    """Hash über die Eingabedaten einer Abbildung (Kohorte + Metriken) und die Render-Einstellungen"""
+    data = df[['cohort'] + columns]
+    digest = hashlib.sha1(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    digest.update(json.dumps([list(data.columns), dpi, preview, FIGURE_VERSION]).encode())
+    return digest.hexdigest()
+
+
+def _render(name: str, df: pd.DataFrame, out_file: str, dpi: int, kruskal_p: Dict[str, float]) -> str:
+    """Worker: eine Abbildung rendern"""
+    setup_style()
+    FIGURES[name][1](df, Path(out_file), dpi, kruskal_p)
+    return name
+
+
+def preview_subsample(df: pd.DataFrame, rows_per_cohort: int = PREVIEW_ROWS_PER_COHORT, seed: int = 0) -> pd.DataFrame:
+    """Höchstens rows_per_cohort zufällige Scans pro Kohorte"""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(df))
+    shuffled = df.iloc[order]
+    keep = shuffled.groupby('cohort').cumcount().to_numpy() < rows_per_cohort
+    return shuffled[keep].sort_index()
+
+
+@instrumented('qc.render_figures', items=len)
+def render_figures(df: pd.DataFrame, output_path: Path, preview: bool = False, force: bool = False,
+                   n_workers: int = N_WORKERS, names: Optional[List[str]] = None) -> List[str]:
+    """
+    Rendert alle (bzw. die angegebenen) Abbildungen parallel.
+    Unveränderte Abbildungen werden übersprungen; Preview-Bilder landen in <output_path>/preview.
+    Rückgabe: Liste der neu erstellten Dateien
+    """
+    output_path = Path(output_path)
+    target_dir = output_path / 'preview' if preview else output_path
+    target_dir.mkdir(parents=True, exist_ok=True)
+    dpi = PREVIEW_DPI if preview else FULL_DPI
+    data = preview_subsample(df) if preview else df
+
+    cache_file = target_dir / CACHE_FILE
+    cache = {}
+    if cache_file.exists():
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    todo, hashes = [], {}
+    for name in names or list(FIGURES):
+        columns = [c for c in FIGURES[name][2] if c in data.columns]
+        hashes[name] = _data_hash(data, columns, dpi, preview)
+        if force or cache.get(name) != hashes[name] or not (target_dir / name).exists():
+            todo.append(name)
+        else:
+            print(f"  {name}: unverändert - übersprungen")
+
+    if not todo:
+        return []
+
+    # Kruskal-Wallis einmal im Hauptprozess (auf allen Daten) für die Annotationen
+    metrics = sorted({m for name in todo for m in FIGURES[name][2] if m in df.columns})
+    cohorts = list(df['cohort'].unique())
+    kruskal_p = {}
+    for metric in metrics:
+        result = cohort_tests(df[metric].to_numpy(dtype=np.float64, na_value=np.nan),
+                              df['cohort'].to_numpy(), cohorts)
+        if result is not None:
+            kruskal_p[metric] = float(result['kruskal_p'])
+
+    for name in todo:
+        print(f"Erstelle {name}: {FIGURES[name][0]}{' (Preview)' if preview else ''}...")
+    jobs = [(name, data[['cohort'] + [c for c in FIGURES[name][2] if c in data.columns]],
+             str(target_dir / name), dpi, kruskal_p) for name in todo]
+
+    if n_workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as pool:
+            done = list(pool.map(_render, *zip(*jobs)))
+    else:
+        done = [_render(*job) for job in jobs]
+
+    cache.update({name: hashes[name] for name in done})
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f, indent=2)
+    return [str(target_dir / name) for name in done]
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paralleles Einlesen der CAT12 Report-XMLs (cat_*.xml)
+Statt jede Datei komplett mit ET.parse aufzubauen, wird inkrementell geparst und
+abgebrochen, sobald qualitymeasures, qualityratings und subjectmeasures gelesen sind.
+Die Dateien werden in Paketen über einen Prozess-Pool verteilt, die Werte landen
+direkt in typisierten NumPy-Spalten.
+"""
+
+import os
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from instrumentation import instrumented
+
+#%% ========== KONFIGURATION ==========
+
+# Abschnitte (direkte Kinder des Wurzelelements) und die daraus gelesenen Metriken
+SECTIONS = {
+    'qualitymeasures': ['SurfaceEulerNumber', 'SurfaceDefectArea', 'SurfaceDefectNumber',
+                        'SurfaceIntensityRMSE', 'SurfacePositionRMSE', 'NCR', 'ICR',
+                        'contrast', 'contrastr'],
+    'qualityratings': ['IQR', 'SIQR', 'SurfaceEulerNumber', 'SurfaceDefectArea'],
+    'subjectmeasures': ['vol_TIV', 'surf_TSA'],
+}
+
+# Spaltennamen in der Reihenfolge der bisherigen Auswertung (Ratings mit Suffix _rating)
+METRIC_COLUMNS = (SECTIONS['qualitymeasures']
+                  + [f'{m}_rating' for m in SECTIONS['qualityratings']]
+                  + SECTIONS['subjectmeasures'])
+
+# Position jeder (Abschnitt, Metrik) Kombination in der Werte-Zeile
+_COLUMN_INDEX = {}
+for _section, _metrics in SECTIONS.items():
+    for _metric in _metrics:
+        _name = f'{_metric}_rating' if _section == 'qualityratings' else _metric
+        _COLUMN_INDEX[(_section, _metric)] = METRIC_COLUMNS.index(_name)
+
+# Standard-Anzahl Worker-Prozesse
+N_WORKERS = min(16, os.cpu_count() or 1)
+
+#%% ========== FUNKTIONEN ==========
+
+def read_report_metrics(xml_path) -> np.ndarray:
+    """
+    Liest die QC-Metriken einer Report-XML als float64-Zeile (fehlend = NaN).
+    Parst nur bis alle drei Abschnitte geschlossen sind.
+    """
+    values = np.full(len(METRIC_COLUMNS), np.nan)
+    remaining = set(SECTIONS)
+    depth = 0
+    section = None
+
+    for event, elem in ET.iterparse(str(xml_path), events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag in remaining:
+                section = elem.tag
+            continue
+
+        depth -= 1
+        if section is not None and depth == 2:
+            # direktes Kind eines gesuchten Abschnitts
+            column = _COLUMN_INDEX.get((section, elem.tag))
+            if column is not None and elem.text:
+                try:
+                    values[column] = float(elem.text)
+                except ValueError:
+                    pass
+        elif depth == 1:
+            if elem.tag == section:
+                remaining.discard(section)
+                section = None
+                if not remaining:
+                    break
+            elem.clear()  # andere Abschnitte nicht im Speicher halten
+
+    return values
+
+
+def _read_chunk(paths: List[str]):
+    """Worker: Metriken für ein Paket von Dateien (ok-Maske, Werte, Fehlermeldungen)"""
+    ok = np.zeros(len(paths), dtype=bool)
+    values = np.full((len(paths), len(METRIC_COLUMNS)), np.nan)
+    errors = []
+    for i, path in enumerate(paths):
+        try:
+            values[i] = read_report_metrics(path)
+            ok[i] = True
+        except Exception as e:
+            errors.append(f"Fehler beim Parsen von {path}: {e}")
+    return ok, values, errors
+
+
+@instrumented('qc.ingest_reports', items='xml_files')
+def ingest_reports(xml_files: List[Path], n_workers: int = N_WORKERS,
+                   chunk_size: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Liest alle Report-XMLs parallel ein.
+    Rückgabe: Spalten-Dict filename/filepath (str) + METRIC_COLUMNS (float64),
+    nicht lesbare Dateien werden (mit Meldung) ausgelassen.
+    """
+    paths = [str(p) for p in xml_files]
+    if chunk_size is None:
+        chunk_size = max(1, min(64, len(paths) // max(1, n_workers * 4)))
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+
+    if n_workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(_read_chunk, chunks))
+    else:
+        results = [_read_chunk(chunk) for chunk in chunks]
+
+    for _, _, errors in results:
+        for message in errors:
+            print(message)
+
+    if results:
+        ok = np.concatenate([r[0] for r in results])
+        values = np.concatenate([r[1] for r in results])[ok]
+    else:
+        ok = np.zeros(0, dtype=bool)
+        values = np.empty((0, len(METRIC_COLUMNS)))
+    filepaths = np.array(paths, dtype=str)[ok] if paths else np.array([], dtype=str)
+
+    columns = {
+        'filename': np.array([os.path.basename(p) for p in filepaths], dtype=str),
+        'filepath': filepaths,
+    }
+    for i, name in enumerate(METRIC_COLUMNS):
+        columns[name] = values[:, i]
+    return columns
+
+
+def find_reports(base_path: Path, cohorts: List[str]):
+    """
+    cat_*.xml in <base_path>/<cohort>/report (ein scandir pro Kohorte).
+    Rückgabe: (Liste der Dateien, Liste der zugehörigen Kohorten)
+    """
+    xml_files, file_cohorts = [], []
+    for cohort in cohorts:
+        cohort_path = Path(base_path) / cohort / 'report'
+
+        if not cohort_path.exists():
+            print(f"Warnung: Pfad existiert nicht: {cohort_path}")
+            continue
+
+        with os.scandir(cohort_path) as entries:
+            files = sorted(Path(e.path) for e in entries
+                           if e.name.startswith('cat_') and e.name.endswith('.xml'))
+        if not files:
+            print(f"Warnung: Keine XML-Dateien in {cohort_path}")
+            continue
+
+        print(f"Verarbeite {cohort}: {len(files)} Dateien gefunden")
+        xml_files.extend(files)
+        file_cohorts.extend([cohort] * len(files))
+    return xml_files, file_cohorts
+
+
+def collect_reports(base_path: Path, cohorts: List[str], n_workers: int = N_WORKERS) -> pd.DataFrame:
+    """
+    Liest alle Kohorten in einem gemeinsamen Pool-Durchlauf ein
+    (Spalten wie bisher: filename, filepath, Metriken, cohort)
+    """
+    xml_files, file_cohorts = find_reports(base_path, cohorts)
+    if not xml_files:
+        return pd.DataFrame()
+
+    columns = ingest_reports(xml_files, n_workers=n_workers)
+    cohort_of = dict(zip(map(str, xml_files), file_cohorts))
+    columns['cohort'] = np.array([cohort_of[p] for p in columns['filepath']], dtype=object)
+    return pd.DataFrame(columns)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multivariate QC: robuste Mahalanobis-Distanzen pro Kohorte
+Für jede Kohorte werden robuste Lage und Kovarianz (FastMCD, alle Startmengen als
+gestapelte NumPy-Arrays) über die numerischen QC-Metriken geschätzt. Scans, die nur in
+der Kombination auffallen (z.B. mittleres NCR + hohes ICR + niedriger Kontrast), bekommen
+eine hohe Distanz. Die Schätzer werden als .npz gespeichert - neue Scans werden ohne
+Neuanpassung gegen die Referenz ihrer Kohorte bewertet.
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from instrumentation import instrumented
+
+#%% ========== KONFIGURATION ==========
+
+# QC-Metriken für die multivariate Distanz. Ratings, die nur eine Umrechnung der
+# gemessenen Werte sind (Euler/DefectArea), sowie TIV/TSA werden nicht verwendet.
+MULTIVARIATE_METRICS = ['SurfaceEulerNumber', 'SurfaceDefectArea', 'SurfaceIntensityRMSE',
+                        'SurfacePositionRMSE', 'NCR', 'ICR', 'contrastr', 'IQR_rating']
+
+# Scan gilt als multivariater Ausreißer wenn p (Chi²) < OUTLIER_ALPHA
+OUTLIER_ALPHA = 0.001
+
+# Anteil der Scans, die in die MCD-Schätzung eingehen (h = SUPPORT_FRACTION * n, min. (n+p+1)/2)
+SUPPORT_FRACTION = None
+
+# Zufällige (p+1)-Startmengen und wie viele davon bis zur Konvergenz iteriert werden
+N_STARTS = 500
+N_BEST = 10
+START_BATCH = 100
+MAX_C_STEPS = 100
+
+# Kohorten mit weniger vollständigen Scans werden gegen die gepoolte Referenz bewertet
+MIN_COHORT_SIZE = 30
+
+POOLED = '__pooled__'
+
+REFERENCE_FILE = 'qc_mcd_reference.npz'
+
+SEED = 0
+
+#%% ========== FUNKTIONEN ==========
+
+def _robust_scale(x: np.ndarray):
+    """Median und MAD pro Spalte (Standardisierung vor der MCD-Schätzung)"""
+    center = np.median(x, axis=0)
+    scale = 1.4826 * np.median(np.abs(x - center), axis=0)
+    fallback = x.std(axis=0)
+    scale = np.where(scale > 0, scale, np.where(fallback > 0, fallback, 1.0))
+    return center, scale
+
+
+def _mean_cov(subsets: np.ndarray):
+    """Mittelwerte (S x p) und Kovarianzen (S x p x p) für S gestapelte Teilmengen (S x m x p)"""
+    mu = subsets.mean(axis=1)
+    centered = subsets - mu[:, None, :]
+    cov = np.einsum('smi,smj->sij', centered, centered) / (subsets.shape[1] - 1)
+    # minimale Regularisierung: Teilmengen mit (nahezu) konstanten Spalten bleiben invertierbar
+    ridge = 1e-9 * np.maximum(np.trace(cov, axis1=1, axis2=2) / cov.shape[1], 1e-12)
+    return mu, cov + ridge[:, None, None] * np.eye(cov.shape[1])
+
+
+def _distances(x: np.ndarray, mu: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    """Quadrierte Mahalanobis-Distanzen aller n Scans für alle S Schätzer (S x n)"""
+    diff = x[None, :, :] - mu[:, None, :]
+    solved = np.linalg.solve(cov, diff.transpose(0, 2, 1))
+    return np.einsum('snp,spn->sn', diff, solved)
+
+
+def _c_steps(x: np.ndarray, mu: np.ndarray, cov: np.ndarray, h: int, n_steps: int):
+    """
+    C-Schritte für alle Schätzer gleichzeitig: jeweils die h Scans mit kleinster Distanz
+    bilden die nächste Teilmenge. Bricht ab, sobald sich keine Determinante mehr ändert.
+    """
+    _, logdet = np.linalg.slogdet(cov)
+    for _ in range(n_steps):
+        d2 = _distances(x, mu, cov)
+        support = np.argpartition(d2, h - 1, axis=1)[:, :h]
+        mu, cov = _mean_cov(x[support])
+        previous, (_, logdet) = logdet, np.linalg.slogdet(cov)
+        if np.allclose(logdet, previous, rtol=0, atol=1e-10):
+            break
+    return mu, cov, logdet
+
+
+def fast_mcd(x: np.ndarray, support_fraction: Optional[float] = SUPPORT_FRACTION,
+             n_starts: int = N_STARTS, seed: int = SEED) -> Dict[str, np.ndarray]:
+    """
+    Minimum Covariance Determinant (Rousseeuw & Van Driessen 1999) für eine (n x p) Matrix
+    ohne NaN. Gibt Lage, Kovarianz (konsistenzkorrigiert und umgewichtet) und die
+    Support-Maske zurück.
+    """
+    n, p = x.shape
+    h = (n + p + 1) // 2 if support_fraction is None else max(int(support_fraction * n), (n + p + 1) // 2)
+    rng = np.random.default_rng(seed)
+
+    # 1. zufällige (p+1)-Startmengen, je zwei C-Schritte (stapelweise)
+    candidates = []
+    for start in range(0, n_starts, START_BATCH):
+        size = min(START_BATCH, n_starts - start)
+        starts = np.argsort(rng.random((size, n)), axis=1)[:, :p + 1]
+        mu, cov = _mean_cov(x[starts])
+        candidates.append(_c_steps(x, mu, cov, h, n_steps=2))
+    mu = np.concatenate([c[0] for c in candidates])
+    cov = np.concatenate([c[1] for c in candidates])
+    logdet = np.concatenate([c[2] for c in candidates])
+
+    # 2. die besten Kandidaten bis zur Konvergenz, kleinste Determinante gewinnt
+    best = np.argsort(logdet)[:N_BEST]
+    mu, cov, logdet = _c_steps(x, mu[best], cov[best], h, n_steps=MAX_C_STEPS)
+    winner = np.argmin(logdet)
+    mu, cov = mu[winner], cov[winner]
+
+    # 3. Konsistenzkorrektur und Umgewichtung (97.5%-Quantil)
+    d2 = _distances(x, mu[None], cov[None])[0]
+    cov = cov * np.median(d2) / stats.chi2.ppf(0.5, p)
+    d2 = _distances(x, mu[None], cov[None])[0]
+    support = d2 <= stats.chi2.ppf(0.975, p)
+    mu, cov = _mean_cov(x[support][None])
+    mu, cov = mu[0], cov[0]
+    d2 = _distances(x, mu[None], cov[None])[0]
+    cov = cov * np.median(d2) / stats.chi2.ppf(0.5, p)
+
+    return {'location': mu, 'covariance': cov, 'support': support}
+
+
+def fit_reference(df: pd.DataFrame, metrics: List[str] = MULTIVARIATE_METRICS,
+                  min_size: int = MIN_COHORT_SIZE, seed: int = SEED) -> Dict[str, np.ndarray]:
+    """
+    MCD-Referenz pro Kohorte plus gepoolte Referenz über alle Scans.
+    Alles in einem Array-Dictionary (direkt als .npz speicherbar):
+      cohorts (k), metrics (p), center/scale (k x p, robuste Standardisierung),
+      location (k x p), precision (k x p x p), n_fit (k)
+    Kohorten mit < min_size vollständigen Scans bekommen die gepoolte Referenz.
+    """
+    metrics = [m for m in metrics if m in df.columns and not df[m].isna().all()]
+    x_all = df[metrics].to_numpy(dtype=np.float64, na_value=np.nan)
+    complete = np.isfinite(x_all).all(axis=1)
+    cohorts = df['cohort'].to_numpy()
+    if complete.sum() <= len(metrics) + 1:
+        raise ValueError(f"Zu wenige vollständige Scans für die MCD-Schätzung: {complete.sum()}")
+
+    groups = [(POOLED, complete)] + [(c, complete & (cohorts == c)) for c in np.unique(cohorts)]
+    p = len(metrics)
+    center, scale = np.zeros((len(groups), p)), np.ones((len(groups), p))
+    location, precision = np.zeros((len(groups), p)), np.zeros((len(groups), p, p))
+    n_fit = np.zeros(len(groups), dtype=np.int64)
+
+    pooled_index = 0
+    for i, (name, rows) in enumerate(groups):
+        if name != POOLED and rows.sum() < min_size:
+            center[i], scale[i] = center[pooled_index], scale[pooled_index]
+            location[i], precision[i] = location[pooled_index], precision[pooled_index]
+            print(f"  {name}: {rows.sum()} vollständige Scans < {min_size} -> gepoolte Referenz")
+            continue
+        center[i], scale[i] = _robust_scale(x_all[rows])
+        fit = fast_mcd((x_all[rows] - center[i]) / scale[i], seed=seed)
+        location[i] = fit['location']
+        precision[i] = np.linalg.pinv(fit['covariance'], hermitian=True)
+        n_fit[i] = rows.sum()
+        print(f"  {name}: MCD über {rows.sum()} Scans ({fit['support'].sum()} im Support)")
+
+    return {
+        'cohorts': np.array([g[0] for g in groups], dtype=str),
+        'metrics': np.array(metrics, dtype=str),
+        'center': center, 'scale': scale,
+        'location': location, 'precision': precision,
+        'n_fit': n_fit,
+    }
+
+
+def save_reference(reference: Dict[str, np.ndarray], path: Path):
+    np.savez(path, **reference)
+
+
+def load_reference(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path) as data:
+        return {k: data[k] for k in data.files}
+
+
+def score_scans(df: pd.DataFrame, reference: Dict[str, np.ndarray], alpha: float = OUTLIER_ALPHA) -> pd.DataFrame:
+    """
+    Robuste Mahalanobis-Distanz jedes Scans zur Referenz seiner Kohorte (unbekannte Kohorten:
+    gepoolte Referenz), vektorisiert über alle Scans. Scans mit fehlenden Metriken: NaN.
+    """
+    metrics = list(reference['metrics'])
+    lookup = {c: i for i, c in enumerate(reference['cohorts'])}
+    pooled = lookup[POOLED]
+
+    x = df.reindex(columns=metrics).to_numpy(dtype=np.float64, na_value=np.nan)
+    index = np.array([lookup.get(c, pooled) for c in df['cohort'].to_numpy()], dtype=np.int64)
+
+    z = (x - reference['center'][index]) / reference['scale'][index] - reference['location'][index]
+    d2 = np.einsum('ni,nij,nj->n', z, reference['precision'][index], z)
+    p_value = stats.chi2.sf(d2, len(metrics))
+
+    return pd.DataFrame({
+        'filename': df['filename'].to_numpy(),
+        'cohort': df['cohort'].to_numpy(),
+        'reference': reference['cohorts'][index],
+        'mahalanobis_d2': d2,
+        'p_value': p_value,
+        'multivariate_outlier': p_value < alpha,
+    })
+
+
+@instrumented('qc.multivariate_outliers', items='df')
+def multivariate_outliers(df: pd.DataFrame, output_path: Path, refit: bool = False,
+                          reference_file: Optional[Path] = None) -> pd.DataFrame:
+    """
+    Lädt die gespeicherte MCD-Referenz (oder passt sie neu an, wenn sie fehlt, --refit-mcd
+    gesetzt ist oder eine Kohorte noch keine Referenz hat), bewertet alle Scans und schreibt
+    multivariate_scores.csv.
+    """
+    print("\n" + "="*80)
+    print("MULTIVARIATE AUSREISSER (ROBUSTE MAHALANOBIS-DISTANZ)")
+    print("="*80)
+    reference_file = Path(output_path) / REFERENCE_FILE if reference_file is None else Path(reference_file)
+
+    reference = None
+    if reference_file.exists() and not refit:
+        reference = load_reference(reference_file)
+        missing = set(df['cohort'].unique()) - set(reference['cohorts'])
+        if missing:
+            print(f"Keine Referenz für {', '.join(sorted(missing))} -> Neuanpassung")
+            reference = None
+        else:
+            print(f"✓ Gespeicherte Referenz: {reference_file}")
+
+    if reference is None:
+        print(f"\nMCD-Schätzung pro Kohorte über: {', '.join(m for m in MULTIVARIATE_METRICS if m in df.columns)}")
+        reference = fit_reference(df)
+        save_reference(reference, reference_file)
+        print(f"✓ Referenz gespeichert: {reference_file}")
+
+    scores = score_scans(df, reference)
+    scores.to_csv(Path(output_path) / 'multivariate_scores.csv', index=False)
+
+    outliers = scores[scores['multivariate_outlier']].sort_values('mahalanobis_d2', ascending=False)
+    print(f"\nMultivariate Ausreißer (p < {OUTLIER_ALPHA}): {len(outliers)} "
+          f"({len(outliers) / len(scores) * 100:.1f}% aller Scans)")
+    if not outliers.empty:
+        print(outliers.groupby('cohort').size().to_string())
+        print("\nTop 10:")
+        print(outliers.head(10)[['filename', 'cohort', 'mahalanobis_d2', 'p_value']].to_string(index=False))
+    print(f"\nScores gespeichert: {Path(output_path) / 'multivariate_scores.csv'}")
+    return scores
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Deklarative QC-Regeln für problematische Scans
+Jede Regel: Metrik + Stufen (Schwellenwert, Gewicht, Text), höchste Stufe zuerst.
+Ausgewertet wird spaltenweise mit NumPy-Masken - Severity, Issue-Texte und die
+Schwellenwert-Analyse entstehen in einem Durchlauf aus derselben Tabelle.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+#%% ========== KONFIGURATION ==========
+
+# Ein Scan überschreitet eine Stufe, wenn Wert > Schwellenwert (NaN = kein Problem).
+# Pro Regel zählt nur die höchste überschrittene Stufe.
+QC_RULES = [
+    {'metric': 'SurfaceEulerNumber_rating', 'description': 'topologische Qualität', 'threshold_format': '{:.1f}',
+     'tiers': [(5.0, 2, "Euler Rating sehr hoch ({value:.2f})"),
+               (4.0, 1, "Euler Rating erhöht ({value:.2f})")]},
+    {'metric': 'SurfaceDefectArea_rating', 'description': 'Oberflächendefekte', 'threshold_format': '{:.1f}',
+     'tiers': [(2.5, 1, "Defekt-Area Rating hoch ({value:.2f})")]},
+    {'metric': 'IQR_rating', 'description': 'Gesamtqualität', 'threshold_format': '{:.1f}',
+     'tiers': [(3.5, 2, "IQR sehr niedrig ({value:.2f})"),
+               (3.0, 1, "IQR niedrig ({value:.2f})")]},
+    {'metric': 'NCR', 'description': 'Rauschen', 'threshold_format': '{:.2f}',
+     'tiers': [(0.25, 2, "Sehr hohes Rauschen (NCR={value:.3f})"),
+               (0.20, 1, "Hohes Rauschen (NCR={value:.3f})")]},
+    {'metric': 'ICR', 'description': 'Feldinhomogenität', 'threshold_format': '{:.1f}',
+     'tiers': [(1.5, 2, "Sehr hohe Inhomogenität (ICR={value:.3f})"),
+               (1.0, 1, "Hohe Inhomogenität (ICR={value:.3f})")]},
+]
+
+#%% ========== FUNKTIONEN ==========
+
+def describe_rules(rules: List[Dict] = QC_RULES) -> List[str]:
+    """Kriterien-Zeilen für die Konsolenausgabe (niedrigste Stufe jeder Regel)"""
+    lines = []
+    for i, rule in enumerate(rules, start=1):
+        lowest = min(t[0] for t in rule['tiers'])
+        lines.append(f"  {i}. {rule['metric']} > {rule['threshold_format'].format(lowest)} ({rule['description']})")
+    return lines
+
+
+def describe_tiers(rules: List[Dict] = QC_RULES) -> List[str]:
+    """Eine Zeile pro Regel mit allen Stufen und ihrem Severity-Beitrag"""
+    lines = []
+    for rule in rules:
+        fmt = rule['threshold_format']
+        tiers = sorted(rule['tiers'], key=lambda t: t[0])
+        head = f"  • {rule['metric']} > {fmt.format(tiers[0][0])} (Severity +{tiers[0][1]}"
+        rest = ''.join(f", >{fmt.format(t[0])} = +{t[1]}" for t in tiers[1:])
+        lines.append(head + rest + ")")
+    return lines
+
+
+def evaluate_rules(df: pd.DataFrame, rules: List[Dict] = QC_RULES) -> Dict:
+    """
+    Wertet alle Regeln über ganze Spalten aus.
+
+    Rückgabe:
+        severity   : int-Array, Summe der Gewichte pro Scan
+        n_issues   : int-Array, Anzahl verletzter Regeln
+        issues     : object-Array, Issue-Texte ('; '-getrennt, Regel-Reihenfolge)
+        exceeds    : {(metric, threshold): Bool-Maske Wert > threshold} für alle Stufen
+    """
+    n = len(df)
+    severity = np.zeros(n, dtype=np.int64)
+    n_issues = np.zeros(n, dtype=np.int64)
+    issues = np.full(n, '', dtype=object)
+    exceeds = {}
+
+    for rule in rules:
+        metric = rule['metric']
+        if metric not in df.columns:
+            continue
+        values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        # Stufen von hoch nach niedrig: jede Zeile bekommt höchstens eine Stufe
+        taken = np.zeros(n, dtype=bool)
+        for threshold, weight, template in sorted(rule['tiers'], key=lambda t: -t[0]):
+            over = values > threshold
+            exceeds[(metric, threshold)] = over
+            hit = over & ~taken
+            taken |= over
+            if not hit.any():
+                continue
+            severity[hit] += weight
+            n_issues[hit] += 1
+
+            # Texte nur für die betroffenen Zeilen formatieren
+            texts = np.array([template.format(value=v) for v in values[hit]], dtype=object)
+            current = issues[hit]
+            issues[hit] = np.where(current == '', texts, current + '; ' + texts)
+
+    return {'severity': severity, 'n_issues': n_issues, 'issues': issues, 'exceeds': exceeds}
+
+
+def threshold_summary(result: Dict, n_total: int, rules: List[Dict] = QC_RULES) -> pd.DataFrame:
+    """Anzahl/Anteil Scans über jeder Stufe (aus den Masken von evaluate_rules)"""
+    rows = []
+    for rule in rules:
+        for threshold, _, _ in sorted(rule['tiers'], key=lambda t: t[0]):
+            over = result['exceeds'].get((rule['metric'], threshold))
+            if over is None:
+                continue
+            count = int(over.sum())
+            rows.append({
+                'Metric': rule['metric'],
+                'Threshold': f"> {rule['threshold_format'].format(threshold)}",
+                'Count': count,
+                'Percentage': f"{count / n_total * 100:.1f}%" if n_total else "0.0%"
+            })
+    return pd.DataFrame(rows)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kohorten-Tests auf gemeinsamen Rängen
+Jede Metrik wird genau einmal gerangt. Kruskal-Wallis, alle paarweisen Mann-Whitney-U
+Tests und Dunn-Post-hoc-Tests werden daraus vektorisiert abgeleitet (Gruppen x Werte
+Zählmatrix statt k² Einzeltests), inklusive Korrektur für multiples Testen.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+#%% ========== KONFIGURATION ==========
+
+ALPHA = 0.05
+
+# Korrektur der paarweisen p-Werte: 'holm', 'fdr_bh' oder 'bonferroni'
+CORRECTION = 'holm'
+
+#%% ========== FUNKTIONEN ==========
+
+def adjust_pvalues(p: np.ndarray, method: str = CORRECTION) -> np.ndarray:
+    """Holm, Benjamini-Hochberg (fdr_bh) oder Bonferroni, vektorisiert"""
+    p = np.asarray(p, dtype=np.float64)
+    m = len(p)
+    if m == 0:
+        return p
+    if method == 'bonferroni':
+        return np.minimum(p * m, 1.0)
+
+    order = np.argsort(p)
+    ranked = p[order]
+    if method == 'holm':
+        adjusted = np.maximum.accumulate((m - np.arange(m)) * ranked)
+    elif method == 'fdr_bh':
+        adjusted = np.minimum.accumulate((m / np.arange(m, 0, -1) * ranked[::-1]))[::-1]
+    else:
+        raise ValueError(f"Unbekannte Korrektur: {method}")
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+def _group_counts(values: np.ndarray, group_index: np.ndarray, n_groups: int):
+    """Zählmatrix C (Gruppen x eindeutige Werte) und Ränge (mit Mittelrängen bei Bindungen)"""
+    unique_values, value_index = np.unique(values, return_inverse=True)
+    counts = np.zeros((n_groups, len(unique_values)), dtype=np.float64)
+    np.add.at(counts, (group_index, value_index), 1.0)
+
+    # Mittelrang jedes eindeutigen Werts aus den Gesamthäufigkeiten
+    totals = counts.sum(axis=0)
+    value_rank = np.cumsum(totals) - (totals - 1) / 2.0
+    return counts, value_rank
+
+
+def cohort_tests(values: np.ndarray, groups: np.ndarray, group_order: List[str],
+                 correction: str = CORRECTION) -> Dict:
+    """
+    values/groups: Werte und Kohorte pro Scan (NaN werden ignoriert).
+    group_order  : Reihenfolge der Kohorten für die Paare.
+
+    Rückgabe: kruskal_h, kruskal_p und DataFrame 'pairs' mit U, p (Normalapproximation mit
+    Bindungs- und Stetigkeitskorrektur wie scipy.stats.mannwhitneyu), Dunn z/p und
+    korrigierten p-Werten.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.asarray(groups)
+    valid = ~np.isnan(values)
+
+    # nur Kohorten mit Daten
+    present = [g for g in group_order if np.any(valid & (groups == g))]
+    lookup = {g: i for i, g in enumerate(present)}
+    keep = valid & np.isin(groups, present)
+    x = values[keep]
+    g = np.array([lookup[v] for v in groups[keep]], dtype=np.int64)
+    k, n_total = len(present), len(x)
+    if k < 2:
+        return None
+
+    counts, value_rank = _group_counts(x, g, k)
+    n = counts.sum(axis=1)
+    rank_sum = counts @ value_rank
+    tie_totals = counts.sum(axis=0)
+    tie_sum = np.sum(tie_totals ** 3 - tie_totals)
+
+    # Kruskal-Wallis mit Bindungskorrektur
+    h = 12.0 / (n_total * (n_total + 1)) * np.sum(rank_sum ** 2 / n) - 3 * (n_total + 1)
+    tie_correction = 1 - tie_sum / (n_total ** 3 - n_total) if n_total > 1 else 1.0
+    h = h / tie_correction if tie_correction > 0 else np.nan
+    kruskal_p = stats.chi2.sf(h, k - 1)
+
+    # Alle paarweisen U: U_ij = sum_v C_i[v] * (#(j < v) + 0.5 * C_j[v])
+    below = np.cumsum(counts, axis=1) - counts
+    u = counts @ (below + 0.5 * counts).T
+
+    i_idx, j_idx = np.triu_indices(k, 1)
+    n1, n2 = n[i_idx], n[j_idx]
+    u1 = u[i_idx, j_idx]
+
+    # Bindungen innerhalb jedes Paars: sum_v (a+b)^3 - (a+b) für alle Paare aus Matrixprodukten
+    cube = (counts ** 3).sum(axis=1)
+    cross = 3 * (counts ** 2) @ counts.T
+    pair_ties = cube[i_idx] + cube[j_idx] + cross[i_idx, j_idx] + cross[j_idx, i_idx] - (n1 + n2)
+    n_pair = n1 + n2
+    mu = n1 * n2 / 2.0
+    sigma = np.sqrt(n1 * n2 / 12.0 * ((n_pair + 1) - pair_ties / (n_pair * (n_pair - 1))))
+    u_max = np.maximum(u1, n1 * n2 - u1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_mwu = (u_max - mu - 0.5) / sigma
+    p_mwu = np.clip(2 * stats.norm.sf(z_mwu), 0.0, 1.0)
+
+    # Dunn-Test auf den globalen Rängen
+    mean_rank = rank_sum / n
+    dunn_var = (n_total * (n_total + 1) / 12.0 - tie_sum / (12.0 * (n_total - 1))) * (1 / n1 + 1 / n2)
+    dunn_z = (mean_rank[i_idx] - mean_rank[j_idx]) / np.sqrt(dunn_var)
+    dunn_p = 2 * stats.norm.sf(np.abs(dunn_z))
+
+    pairs = pd.DataFrame({
+        'Cohort_1': np.array(present, dtype=object)[i_idx],
+        'Cohort_2': np.array(present, dtype=object)[j_idx],
+        'U_statistic': u1,
+        'p_value': p_mwu,
+        'p_adjusted': adjust_pvalues(p_mwu, correction),
+        'dunn_z': dunn_z,
+        'dunn_p': dunn_p,
+        'dunn_p_adjusted': adjust_pvalues(dunn_p, correction),
+    })
+    return {'kruskal_h': h, 'kruskal_p': kruskal_p, 'pairs': pairs}
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistenter QC-Store (SQLite) für die Metriken aus den CAT12 Report-XMLs
+Schlüssel ist der Pfad der Report-Datei zusammen mit mtime/Größe: bei jedem Lauf
+werden nur neue oder geänderte cat_*.xml geparst, der Rest kommt aus dem Store.
+"""
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from qc_ingest import METRIC_COLUMNS, N_WORKERS, find_reports, ingest_reports
+
+#%% ========== KONFIGURATION ==========
+
+# Standard-Speicherort (neben den QC-Ergebnissen)
+QC_STORE_PATH = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/qc_store.sqlite")
+
+# Spalten der Tabelle 'reports' (Metriken als REAL)
+KEY_COLUMNS = ['filepath', 'filename', 'cohort', 'mtime_ns', 'size', 'ok']
+
+#%% ========== FUNKTIONEN ==========
+
+class QCStore:
+    """
+    SQLite-Tabelle mit einer Zeile pro Report-Datei.
+    ok = 0 markiert nicht lesbare Dateien (werden erst nach Änderung erneut geparst).
+    """
+
+    def __init__(self, path: Path = QC_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path))
+        metric_sql = ', '.join(f'"{m}" REAL' for m in METRIC_COLUMNS)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS reports (filepath TEXT PRIMARY KEY, filename TEXT, cohort TEXT, "
+            f"mtime_ns INTEGER, size INTEGER, ok INTEGER, {metric_sql})")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_cohort ON reports (cohort)")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def signatures(self) -> dict:
+        """filepath -> (mtime_ns, size) aller gespeicherten Reports"""
+        rows = self.connection.execute("SELECT filepath, mtime_ns, size FROM reports")
+        return {path: (mtime, size) for path, mtime, size in rows}
+
+    def upsert(self, rows: List[tuple]):
+        """Zeilen in der Reihenfolge KEY_COLUMNS + METRIC_COLUMNS einfügen/ersetzen"""
+        columns = KEY_COLUMNS + METRIC_COLUMNS
+        placeholders = ', '.join('?' * len(columns))
+        names = ', '.join(f'"{c}"' for c in columns)
+        with self.connection:
+            self.connection.executemany(f"INSERT OR REPLACE INTO reports ({names}) VALUES ({placeholders})", rows)
+
+    def remove(self, filepaths: List[str]):
+        with self.connection:
+            self.connection.executemany("DELETE FROM reports WHERE filepath = ?", [(p,) for p in filepaths])
+
+    def load(self, cohorts: Optional[List[str]] = None) -> pd.DataFrame:
+        """Lesbare Reports als DataFrame (Spalten wie collect_data_from_cohorts)"""
+        names = ', '.join(f'"{c}"' for c in ['filename', 'filepath'] + METRIC_COLUMNS + ['cohort'])
+        query = f"SELECT {names} FROM reports WHERE ok = 1"
+        params = []
+        if cohorts is not None:
+            query += f" AND cohort IN ({', '.join('?' * len(cohorts))})"
+            params = list(cohorts)
+        df = pd.read_sql_query(query + " ORDER BY cohort, filepath", self.connection, params=params)
+        df[METRIC_COLUMNS] = df[METRIC_COLUMNS].astype(np.float64)
+        return df
+
+
+def update_store(store: QCStore, xml_files: List[Path], file_cohorts: List[str],
+                 n_workers: int = N_WORKERS, prune_cohorts: Optional[List[str]] = None) -> int:
+    """
+    Parst nur Reports, deren (mtime_ns, size) sich gegenüber dem Store geändert hat.
+    prune_cohorts: Einträge dieser Kohorten, deren Datei nicht mehr existiert, werden gelöscht.
+    Rückgabe: Anzahl neu geparster Dateien
+    """
+    known = store.signatures()
+    changed, signature_of, cohort_of = [], {}, {}
+    for path, cohort in zip(xml_files, file_cohorts):
+        st = os.stat(path)
+        key = str(path)
+        signature_of[key] = (st.st_mtime_ns, st.st_size)
+        cohort_of[key] = cohort
+        if known.get(key) != signature_of[key]:
+            changed.append(path)
+
+    if prune_cohorts is not None:
+        placeholders = ', '.join('?' * len(prune_cohorts))
+        stored = store.connection.execute(
+            f"SELECT filepath FROM reports WHERE cohort IN ({placeholders})", list(prune_cohorts))
+        stale = [p for (p,) in stored if p not in signature_of]
+        if stale:
+            print(f"Entferne {len(stale)} Reports, die nicht mehr existieren")
+            store.remove(stale)
+
+    if not changed:
+        return 0
+
+    print(f"Parse {len(changed)} neue/geänderte Reports ({len(xml_files) - len(changed)} aus dem Store)")
+    columns = ingest_reports(changed, n_workers=n_workers)
+    parsed = set(columns['filepath'].tolist())
+    metrics = np.column_stack([columns[m] for m in METRIC_COLUMNS]) if len(parsed) else None
+
+    rows = []
+    for i, path in enumerate(columns['filepath'].tolist()):
+        values = [None if np.isnan(v) else float(v) for v in metrics[i]]
+        rows.append((path, columns['filename'][i], cohort_of[path], *signature_of[path], 1, *values))
+    for path in map(str, changed):
+        if path not in parsed:
+            rows.append((path, os.path.basename(path), cohort_of[path], *signature_of[path], 0,
+                         *([None] * len(METRIC_COLUMNS))))
+    store.upsert(rows)
+    return len(changed)
+
+
+def collect_with_store(base_path: Path, cohorts: List[str], store_path: Path = QC_STORE_PATH,
+                       n_workers: int = N_WORKERS) -> pd.DataFrame:
+    """Reports finden, Store aktualisieren und die Kohorten aus dem Store laden"""
+    xml_files, file_cohorts = find_reports(base_path, cohorts)
+    store = QCStore(store_path)
+    try:
+        update_store(store, xml_files, file_cohorts, n_workers=n_workers, prune_cohorts=cohorts)
+        return store.load(cohorts)
+    finally:
+        store.close()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Schwellenwert-Sweep für die QC-Ausschlusskriterien
+1. Marginal: Anteil ausgeschlossener Scans pro Kohorte über ein Gitter von Schwellenwerten
+   je Metrik (sortierte Werte + searchsorted, kein erneutes Auswerten pro Schwelle)
+2. Gemeinsam: alle Kombinationen skalierter Regel-Schwellen (QC_RULES) x Severity-Cut-offs
+   -> ausgeschlossener Anteil pro Kohorte als Fläche (.npz + .csv)
+"""
+
+import itertools
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from qc_rules import QC_RULES
+
+#%% ========== KONFIGURATION ==========
+
+# Anzahl Gitterpunkte pro Metrik im marginalen Sweep
+N_THRESHOLDS = 200
+
+# Skalierungsfaktoren der Regel-Schwellen im gemeinsamen Sweep (1.0 = aktuelle QC_RULES)
+SCALE_FACTORS = np.round(np.linspace(0.8, 1.2, 5), 3)
+
+# Severity-Cut-offs (Scan ausgeschlossen wenn Severity >= Cut-off)
+SEVERITY_CUTOFFS = [1, 2, 3, 4]
+
+# Kombinationen pro Block beim gemeinsamen Sweep
+COMBO_BLOCK = 4096
+
+#%% ========== FUNKTIONEN ==========
+
+def marginal_sweep(df: pd.DataFrame, metrics: List[str], n_thresholds: int = N_THRESHOLDS) -> pd.DataFrame:
+    """
+    Pro Metrik und Kohorte: Anteil Scans mit Wert > Schwelle für n_thresholds Schwellen
+    zwischen Minimum und Maximum der Metrik. Eine Sortierung pro Kohorte, dann searchsorted.
+    """
+    cohorts = df['cohort'].to_numpy()
+    cohort_names = np.unique(cohorts)
+    frames = []
+
+    for metric in metrics:
+        if metric not in df.columns:
+            continue
+        values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan)
+        if np.isnan(values).all():
+            continue
+        grid = np.linspace(np.nanmin(values), np.nanmax(values), n_thresholds)
+
+        for cohort in cohort_names:
+            in_cohort = cohorts == cohort
+            sorted_values = np.sort(values[in_cohort & ~np.isnan(values)])
+            n_excluded = len(sorted_values) - np.searchsorted(sorted_values, grid, side='right')
+            frames.append(pd.DataFrame({
+                'metric': metric, 'threshold': grid, 'cohort': cohort,
+                'n_excluded': n_excluded, 'n_total': int(in_cohort.sum()),
+                'excluded_fraction': n_excluded / in_cohort.sum()
+            }))
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def _rule_contributions(values: np.ndarray, rule: Dict, factors: np.ndarray) -> np.ndarray:
+    """(n_factors x n) Gewicht der höchsten überschrittenen Stufe bei skalierten Schwellen"""
+    contribution = np.zeros((len(factors), len(values)), dtype=np.int8)
+    for threshold, weight, _ in sorted(rule['tiers'], key=lambda t: t[0]):
+        over = values[None, :] > (threshold * factors)[:, None]
+        contribution[over] = weight  # aufsteigende Stufen: höhere überschreiben
+    return contribution
+
+
+def joint_sweep(df: pd.DataFrame, rules: List[Dict] = QC_RULES, factors: np.ndarray = SCALE_FACTORS,
+                cutoffs: List[int] = SEVERITY_CUTOFFS, block: int = COMBO_BLOCK) -> Dict[str, np.ndarray]:
+    """
+    Ausgeschlossener Anteil pro Kohorte für alle Kombinationen (ein Faktor pro Regel) x Cut-offs.
+
+    Scans mit identischem Beitrags-Profil über alle Regeln/Faktoren werden zusammengefasst,
+    die Severity wird blockweise per Broadcasting berechnet und über eine
+    Kohorten-Zählmatrix (Profile x Kohorten) per Matrixprodukt aggregiert.
+    """
+    rules = [r for r in rules if r['metric'] in df.columns]
+    factors = np.asarray(factors, dtype=np.float64)
+    n_rules, n_factors = len(rules), len(factors)
+
+    # Profile: (n x n_rules*n_factors) Beiträge -> eindeutige Zeilen
+    contributions = np.vstack([
+        _rule_contributions(df[r['metric']].to_numpy(dtype=np.float64, na_value=np.nan), r, factors)
+        for r in rules]).T
+    profiles, inverse = np.unique(contributions, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    cohort_names, cohort_index = np.unique(df['cohort'].to_numpy(), return_inverse=True)
+    counts = np.zeros((len(profiles), len(cohort_names)), dtype=np.float64)
+    np.add.at(counts, (inverse, cohort_index), 1.0)
+    totals = counts.sum(axis=0)
+
+    # profile_rule[r]: (n_profiles x n_factors) Beitrag von Regel r je Faktor
+    profile_rule = profiles.reshape(len(profiles), n_rules, n_factors).transpose(1, 0, 2).astype(np.int16)
+
+    combos = np.array(list(itertools.product(range(n_factors), repeat=n_rules)), dtype=np.int64)
+    fraction = np.zeros((len(combos), len(cutoffs), len(cohort_names)), dtype=np.float32)
+    for start in range(0, len(combos), block):
+        chunk = combos[start:start + block]
+        severity = np.zeros((len(chunk), len(profiles)), dtype=np.int16)
+        for r in range(n_rules):
+            severity += profile_rule[r][:, chunk[:, r]].T
+        for c, cutoff in enumerate(cutoffs):
+            fraction[start:start + len(chunk), c] = ((severity >= cutoff).astype(np.float64) @ counts) / totals
+
+    print(f"Gemeinsamer Sweep: {len(combos)} Kombinationen x {len(cutoffs)} Cut-offs, "
+          f"{len(df)} Scans -> {len(profiles)} Profile")
+    return {
+        'metrics': np.array([r['metric'] for r in rules]),
+        'factors': factors,
+        'combos': combos,
+        'cutoffs': np.asarray(cutoffs),
+        'cohorts': cohort_names.astype(str),
+        'n_total': totals,
+        'excluded_fraction': fraction,
+    }
+
+
+def joint_sweep_frame(result: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """Lange Tabelle: eine Zeile pro (Kombination, Cut-off) mit Spalten pro Kohorte"""
+    n_combos, n_cutoffs, _ = result['excluded_fraction'].shape
+    df = pd.DataFrame(result['factors'][np.repeat(result['combos'], n_cutoffs, axis=0)],
+                      columns=[f'factor_{m}' for m in result['metrics']])
+    df['severity_cutoff'] = np.tile(result['cutoffs'], n_combos)
+    fractions = result['excluded_fraction'].reshape(n_combos * n_cutoffs, -1)
+    for i, cohort in enumerate(result['cohorts']):
+        df[f'excluded_{cohort}'] = fractions[:, i]
+    df['excluded_overall'] = (fractions * result['n_total']).sum(axis=1) / result['n_total'].sum()
+    return df
+
+
+def run_sweep(df: pd.DataFrame, output_path: Path, rules: List[Dict] = QC_RULES,
+              factors: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Marginaler + gemeinsamer Sweep, schreibt qc_sweep_marginal.csv, qc_sweep_joint.npz/.csv"""
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    marginal = marginal_sweep(df, [r['metric'] for r in rules])
+    marginal.to_csv(output_path / 'qc_sweep_marginal.csv', index=False)
+    print(f"✓ Marginaler Sweep: {output_path / 'qc_sweep_marginal.csv'}")
+
+    result = joint_sweep(df, rules, SCALE_FACTORS if factors is None else factors)
+    np.savez_compressed(output_path / 'qc_sweep_joint.npz', **result)
+    joint_sweep_frame(result).to_csv(output_path / 'qc_sweep_joint.csv', index=False)
+    print(f"✓ Gemeinsamer Sweep: {output_path / 'qc_sweep_joint.npz'} (+ .csv)")
+    return result
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inhaltliche Beinahe-Duplikate unter den T1-Scans (über alle Quellordner)
+Derselbe Scan liegt teils mehrfach vor - anders komprimiert, umorientiert oder mit anderer
+Intensitätsskalierung (z.B. whiteCAT in whitecatnii, whiteCAT_updt, all_whitecat_gm_nii).
+Solche Kopien dürfen nicht gleichzeitig in Trainings- und Testdaten des normativen Modells landen.
+
+- Signatur pro Scan: NIfTI-Daten werden schichtweise gelesen (auch .nii.gz gestreamt) und
+  blockweise auf ein grobes Gitter gemittelt (nie ein ganzes Volume im Speicher), dann
+  nach RAS umorientiert (Affine aus sform/qform), auf die Kopf-Bounding-Box zugeschnitten,
+  auf SIGNATURE_SIZE³ skaliert und rang-normiert (robust gegen monotone Umskalierung)
+- Signaturen parallel in Worker-Prozessen, Cache pro Datei (Pfad + mtime + Größe)
+- Paarsuche: nächste Nachbarn im cKDTree über die Hauptkomponenten-Projektion
+  (O(n log n) statt aller Paare), Kandidaten werden mit der vollen Signatur geprüft
+
+    python scripts/near_duplicates.py                           # alle konfigurierten Quellordner
+    python scripts/near_duplicates.py --paths valid_paths_all_data.txt --min-corr 0.95
+"""
+
+import argparse
+import gzip
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import (ADDITIONAL_SEARCH_PATHS, PRIMARY_COHORT_FOLDERS, RAW_DATA_ROOT,  # noqa: E402
+                    SECONDARY_COHORT_FOLDERS, find_nii_files, normalize_subject_id)
+from instrumentation import instrumented  # noqa: E402
+
+#%% ========== KONFIGURATION ==========
+
+# Berichte + Signatur-Cache
+REPORT_PATH = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/output/duplicates")
+CACHE_FILE = 'signatures.npz'
+
+# Zwischengitter (Blockmittel beim Lesen) und Kantenlänge der Signatur
+COARSE_SIZE = 64
+SIGNATURE_SIZE = 12
+
+# Bei Änderungen an der Signatur erhöhen -> Cache wird verworfen
+SIGNATURE_VERSION = 1
+
+# Vordergrund (Kopf) = Blöcke über diesem Anteil des 99. Perzentils
+FOREGROUND_FRACTION = 0.15
+
+# Paare ab dieser (Rang-)Korrelation der Signaturen gelten als Duplikat
+MIN_CORRELATION = 0.97
+IDENTICAL_CORRELATION = 0.9999
+
+# KD-Baum: Hauptkomponenten (aus höchstens PCA_SAMPLE Scans geschätzt) und Nachbarn pro Scan
+N_COMPONENTS = 10
+PCA_SAMPLE = 1000
+N_NEIGHBOURS = 8
+
+# Bytes pro gelesenem Block (mehrere Schichten)
+CHUNK_BYTES = 8 << 20
+
+N_WORKERS = os.cpu_count() or 1
+
+# NIfTI-1 datatype -> NumPy dtype
+NIFTI_DTYPES = {2: 'u1', 4: 'i2', 8: 'i4', 16: 'f4', 64: 'f8', 256: 'i1', 512: 'u2', 768: 'u4'}
+
+#%% ========== FUNKTIONEN ==========
+
+def read_header(f) -> Dict:
+    """NIfTI-1 Header (348 Bytes) -> Dimensionen, Datentyp, Skalierung, Daten-Offset, Orientierung"""
+    raw = f.read(348)
+    if len(raw) < 348:
+        raise ValueError("Datei kürzer als ein NIfTI-1 Header")
+    for endian in '<>':
+        if struct.unpack(endian + 'i', raw[:4])[0] == 348:
+            break
+    else:
+        raise ValueError("kein NIfTI-1 Header (NIfTI-2 / Analyze werden nicht unterstützt)")
+
+    def unpack(fmt, offset):
+        return struct.unpack_from(endian + fmt, raw, offset)
+
+    dim = unpack('8h', 40)
+    datatype = unpack('h', 70)[0]
+    if datatype not in NIFTI_DTYPES:
+        raise ValueError(f"Datentyp {datatype} nicht unterstützt")
+    return {
+        'shape': tuple(int(d) for d in dim[1:4]),
+        'dtype': np.dtype(endian + NIFTI_DTYPES[datatype]),
+        'pixdim': unpack('8f', 76),
+        'vox_offset': int(unpack('f', 108)[0]),
+        'scl': unpack('2f', 112),
+        'qform_code': unpack('h', 252)[0], 'sform_code': unpack('h', 254)[0],
+        'quatern': unpack('3f', 256),
+        'srow': np.array(unpack('12f', 280), dtype=np.float64).reshape(3, 4),
+    }
+
+
+def voxel_axes(header: Dict) -> np.ndarray:
+    """3x3 Richtungsmatrix (Spalten = Voxelachsen in Weltkoordinaten) aus sform, qform oder pixdim"""
+    pixdim = np.array(header['pixdim'][1:4], dtype=np.float64)
+    if header['sform_code'] > 0:
+        return header['srow'][:, :3]
+    if header['qform_code'] > 0:
+        b, c, d = header['quatern']
+        a = np.sqrt(max(0.0, 1.0 - b * b - c * c - d * d))
+        rotation = np.array([
+            [a * a + b * b - c * c - d * d, 2 * (b * c - a * d), 2 * (b * d + a * c)],
+            [2 * (b * c + a * d), a * a + c * c - b * b - d * d, 2 * (c * d - a * b)],
+            [2 * (b * d - a * c), 2 * (c * d + a * b), a * a + d * d - b * b - c * c]])
+        qfac = -1.0 if header['pixdim'][0] < 0 else 1.0
+        return rotation * (pixdim * [1, 1, qfac])
+    return np.diag(pixdim)
+
+
+def ras_orientation(axes: np.ndarray) -> Tuple[List[int], List[int]]:
+    """Voxelachse -> Weltachse (R, A, S) und Vorzeichen; stärkste Komponenten zuerst vergeben"""
+    strength = np.abs(axes)
+    world, sign = [None] * 3, [1] * 3
+    for flat in np.argsort(-strength, axis=None):
+        w, v = divmod(int(flat), 3)
+        if world[v] is None and w not in world:
+            world[v], sign[v] = w, (1 if axes[w, v] >= 0 else -1)
+    return world, sign
+
+
+def _bin_starts(n: int, bins: int) -> np.ndarray:
+    """Blockgrenzen, spiegelsymmetrisch (gespiegelte Achse -> gespiegelte Blöcke)"""
+    k = np.arange(bins)
+    starts = np.where(k <= bins // 2, k * n // bins, n - (bins - k) * n // bins)
+    return np.unique(starts[starts < n])
+
+
+def coarse_volume(path: str, coarse_size: int = COARSE_SIZE, chunk_bytes: int = CHUNK_BYTES) -> Tuple[np.ndarray, Dict]:
+    """
+    Blockmittel auf ein grobes Gitter (Achsen x, y, z wie in der Datei), die Schichten werden
+    in Blöcken gelesen; nur das erste Volume bei 4D-Daten
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        header = read_header(f)
+        nx, ny, nz = (max(1, n) for n in header['shape'])
+        if header['vox_offset'] > 348:
+            f.read(header['vox_offset'] - 348)  # Extensions überspringen (gzip: kein seek)
+
+        starts = [_bin_starts(n, coarse_size) for n in (nx, ny, nz)]
+        z_bin = np.searchsorted(starts[2], np.arange(nz), side='right') - 1
+        sums = np.zeros((len(starts[2]), len(starts[1]), len(starts[0])), dtype=np.float64)  # (z, y, x)
+
+        slice_bytes = nx * ny * header['dtype'].itemsize
+        per_chunk = max(1, chunk_bytes // slice_bytes)
+        slope, inter = header['scl']
+        for z0 in range(0, nz, per_chunk):
+            k = min(per_chunk, nz - z0)
+            data = f.read(slice_bytes * k)
+            if len(data) < slice_bytes * k:
+                raise ValueError("Datei abgeschnitten")
+            chunk = np.frombuffer(data, dtype=header['dtype']).reshape(k, ny, nx).astype(np.float32)
+            if slope not in (0.0, 1.0) and np.isfinite(slope):
+                chunk = chunk * np.float32(slope) + np.float32(inter)
+            np.nan_to_num(chunk, copy=False)
+            reduced = np.add.reduceat(np.add.reduceat(chunk, starts[0], axis=2), starts[1], axis=1)
+            np.add.at(sums, z_bin[z0:z0 + k], reduced)
+
+    counts = [np.diff(np.append(s, n)) for s, n in zip(starts, (nx, ny, nz))]
+    volume = sums / (counts[2][:, None, None] * counts[1][None, :, None] * counts[0][None, None, :])
+    return volume.transpose(2, 1, 0).astype(np.float32), header
+
+
+def scan_signature(path: str, size: int = SIGNATURE_SIZE) -> np.ndarray:
+    """Orientierungs-normierte, rang-normierte Signatur (size³ float32, Länge 1)"""
+    from scipy import ndimage
+
+    volume, header = coarse_volume(path)
+    world, sign = ras_orientation(voxel_axes(header))
+    volume = volume.transpose([world.index(w) for w in range(3)])
+    for w in range(3):
+        if sign[world.index(w)] < 0:
+            volume = np.flip(volume, axis=w)
+
+    # auf den Kopf zuschneiden (FOV/Padding unterscheiden sich zwischen Exporten)
+    mask = volume > FOREGROUND_FRACTION * np.percentile(volume, 99)
+    if mask.any():
+        bounds = [np.flatnonzero(mask.any(axis=tuple(a for a in range(3) if a != axis))) for axis in range(3)]
+        volume = volume[tuple(slice(b[0], b[-1] + 1) for b in bounds)]
+    signature = ndimage.zoom(volume, [size / n for n in volume.shape], order=1, grid_mode=True, mode='nearest')
+
+    # mittlere Ränge (Hintergrund-Bindungen dürfen nicht von der Voxel-Reihenfolge abhängen)
+    _, inverse, counts = np.unique(signature.ravel(), return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2)[inverse].astype(np.float32)
+    ranks -= ranks.mean()
+    norm = np.linalg.norm(ranks)
+    return ranks / norm if norm > 0 else ranks
+
+
+def _signature_or_none(path: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """Worker: Signatur oder Fehlermeldung"""
+    try:
+        return scan_signature(path), None
+    except (OSError, EOFError, ValueError, struct.error) as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def load_cache(cache_path: Path) -> Dict[str, Tuple[int, int, np.ndarray]]:
+    if not cache_path.exists():
+        return {}
+    cache = np.load(cache_path, allow_pickle=False)
+    if int(cache['version']) != SIGNATURE_VERSION or cache['signatures'].shape[1] != SIGNATURE_SIZE ** 3:
+        return {}
+    return {p: (int(m), int(s), sig) for p, m, s, sig in
+            zip(cache['paths'], cache['mtimes'], cache['sizes'], cache['signatures'])}
+
+
+@instrumented('duplicates.compute_signatures', items='paths')
+def compute_signatures(paths: List[str], cache_path: Optional[Path] = None,
+                       n_workers: int = N_WORKERS) -> Tuple[List[str], np.ndarray]:
+    """Signaturen aller Scans (aus dem Cache, wenn Datei unverändert); nicht lesbare Scans fallen weg"""
+    cache = load_cache(cache_path) if cache_path else {}
+    stats = {p: os.stat(p) for p in paths}
+    todo = [p for p in paths if p not in cache or cache[p][:2] != (stats[p].st_mtime_ns, stats[p].st_size)]
+    recompute = set(todo)
+    print(f"Signaturen: {len(paths) - len(todo)} aus dem Cache, {len(todo)} neu berechnen ({n_workers} Prozesse)")
+
+    fresh = {}
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for i, (path, (signature, error)) in enumerate(zip(todo, pool.map(_signature_or_none, todo, chunksize=4)), 1):
+            if error:
+                print(f"⚠️  {path}: {error}")
+            else:
+                fresh[path] = signature
+            if i % 500 == 0:
+                print(f"  {i}/{len(todo)}")
+
+    valid, signatures = [], []
+    for p in paths:
+        signature = fresh.get(p) if p in recompute else cache[p][2]
+        if signature is not None:
+            valid.append(p)
+            signatures.append(signature)
+    matrix = np.vstack(signatures) if signatures else np.empty((0, SIGNATURE_SIZE ** 3), dtype=np.float32)
+
+    if cache_path:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(cache_path, version=SIGNATURE_VERSION, paths=np.array(valid, dtype=str),
+                 mtimes=np.array([stats[p].st_mtime_ns for p in valid], dtype=np.int64),
+                 sizes=np.array([stats[p].st_size for p in valid], dtype=np.int64), signatures=matrix)
+    return valid, matrix
+
+
+def _verify(signatures: np.ndarray, pairs: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    """Korrelation der Kandidatenpaare auf der vollen Signatur (in Paketen, wenig Speicher)"""
+    corr = np.empty(len(pairs), dtype=np.float32)
+    for start in range(0, len(pairs), chunk):
+        a, b = pairs[start:start + chunk, 0], pairs[start:start + chunk, 1]
+        corr[start:start + chunk] = np.einsum('ij,ij->i', signatures[a], signatures[b])
+    return corr
+
+
+@instrumented('duplicates.find_pairs', items=len)
+def find_pairs(signatures: np.ndarray, min_corr: float = MIN_CORRELATION, n_components: int = N_COMPONENTS,
+               n_neighbours: int = N_NEIGHBOURS, seed: int = 0) -> pd.DataFrame:
+    """
+    Alle Paare mit Korrelation >= min_corr (Signaturen haben Länge 1: |a-b|² = 2(1-r)).
+    Kandidaten sind die n_neighbours nächsten Nachbarn jedes Scans im KD-Baum über die
+    Hauptkomponenten-Projektion (O(n log n) statt aller n² Paare); sie werden mit der vollen
+    Signatur geprüft. Sind alle Nachbarn eines Scans bestätigte Duplikate, wird er mit
+    doppelt so vielen Nachbarn erneut abgefragt.
+    """
+    from scipy.spatial import cKDTree
+
+    n = len(signatures)
+    if n < 2:
+        return pd.DataFrame(columns=['a', 'b', 'correlation'])
+    mean = signatures.mean(axis=0)
+    sample = np.random.default_rng(seed).choice(n, min(n, PCA_SAMPLE), replace=False)
+    _, _, vt = np.linalg.svd(signatures[sample] - mean, full_matrices=False)
+    projected = (signatures - mean) @ vt[:min(n_components, len(vt))].T
+    tree = cKDTree(projected)
+
+    found, n_candidates = {}, 0
+    query, k = np.arange(n), n_neighbours
+    while len(query):
+        k = min(k, n - 1)
+        _, neighbours = tree.query(projected[query], k=k + 1)
+        candidates = np.column_stack([np.repeat(query, k), neighbours[:, 1:].ravel()])
+        candidates = np.unique(np.sort(candidates, axis=1), axis=0)
+        candidates = candidates[candidates[:, 0] != candidates[:, 1]]
+        corr = _verify(signatures, candidates)
+        n_candidates += len(candidates)
+        keep = corr >= min_corr
+        found.update(zip(map(tuple, candidates[keep]), corr[keep]))
+
+        # Scans, deren Nachbarn alle Duplikate sind: es kann weitere geben
+        hits = np.bincount(candidates[keep].ravel(), minlength=n)
+        query = query[hits[query] >= k] if k < n - 1 else query[:0]
+        k *= 2
+
+    print(f"Kandidaten aus dem KD-Baum: {n_candidates}, bestätigt: {len(found)}")
+    pairs = np.array(list(found), dtype=int).reshape(-1, 2)
+    return pd.DataFrame({'a': pairs[:, 0], 'b': pairs[:, 1],
+                         'correlation': np.array(list(found.values()), dtype=np.float32)})
+
+
+def duplicate_clusters(n: int, pairs: pd.DataFrame) -> np.ndarray:
+    """Zusammenhangskomponenten der Duplikat-Paare (Union-Find), -1 = kein Duplikat"""
+    parent = np.arange(n)
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in zip(pairs['a'], pairs['b']):
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    roots = np.array([root(i) for i in range(n)])
+    in_pair = np.zeros(n, dtype=bool)
+    in_pair[pairs['a'].to_numpy(dtype=int)] = in_pair[pairs['b'].to_numpy(dtype=int)] = True
+    _, cluster = np.unique(roots[in_pair], return_inverse=True)
+    labels = np.full(n, -1)
+    labels[in_pair] = cluster
+    return labels
+
+
+def describe_pairs(paths: List[str], pairs: pd.DataFrame) -> pd.DataFrame:
+    """Pfade, Quellordner und Subject-IDs zu den Paaren"""
+    ids = normalize_subject_id(pd.Series(paths, dtype=str)).to_numpy()
+    folders = np.array([os.path.basename(os.path.dirname(p)) for p in paths])
+    a, b = pairs['a'].to_numpy(dtype=int), pairs['b'].to_numpy(dtype=int)
+    out = pd.DataFrame({
+        'path_a': np.array(paths)[a], 'path_b': np.array(paths)[b],
+        'folder_a': folders[a], 'folder_b': folders[b], 'subject_a': ids[a], 'subject_b': ids[b],
+        'correlation': pairs['correlation'].round(5).to_numpy(),
+    })
+    out['same_subject'] = out['subject_a'] == out['subject_b']
+    out['identical'] = out['correlation'] >= IDENTICAL_CORRELATION
+    return out.sort_values('correlation', ascending=False, ignore_index=True)
+
+
+def default_scan_paths() -> List[str]:
+    """Alle NIfTIs aus den primären, sekundären und zusätzlichen Quellordnern (wie config.py)"""
+    folders = [Path(RAW_DATA_ROOT) / f for f in PRIMARY_COHORT_FOLDERS + SECONDARY_COHORT_FOLDERS]
+    folders += [Path(p) for p in ADDITIONAL_SEARCH_PATHS]
+    return sorted(str(p) for folder in folders if folder.is_dir() for p in find_nii_files(folder))
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inhaltliche Beinahe-Duplikate unter den T1-Scans finden")
+    parser.add_argument('--paths', type=Path, default=None,
+                        help="Liste der Scans (eine NIfTI pro Zeile), sonst alle konfigurierten Quellordner")
+    parser.add_argument('--report', type=Path, default=REPORT_PATH)
+    parser.add_argument('--min-corr', type=float, default=MIN_CORRELATION)
+    parser.add_argument('--workers', type=int, default=N_WORKERS)
+    parser.add_argument('--no-cache', action='store_true', help="alle Signaturen neu berechnen")
+    args = parser.parse_args()
+
+    print("="*80)
+    print("BEINAHE-DUPLIKATE (BILDINHALT)")
+    print("="*80)
+    if args.paths:
+        paths = [line.strip() for line in open(args.paths) if line.strip()]
+    else:
+        paths = default_scan_paths()
+    paths = [p for p in dict.fromkeys(paths) if os.path.exists(p)]
+    print(f"{len(paths)} Scans")
+
+    args.report.mkdir(parents=True, exist_ok=True)
+    paths, signatures = compute_signatures(paths, None if args.no_cache else args.report / CACHE_FILE, args.workers)
+    index_pairs = find_pairs(signatures, args.min_corr)
+    clusters = duplicate_clusters(len(paths), index_pairs)
+    pairs = describe_pairs(paths, index_pairs)
+    members = pd.DataFrame({'cluster': clusters, 'path': paths,
+                            'folder': [os.path.basename(os.path.dirname(p)) for p in paths],
+                            'subject': normalize_subject_id(pd.Series(paths, dtype=str)).to_numpy()})
+    members = members[members['cluster'] >= 0].sort_values(['cluster', 'path'])
+
+    pairs.to_csv(args.report / 'near_duplicate_pairs.csv', index=False)
+    members.to_csv(args.report / 'near_duplicate_clusters.csv', index=False)
+
+    n_clusters = members['cluster'].nunique()
+    renamed = pairs[~pairs['same_subject']]
+    print(f"\n✓ {len(pairs)} Paare in {n_clusters} Gruppen "
+          f"({int(pairs['identical'].sum())} praktisch identisch, {int((~pairs['identical']).sum())} verändert)")
+    if len(renamed):
+        print(f"⚠️  {len(renamed)} Paare mit unterschiedlicher Subject-ID (Gefahr für Train/Test-Trennung):")
+        print(renamed[['subject_a', 'folder_a', 'subject_b', 'folder_b', 'correlation']].head(20).to_string(index=False))
+    if len(pairs):
+        by_folder = pairs.groupby(['folder_a', 'folder_b']).size().sort_values(ascending=False)
+        print("\nPaare pro Ordner-Kombination:")
+        print(by_folder.head(15).to_string())
+    print(f"\n✓ Berichte gespeichert in: {args.report}")
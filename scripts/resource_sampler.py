@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ressourcen-Sampler für einen laufenden MATLAB/CAT12-Prozess (ein Subject)
+Liest alle --interval Sekunden /proc des Prozessbaums (Prozess + alle Nachfahren):
+RSS-Summe, größtes VmHWM, CPU-Zeit, Anzahl Prozesse. Schreibt eine JSONL-Datei pro Subject
+(start, sample..., summary) - auch bei SIGTERM (SLURM-Timeout) wird die Zusammenfassung
+geschrieben. Nur Standardbibliothek, damit der Sampler selbst kaum Speicher braucht.
+Auswertung: scripts/resource_sizing.py
+
+    matlab ... > "$log_file" 2>&1 &
+    python3 scripts/resource_sampler.py --pid $! --subject "$subject_name" --input "$subject_nifti" \\
+        --log "$log_file" --out "$log_path/resources/${subject_name}.jsonl"
+"""
+
+import argparse
+import gzip
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+#%% ========== KONFIGURATION ==========
+
+# Sekunden zwischen zwei Messungen (CAT12 läuft ~2-3 h pro Subject)
+INTERVAL = 10
+
+# Erfolgsmeldung am Ende des MATLAB-Logs (wie im SLURM-Skript)
+SUCCESS_MARKER = "CAT12 surface analysis and ROI extraction completed successfully"
+
+# SLURM-Variablen, die mitgeschrieben werden
+SLURM_FIELDS = ['SLURM_JOB_ID', 'SLURM_ARRAY_JOB_ID', 'SLURM_ARRAY_TASK_ID', 'SLURM_MEM_PER_NODE',
+                'SLURM_CPUS_PER_TASK', 'SLURM_JOB_PARTITION']
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+#%% ========== FUNKTIONEN ==========
+
+def read_stat(pid: int) -> Optional[Dict]:
+    """/proc/<pid>/stat -> ppid, Zustand, CPU-Sekunden, Startzeit (None, wenn der Prozess weg ist)"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            data = f.read()
+    except OSError:
+        return None
+    fields = data[data.rfind(')') + 2:].split()  # comm kann Leerzeichen enthalten
+    return {'state': fields[0], 'ppid': int(fields[1]),
+            'cpu_s': (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, 'start': int(fields[19])}
+
+
+def read_memory_kb(pid: int) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    values[line[:5]] = int(line.split()[1])
+    except OSError:
+        pass
+    return values
+
+
+def process_tree(root: int) -> Dict[int, Dict]:
+    """Alle lebenden Prozesse unterhalb von root (inklusive) mit ihren stat-Werten"""
+    stats = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            stat = read_stat(int(entry))
+            if stat is not None:
+                stats[int(entry)] = stat
+    children = {}
+    for pid, stat in stats.items():
+        children.setdefault(stat['ppid'], []).append(pid)
+
+    tree, stack = {}, [root]
+    while stack:
+        pid = stack.pop()
+        if pid in stats and pid not in tree:
+            tree[pid] = stats[pid]
+            stack.extend(children.get(pid, []))
+    return tree
+
+
+def nifti_dims(path: str) -> Optional[list]:
+    """Dimensionen aus dem NIfTI-1 Header (.nii oder .nii.gz), None wenn nicht lesbar"""
+    try:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            header = f.read(348)
+        for endian in '<>':
+            if len(header) == 348 and struct.unpack(endian + 'i', header[:4])[0] == 348:
+                dim = struct.unpack(endian + '8h', header[40:56])
+                return list(dim[1:1 + dim[0]])
+    except (OSError, EOFError, struct.error):
+        pass
+    return None
+
+
+class Sampler:
+    """Misst den Prozessbaum von pid, bis der Wurzelprozess beendet ist"""
+
+    def __init__(self, pid: int, out_path: str, subject: str, input_path: Optional[str] = None,
+                 log_path: Optional[str] = None, interval: float = INTERVAL):
+        self.pid = pid
+        self.out_path = out_path
+        self.subject = subject
+        self.input_path = input_path
+        self.log_path = log_path
+        self.interval = interval
+        self.cpu_seen = {}  # (pid, Startzeit) -> zuletzt gesehene CPU-Sekunden (auch beendete Kinder)
+        self.peak_rss_kb = self.peak_hwm_kb = self.rss_sum_kb = self.n_samples = 0
+        self.status = 'finished'
+        root = read_stat(pid)
+        self.root_start = root['start'] if root else None
+
+    def _write(self, record: Dict):
+        with open(self.out_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _root_alive(self) -> bool:
+        stat = read_stat(self.pid)
+        return stat is not None and stat['state'] != 'Z' and stat['start'] == self.root_start
+
+    def sample(self, elapsed: float):
+        tree = process_tree(self.pid)
+        rss = hwm = 0
+        for pid, stat in tree.items():
+            memory = read_memory_kb(pid)
+            rss += memory.get('VmRSS', 0)
+            hwm = max(hwm, memory.get('VmHWM', 0))
+            self.cpu_seen[(pid, stat['start'])] = stat['cpu_s']
+        cpu = sum(self.cpu_seen.values())
+        self.peak_rss_kb = max(self.peak_rss_kb, rss)
+        self.peak_hwm_kb = max(self.peak_hwm_kb, hwm)
+        self.rss_sum_kb += rss
+        self.n_samples += 1
+        self._write({'type': 'sample', 't': round(elapsed, 1), 'rss_mb': round(rss / 1024, 1),
+                     'hwm_mb': round(hwm / 1024, 1), 'cpu_s': round(cpu, 2), 'n_procs': len(tree)})
+
+    def _on_term(self, signum, frame):
+        self.status = 'terminated'
+        raise KeyboardInterrupt
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_term)
+        started, wall_start = datetime.now(), time.monotonic()
+        input_bytes = os.path.getsize(self.input_path) if self.input_path and os.path.exists(self.input_path) else None
+        dims = nifti_dims(self.input_path) if self.input_path else None
+        meta = {'subject': self.subject, 'input': self.input_path, 'input_bytes': input_bytes, 'dims': dims,
+                'voxels': int(dims[0] * dims[1] * dims[2]) if dims and len(dims) >= 3 else None,
+                'host': socket.gethostname(), **{k.lower(): os.environ.get(k) for k in SLURM_FIELDS}}
+        self._write({'type': 'start', 'start': started.isoformat(timespec='seconds'), 'pid': self.pid, **meta})
+
+        try:
+            if self.root_start is None:
+                self.status = 'not_found'
+            while self.root_start is not None and self._root_alive():
+                self.sample(time.monotonic() - wall_start)
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            if self.status == 'finished':
+                self.status = 'interrupted'
+
+        success = None
+        if self.log_path and os.path.exists(self.log_path):
+            with open(self.log_path, errors='replace') as f:
+                success = SUCCESS_MARKER in f.read()
+        self._write({
+            'type': 'summary', 'status': self.status, 'success': success, **meta,
+            'start': started.isoformat(timespec='seconds'), 'end': datetime.now().isoformat(timespec='seconds'),
+            'wall_s': round(time.monotonic() - wall_start, 1), 'cpu_s': round(sum(self.cpu_seen.values()), 2),
+            'peak_rss_mb': round(self.peak_rss_kb / 1024, 1), 'peak_hwm_mb': round(self.peak_hwm_kb / 1024, 1),
+            'mean_rss_mb': round(self.rss_sum_kb / max(self.n_samples, 1) / 1024, 1), 'n_samples': self.n_samples,
+        })
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RSS/CPU eines laufenden Prozessbaums als JSONL aufzeichnen")
+    parser.add_argument('--pid', type=int, required=True, help="Wurzelprozess (z.B. MATLAB, $! im SLURM-Skript)")
+    parser.add_argument('--out', required=True, help="JSONL-Datei (wird angehängt)")
+    parser.add_argument('--subject', required=True)
+    parser.add_argument('--input', default=None, help="NIfTI des Subjects (Größe + Dimensionen)")
+    parser.add_argument('--log', default=None, help="MATLAB-Log (Erfolgsmeldung prüfen)")
+    parser.add_argument('--interval', type=float, default=INTERVAL)
+    args = parser.parse_args()
+
+    if not os.path.isdir('/proc'):
+        print("⚠️  /proc nicht verfügbar - keine Ressourcen-Messung", file=sys.stderr)
+        sys.exit(0)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    Sampler(args.pid, args.out, args.subject, args.input, args.log, args.interval).run()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Speicher-/Zeitbedarf der CAT12-Jobs aus gemessenen Ressourcen ableiten
+- Sampler-Dateien (scripts/resource_sampler.py, eine JSONL pro Subject): Peak-RSS,
+  Wall-/CPU-Zeit pro Subject, Größe des Input-Scans
+- sacct-Export (Pipe-getrennt, lokal als Datei) für MaxRSS, Laufzeit und Abbruchgrund
+  (OUT_OF_MEMORY / TIMEOUT) pro Array-Task:
+      sacct -j <JOBID> -P --units=M --format=JobID,JobName,State,Elapsed,TotalCPU,MaxRSS,ReqMem,Timelimit > sacct.txt
+- Empfehlung für --mem und --time pro Datensatz (Metadaten-'Dataset') oder Scan-Größe
+  (Voxel-Klassen), Quantil + Reserve; OOM-Tasks heben die Empfehlung über das alte --mem
+- optional: Subject-Liste (Run-Manifest, z.B. reprocess_subjects.txt) nach Gruppen aufteilen,
+  mit passendem sbatch-Aufruf pro Gruppe
+
+    python scripts/resource_sizing.py --samples output/logs/resources --sacct sacct.txt
+    python scripts/resource_sizing.py --by size --manifest reprocess_subjects.txt
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import METADATA_PATHS, normalize_subject_id  # noqa: E402
+from resource_sampler import nifti_dims  # noqa: E402
+
+#%% ========== KONFIGURATION ==========
+
+PROJECT_ROOT = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals")
+SAMPLES_PATH = PROJECT_ROOT / "output" / "logs" / "resources"
+REPORT_PATH = PROJECT_ROOT / "output" / "resources"
+
+# Empfehlung = Quantil der Subjects * (1 + Reserve), aufgerundet
+MEM_QUANTILE = 0.99
+MEM_HEADROOM = 0.20
+MEM_STEP_GB = 1
+MIN_MEM_GB = 4
+OOM_FACTOR = 1.5          # OOM-Task: mindestens altes ReqMem * Faktor
+TIMEOUT_FACTOR = 1.5      # TIMEOUT-Task: mindestens Laufzeit / Subjects im Task * Faktor
+TIME_QUANTILE = 0.95
+TIME_HEADROOM = 0.25
+TIME_STEP_MIN = 30
+MAX_TIME_H = 48           # Limit der Partition 'single'
+MIN_SUBJECTS = 5          # kleinere Gruppen bekommen die Empfehlung über alle Subjects
+
+# Subjects pro Array-Task (wie batch_size im SLURM-Skript)
+BATCH_SIZE = 15
+
+# Scan-Größe in Mio. Voxel (Klassengrenzen)
+SIZE_BINS_MVOX = [0, 8, 12, 16, 24, np.inf]
+
+UNKNOWN_GROUP = 'unknown'
+
+# Sampler-Status abgebrochener Läufe (Laufzeit ist nur eine Untergrenze)
+CUT_OFF_STATUS = ['incomplete', 'terminated']
+
+#%% ========== FUNKTIONEN ==========
+
+def load_samples(samples_path: Path) -> pd.DataFrame:
+    """
+    Eine Zeile pro Sampler-Datei (= Subject-Lauf). Fehlt die Zusammenfassung (Job hart
+    beendet), werden Peak-RSS und Laufzeit aus den Messpunkten rekonstruiert.
+    """
+    rows = []
+    for path in sorted(Path(samples_path).glob('*.jsonl')):
+        start, samples, summary = None, [], None
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # abgeschnittene letzte Zeile
+                    continue
+                if record['type'] == 'start':
+                    start, samples, summary = record, [], None  # neuer Versuch desselben Subjects
+                elif record['type'] == 'sample':
+                    samples.append(record)
+                else:
+                    summary = record
+        if summary is None and start is not None:
+            summary = {**start, 'status': 'incomplete', 'success': None,
+                       'wall_s': samples[-1]['t'] if samples else 0.0,
+                       'cpu_s': samples[-1]['cpu_s'] if samples else 0.0,
+                       'peak_rss_mb': max((s['rss_mb'] for s in samples), default=0.0),
+                       'peak_hwm_mb': max((s['hwm_mb'] for s in samples), default=0.0),
+                       'n_samples': len(samples)}
+        if summary is not None:
+            rows.append(summary)
+
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df['peak_gb'] = df[['peak_rss_mb', 'peak_hwm_mb']].max(axis=1) / 1024
+    df['wall_h'] = df['wall_s'] / 3600
+    df['cpu_util'] = (df['cpu_s'] / df['wall_s']).where(df['wall_s'] > 0)
+    return df
+
+
+def parse_mem_mb(value) -> float:
+    """sacct-Speicherangaben ('10240K', '11.5G', '12Gn', '16000M') -> MB"""
+    match = re.match(r'^([\d.]+)([KMGT]?)', str(value).strip())
+    if not match:
+        return np.nan
+    factor = {'': 1 / 1024 ** 2, 'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 ** 2}[match.group(2)]
+    return float(match.group(1)) * factor
+
+
+def parse_duration_s(value) -> float:
+    """sacct-Zeiten ('[D-]HH:MM:SS', 'MM:SS.mmm', 'UNLIMITED') -> Sekunden"""
+    value = str(value).strip()
+    if not value or value in ('UNLIMITED', 'Partition_Limit', 'nan'):
+        return np.nan
+    days, _, rest = value.rpartition('-')
+    seconds = 0.0
+    for part in rest.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds + (int(days) * 86400 if days else 0)
+
+
+def load_sacct(paths: List[Path]) -> pd.DataFrame:
+    """
+    sacct -P Export(e) -> eine Zeile pro Array-Task: Zustand/Laufzeit/Limits aus der
+    Job-Zeile, MaxRSS/TotalCPU als Maximum über die Job-Steps (.batch, .extern, ...)
+    """
+    raw = pd.concat([pd.read_csv(p, sep='|', dtype=str, keep_default_na=False) for p in paths],
+                    ignore_index=True)
+    raw['task'] = raw['JobID'].str.split('.').str[0]
+    steps = raw.assign(maxrss_mb=raw.get('MaxRSS', pd.Series('', index=raw.index)).map(parse_mem_mb),
+                       total_cpu_s=raw.get('TotalCPU', pd.Series('', index=raw.index)).map(parse_duration_s))
+    jobs = raw[~raw['JobID'].str.contains('.', regex=False)].set_index('task')
+
+    tasks = pd.DataFrame({
+        'state': jobs['State'].str.split().str[0],  # 'CANCELLED by 123' -> 'CANCELLED'
+        'elapsed_s': jobs['Elapsed'].map(parse_duration_s),
+        'req_mem_mb': jobs['ReqMem'].map(parse_mem_mb) if 'ReqMem' in jobs else np.nan,
+        'timelimit_s': jobs['Timelimit'].map(parse_duration_s) if 'Timelimit' in jobs else np.nan,
+    })
+    tasks = tasks.join(steps.groupby('task')[['maxrss_mb', 'total_cpu_s']].max())
+    split = tasks.index.to_series().str.extract(r'^(\d+)(?:_(\d+))?$')
+    tasks['array_job_id'], tasks['array_task_id'] = split[0], split[1]
+    return tasks
+
+
+def assign_groups(df: pd.DataFrame, by: str, metadata_paths: List[str] = METADATA_PATHS) -> pd.Series:
+    """Gruppe pro Zeile: Metadaten-'Dataset' (Fallback: Ordner des Inputs) oder Voxel-Klasse"""
+    if by == 'size':
+        labels = [f"{lo:g}-{hi:g}Mvox" if np.isfinite(hi) else f">{lo:g}Mvox"
+                  for lo, hi in zip(SIZE_BINS_MVOX[:-1], SIZE_BINS_MVOX[1:])]
+        bins = pd.cut(df['voxels'].astype(float) / 1e6, SIZE_BINS_MVOX, labels=labels, right=False)
+        return bins.astype(str).replace('nan', UNKNOWN_GROUP)
+
+    dataset_of = {}
+    for path in metadata_paths:
+        if Path(path).exists():
+            metadata = pd.read_csv(path, usecols=['Filename', 'Dataset'])
+            dataset_of.update(zip(normalize_subject_id(metadata['Filename']), metadata['Dataset']))
+    if not dataset_of:
+        print("⚠️  Keine Metadaten gefunden - Gruppe = Ordner des Input-Scans")
+    folders = df['input'].fillna('').map(lambda p: Path(p).parent.name or UNKNOWN_GROUP)
+    ids = normalize_subject_id(df['subject'])
+    return pd.Series([dataset_of.get(i, f) for i, f in zip(ids, folders)], index=df.index)
+
+
+def round_up(value: float, step: float) -> float:
+    return math.ceil(value / step) * step if np.isfinite(value) else np.nan
+
+
+def format_time(hours: float) -> Optional[str]:
+    """Stunden -> sbatch --time (D-HH:MM:SS bzw. HH:MM:SS), None ohne Zeitangabe"""
+    if not np.isfinite(hours):
+        return None
+    minutes = int(round_up(hours * 60, TIME_STEP_MIN))
+    days, minutes = divmod(minutes, 24 * 60)
+    return (f"{days}-" if days else "") + f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def recommend(samples: pd.DataFrame, tasks: Optional[pd.DataFrame], batch_size: int = BATCH_SIZE) -> pd.DataFrame:
+    """
+    Empfehlung pro Gruppe (plus 'ALL'). Subjects laufen im Array-Task nacheinander:
+    --mem richtet sich nach dem größten Subject, --time nach batch_size * Zeit pro Subject
+    (batch_size wird verkleinert, falls sonst MAX_TIME_H überschritten wird).
+    """
+    if tasks is not None and not tasks.empty:
+        # Task -> Gruppe mit den meisten Subjects im Task, Anzahl gestarteter Subjects im Task
+        keys = samples['slurm_array_job_id'].astype(str) + '_' + samples['slurm_array_task_id'].astype(str)
+        per_task = samples.assign(task=keys).groupby('task')['group']
+        majority = per_task.agg(lambda g: g.value_counts().index[0])
+        tasks = tasks.assign(group=tasks.index.map(majority),
+                             n_subjects=tasks.index.map(per_task.size()).fillna(batch_size))
+
+    rows = []
+    groups = {'ALL': samples, **dict(tuple(samples.groupby('group')))}
+    for name, g in groups.items():
+        basis = g if len(g) >= MIN_SUBJECTS else samples
+        peak = basis['peak_gb'].quantile(MEM_QUANTILE)
+        # erfolgreich = Erfolgsmeldung im Log; ohne Zusammenfassung (hart beendet) oder per
+        # SIGTERM abgebrochen ist die Laufzeit abgeschnitten und nur eine Untergrenze
+        cut_off = basis['success'].isna() | basis['status'].isin(CUT_OFF_STATUS)
+        succeeded = (basis['success'] == True) & ~cut_off  # noqa: E712
+        per_subject_h = pd.Series([basis.loc[succeeded, 'wall_h'].quantile(TIME_QUANTILE),
+                                   basis.loc[cut_off, 'wall_h'].max()]).max()
+        warnings = []
+        mem_gb = max(MIN_MEM_GB, round_up(peak * (1 + MEM_HEADROOM), MEM_STEP_GB))
+        row = {'group': name, 'n_subjects': len(g), 'basis': 'group' if basis is g else 'ALL',
+               'peak_gb_median': g['peak_gb'].median(), 'peak_gb_max': g['peak_gb'].max(),
+               'wall_h_median': g['wall_h'].median(), 'wall_h_max': g['wall_h'].max(),
+               'cpu_util_median': g['cpu_util'].median(),
+               'failed': int((g['success'] == False).sum()),  # noqa: E712 (None = unbekannt)
+               'incomplete': int(g['status'].isin(CUT_OFF_STATUS).sum())}
+
+        if tasks is not None and 'group' in tasks:
+            t = tasks if name == 'ALL' else tasks[tasks['group'] == name]
+            oom, timeout = t[t['state'] == 'OUT_OF_MEMORY'], t[t['state'] == 'TIMEOUT']
+            row.update(n_tasks=len(t), oom_tasks=len(oom), timeout_tasks=len(timeout),
+                       sacct_maxrss_gb=t['maxrss_mb'].max() / 1024, current_mem_gb=t['req_mem_mb'].max() / 1024)
+            # sacct sieht den ganzen Task (auch Spitzen zwischen zwei Messpunkten)
+            mem_gb = max(mem_gb, round_up(row['sacct_maxrss_gb'] * (1 + MEM_HEADROOM), MEM_STEP_GB))
+            if len(oom):
+                mem_gb = max(mem_gb, round_up(oom['req_mem_mb'].max() / 1024 * OOM_FACTOR, MEM_STEP_GB))
+            if len(timeout):
+                # wie OOM: Task lief bis zum Limit -> pro Subject mindestens Laufzeit / Subjects * Faktor
+                limit_s = timeout['elapsed_s'].fillna(timeout['timelimit_s'])
+                timeout_h = (limit_s / timeout['n_subjects'].clip(lower=1)).max() / 3600 * TIMEOUT_FACTOR
+                if timeout_h > 0 and not per_subject_h >= timeout_h:
+                    per_subject_h = timeout_h
+                    warnings.append(f"{len(timeout)} TIMEOUT-Tasks - Zeit aus sacct-Laufzeit abgeleitet")
+
+        if not succeeded.any():
+            # kein Lauf erfolgreich (z.B. Datensatz läuft immer ins Timeout): längste gemessene
+            # Laufzeit als Untergrenze, sonst sacct-Laufzeit bzw. -Zeitlimit der Tasks
+            if not per_subject_h > 0:
+                per_subject_h = basis['wall_h'].max()
+            if not per_subject_h > 0 and tasks is not None and 'group' in tasks:
+                t = tasks if name == 'ALL' else tasks[tasks['group'] == name]
+                per_subject_h = t['elapsed_s'].max() / 3600
+                if not per_subject_h > 0:
+                    per_subject_h = t['timelimit_s'].max() / 3600
+            warnings.append("kein erfolgreicher Lauf - Zeit ist nur eine Untergrenze")
+
+        # batch_size so weit verkleinern, dass der Task ins Zeitlimit passt
+        subject_h = per_subject_h * (1 + TIME_HEADROOM)
+        if not subject_h > 0:
+            # gar keine Laufzeit bekannt -> ein Subject pro Task mit dem Partitionslimit
+            subject_h = MAX_TIME_H
+            warnings.append(f"keine Laufzeit bekannt - {MAX_TIME_H} h pro Subject angenommen")
+        batch = max(1, min(batch_size, int(MAX_TIME_H // subject_h)))
+        row.update(mem=f"{int(mem_gb)}G" if np.isfinite(mem_gb) else None,
+                   time_per_subject=format_time(subject_h), batch_size=batch,
+                   time=format_time(min(subject_h * batch, MAX_TIME_H)))
+        if subject_h > MAX_TIME_H:
+            warnings.append(f"ein Subject braucht länger als {MAX_TIME_H} h")
+        if warnings:
+            row['warning'] = '; '.join(warnings)
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('group')
+
+
+def split_manifest(manifest: Path, recommendations: pd.DataFrame, by: str, out_dir: Path) -> pd.DataFrame:
+    """
+    Subject-Liste nach Gruppen aufteilen: resource_manifest.tsv (Pfad, Gruppe, mem, time),
+    eine Pfadliste pro Gruppe als VALID_PATHS_FILE für das Batch-SLURM-Skript und
+    submission_plan.csv (Gruppe, Pfadliste, mem, time, batch_size) für cat12.py submit
+    """
+    paths = [line.strip() for line in open(manifest) if line.strip()]
+    df = pd.DataFrame({'input': paths})
+    df['subject'] = normalize_subject_id(df['input'])
+    if by == 'size':
+        df['voxels'] = [np.prod(d[:3]) if d and len(d) >= 3 else np.nan for d in map(nifti_dims, paths)]
+    df['group'] = assign_groups(df, by).values
+    known = df['group'].isin(recommendations.index)
+    df['rec_group'] = df['group'].where(known, 'ALL')
+    df = df.join(recommendations[['mem', 'time', 'batch_size']], on='rec_group')
+    df[['input', 'subject', 'group', 'mem', 'time']].to_csv(out_dir / 'resource_manifest.tsv', sep='\t', index=False)
+
+    plan = []
+    for (group, mem, time_limit, batch_size), part in df.groupby(['rec_group', 'mem', 'time', 'batch_size']):
+        list_path = (out_dir / f"paths_{re.sub(r'[^A-Za-z0-9_.-]', '_', group)}.txt").resolve()
+        list_path.write_text('\n'.join(part['input']) + '\n')
+        n_tasks = math.ceil(len(part) / batch_size)
+        plan.append({'group': group, 'paths_file': str(list_path), 'n_subjects': len(part),
+                     'mem': mem, 'time': time_limit, 'batch_size': batch_size})
+        print(f"  {group:<20} {len(part):>5} Subjects -> sbatch --mem={mem} --time={time_limit} "
+              f"--array=1-{n_tasks}%80 --export=ALL,VALID_PATHS_FILE={list_path},BATCH_SIZE={batch_size} "
+              f"scripts/run_cat12_pipeline_batch.slurm")
+    # Eingabe für 'python cat12.py submit --plan ...' (ein sbatch-Aufruf pro Zeile)
+    pd.DataFrame(plan).to_csv(out_dir / 'submission_plan.csv', index=False)
+    return df
+
+
+def print_recommendations(recommendations: pd.DataFrame, by: str):
+    print("\n" + "="*80)
+    print(f"EMPFEHLUNG PRO {'SCAN-GRÖSSE' if by == 'size' else 'DATENSATZ'} "
+          f"(Speicher: Q{MEM_QUANTILE:.0%} +{MEM_HEADROOM:.0%}, Zeit: Q{TIME_QUANTILE:.0%} +{TIME_HEADROOM:.0%})")
+    print("="*80)
+    columns = [c for c in ['n_subjects', 'basis', 'peak_gb_median', 'peak_gb_max', 'wall_h_median', 'wall_h_max',
+                           'oom_tasks', 'timeout_tasks', 'current_mem_gb', 'mem', 'time_per_subject', 'batch_size',
+                           'time'] if c in recommendations]
+    with pd.option_context('display.width', 200):
+        print(recommendations[columns].to_string(float_format=lambda v: f'{v:.2f}'))
+    for group, warning in recommendations.get('warning', pd.Series(dtype=str)).dropna().items():
+        print(f"⚠️  {group}: {warning}")
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="--mem/--time für die CAT12-SLURM-Jobs aus gemessenen Ressourcen")
+    parser.add_argument('--samples', type=Path, default=SAMPLES_PATH, help="Ordner mit den Sampler-JSONL-Dateien")
+    parser.add_argument('--sacct', type=Path, nargs='*', default=[], help="sacct -P Export(e)")
+    parser.add_argument('--by', choices=['dataset', 'size'], default='dataset')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--manifest', type=Path, default=None,
+                        help="Subject-Liste (eine NIfTI pro Zeile), wird nach Gruppen aufgeteilt")
+    parser.add_argument('--report', type=Path, default=REPORT_PATH)
+    args = parser.parse_args()
+
+    print("="*80)
+    print("CAT12 RESSOURCEN-AUSWERTUNG")
+    print("="*80)
+    samples = load_samples(args.samples)
+    if samples.empty:
+        print(f"✗ Keine Sampler-Dateien in {args.samples}")
+        sys.exit(1)
+    samples['group'] = assign_groups(samples, args.by).values
+    print(f"✓ {len(samples)} Subject-Läufe aus {args.samples} "
+          f"({int(samples['status'].isin(CUT_OFF_STATUS).sum())} unvollständig)")
+
+    tasks = None
+    if args.sacct:
+        tasks = load_sacct(args.sacct)
+        print(f"✓ {len(tasks)} Array-Tasks aus sacct: {tasks['state'].value_counts().to_dict()}")
+
+    recommendations = recommend(samples, tasks, args.batch_size)
+    print_recommendations(recommendations, args.by)
+
+    args.report.mkdir(parents=True, exist_ok=True)
+    samples.drop(columns=['type', 'dims'], errors='ignore').to_csv(args.report / 'resource_subjects.csv', index=False)
+    recommendations.to_csv(args.report / 'resource_recommendations.csv')
+    if tasks is not None:
+        tasks.to_csv(args.report / 'resource_sacct_tasks.csv')
+    if args.manifest:
+        print(f"\nManifest {args.manifest} nach Gruppen aufgeteilt:")
+        split_manifest(args.manifest, recommendations, args.by, args.report)
+    print(f"\n✓ Berichte gespeichert in: {args.report}")
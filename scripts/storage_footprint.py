@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Speicherbedarf des CAT12 data_output Baums (1 Ordner pro Subject)
+- paralleler Durchlauf mit os.scandir (ein Thread pro Subject-Ordner, NFS-Latenz überlappt)
+- Bytes pro Dateiklasse (Surface-Meshes, Thickness/Gyrification, y_/iy_ Deformationsfelder,
+  unkomprimierte/komprimierte Volumes, Label-XMLs, Reports, ...)
+- Subjects, die vor dem Cleanup-Schritt in run_cat12_full_pipeline.m prozessiert wurden
+  (iy_*.nii oder unkomprimierte Volumes noch vorhanden)
+- Rekomprimieren (pigz falls vorhanden, sonst zlib in Threads) oder Löschen ausgewählter
+  Klassen; komprimierte Dateien werden erst nach erfolgreichem Round-Trip (SHA-256 des
+  entpackten Inhalts == Original) ersetzt, das Original erst danach gelöscht
+
+    python scripts/storage_footprint.py
+    python scripts/storage_footprint.py --recompress volume_uncompressed forward_deformation --dry-run
+    python scripts/storage_footprint.py --prune inverse_deformation
+"""
+
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+#%% ========== KONFIGURATION ==========
+
+# CAT12 Output (1 Ordner pro Subject)
+DATA_OUTPUT_ROOT = Path("/net/bq-storage/ag-cherrmann/projects/35_BrainMRI/CAT12/data_output")
+
+# Berichte (bleiben auf isilon, wie die Logs)
+REPORT_PATH = Path("/net/data.isilon/ag-cherrmann/lduttenhoefer/project/CAT12_newvals/output/storage")
+
+# Threads für den Verzeichnis-Durchlauf (I/O-gebunden)
+SCAN_THREADS = 32
+
+# Dateien, die parallel komprimiert werden; pigz bekommt die übrigen Kerne
+COMPRESS_WORKERS = min(8, os.cpu_count() or 1)
+COMPRESS_LEVEL = 9
+
+CHUNK_SIZE = 1 << 20
+
+# Dateiklassen, in Reihenfolge geprüft (erster passender Regex auf den Dateinamen gewinnt)
+VOLUME_PREFIX = r'^(?:p0|p1|p2|mwp1|mwp2|wm)'  # volume_patterns im Cleanup-Schritt
+FILE_CLASSES = [
+    ('results_csv', r'_cat12_results\.csv$'),
+    ('inverse_deformation', r'^iy_.*\.nii$'),
+    ('forward_deformation', r'^y_.*\.nii(?:\.gz)?$'),
+    ('volume_uncompressed', VOLUME_PREFIX + r'.*\.nii$'),
+    ('volume_compressed', VOLUME_PREFIX + r'.*\.nii\.gz$'),
+    ('surf_data', r'^[lr]h\.(?:thickness|gyrification|depth|sqrtsulc|fractaldimension|pbt|toroGI)'),
+    ('surf_mesh', r'^(?:[lr]h\.|mesh\.)'),
+    ('label_xml', r'^catROIs?_.*\.xml$'),
+    ('annot', r'\.annot$'),
+    ('report_xml', r'^cat_.*\.xml$'),
+    ('report_other', r'\.(?:pdf|jpg|png|mat|txt|log)$'),
+    ('other_nii', r'\.nii(?:\.gz)?$'),
+]
+OTHER_CLASS = 'other'
+
+# Nur NIfTI-Klassen werden (re)komprimiert; Surfaces/XMLs müssen für CAT12 lesbar bleiben
+COMPRESSIBLE_CLASSES = ['inverse_deformation', 'forward_deformation', 'volume_uncompressed',
+                        'volume_compressed', 'other_nii']
+
+# Werden nie gelöscht (Hauptergebnis, ROI-Daten, QC)
+PROTECTED_CLASSES = ['results_csv', 'label_xml', 'report_xml']
+
+# Vorhandensein einer dieser Klassen -> Subject lief vor dem Cleanup-Schritt
+PRE_CLEANUP_CLASSES = ['inverse_deformation', 'volume_uncompressed']
+
+#%% ========== FUNKTIONEN ==========
+
+def _walk(directory: str) -> List[tuple]:
+    """Rekursiver scandir-Durchlauf eines Subject-Ordners -> (relativer Pfad, Bytes, mtime)"""
+    entries = []
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        entries.append((os.path.relpath(entry.path, directory), stat.st_size, stat.st_mtime))
+        except OSError as e:
+            print(f"  ⚠️  {current}: {e}")
+    return entries
+
+
+def classify(names: pd.Series) -> pd.Series:
+    """Dateiname -> Dateiklasse (vektorisiert, erste passende Klasse gewinnt)"""
+    conditions = [names.str.contains(pattern, regex=True).to_numpy(dtype=bool) for _, pattern in FILE_CLASSES]
+    labels = [label for label, _ in FILE_CLASSES]
+    return pd.Series(np.select(conditions, labels, default=OTHER_CLASS), index=names.index, dtype=object)
+
+
+def scan_output_tree(root: Path = DATA_OUTPUT_ROOT, threads: int = SCAN_THREADS,
+                     subjects: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Alle Dateien unter root/<SUBJECT>/ -> DataFrame (subject, path, name, class, bytes, mtime)
+    Dateien direkt in root (keine Subject-Ordner) landen unter subject=''.
+    """
+    with os.scandir(root) as it:
+        entries = list(it)
+    subject_dirs = [e for e in entries if e.is_dir(follow_symlinks=False)]
+    if subjects is not None:
+        wanted = set(subjects)
+        subject_dirs = [e for e in subject_dirs if e.name in wanted]
+    loose = [('', e.name, e.stat(follow_symlinks=False).st_size, e.stat(follow_symlinks=False).st_mtime)
+             for e in entries if e.is_file(follow_symlinks=False)] if subjects is None else []
+
+    print(f"Durchsuche {len(subject_dirs)} Subject-Ordner in {root} ({threads} Threads)...")
+    rows = list(loose)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for entry, files in zip(subject_dirs, pool.map(_walk, [e.path for e in subject_dirs])):
+            rows.extend((entry.name, path, size, mtime) for path, size, mtime in files)
+
+    df = pd.DataFrame(rows, columns=['subject', 'path', 'bytes', 'mtime'])
+    df['name'] = df['path'].str.replace(r'^.*/', '', regex=True)
+    df['class'] = classify(df['name'])
+    df['bytes'] = df['bytes'].astype(np.int64)
+    print(f"✓ {len(df)} Dateien, {df['bytes'].sum() / 1e9:.2f} GB")
+    return df[['subject', 'path', 'name', 'class', 'bytes', 'mtime']]
+
+
+def summarize_classes(files: pd.DataFrame) -> pd.DataFrame:
+    """Bytes pro Dateiklasse (absolut, Anteil, pro Subject)"""
+    n_subjects = max(files.loc[files['subject'] != '', 'subject'].nunique(), 1)
+    summary = files.groupby('class').agg(n_files=('bytes', 'size'), bytes=('bytes', 'sum'),
+                                         n_subjects=('subject', 'nunique'))
+    summary['GB'] = summary['bytes'] / 1e9
+    summary['percent'] = 100 * summary['bytes'] / max(summary['bytes'].sum(), 1)
+    summary['MB_per_subject'] = summary['bytes'] / 1e6 / n_subjects
+    return summary.sort_values('bytes', ascending=False)
+
+
+def pre_cleanup_subjects(files: pd.DataFrame) -> pd.DataFrame:
+    """
+    Subjects mit iy_*.nii oder unkomprimierten Volumes (vor dem Cleanup-Schritt prozessiert).
+    processed = mtime der *_cat12_results.csv (leer, falls der Lauf nie fertig wurde).
+    """
+    subject_files = files[files['subject'] != '']
+    counts = subject_files.pivot_table(index='subject', columns='class', values='bytes',
+                                       aggfunc='sum', fill_value=0)
+    counts = counts.reindex(columns=PRE_CLEANUP_CLASSES + ['results_csv'], fill_value=0)
+    flagged = counts[PRE_CLEANUP_CLASSES].gt(0).any(axis=1)
+
+    processed = (subject_files[subject_files['class'] == 'results_csv']
+                 .groupby('subject')['mtime'].max())
+    result = pd.DataFrame({
+        'has_iy': counts.loc[flagged, 'inverse_deformation'] > 0,
+        'has_uncompressed_volumes': counts.loc[flagged, 'volume_uncompressed'] > 0,
+        'has_results': counts.loc[flagged, 'results_csv'] > 0,
+        'reclaimable_MB': counts.loc[flagged, PRE_CLEANUP_CLASSES].sum(axis=1) / 1e6,
+        'processed': pd.to_datetime(processed.reindex(counts.index[flagged]), unit='s'),
+    })
+    result.index.name = 'subject'
+    return result.sort_values('processed')
+
+
+def pigz_available() -> Optional[str]:
+    return shutil.which('pigz')
+
+
+def _compress_stream(reader, out, level: int, pigz: Optional[str], threads: int):
+    """reader -> gzip in out; gibt (SHA-256, Bytes) des unkomprimierten Inhalts zurück"""
+    digest, size = hashlib.sha256(), 0
+    if pigz:
+        proc = subprocess.Popen([pigz, f'-{level}', '-p', str(threads), '-n', '-c'],
+                                stdin=subprocess.PIPE, stdout=out, stderr=subprocess.PIPE)
+        try:
+            for chunk in iter(lambda: reader.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                proc.stdin.write(chunk)
+        finally:
+            proc.stdin.close()
+            stderr = proc.stderr.read()
+            proc.wait()
+        if proc.returncode != 0:
+            raise RuntimeError(f"pigz Fehler {proc.returncode}: {stderr.decode(errors='replace').strip()}")
+    else:
+        # zlib gibt den GIL beim Komprimieren frei -> mehrere Dateien laufen echt parallel
+        with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=level, mtime=0) as gz:
+            for chunk in iter(lambda: reader.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                gz.write(chunk)
+    return digest.hexdigest(), size
+
+
+def _gzip_digest(path: Path):
+    digest, size = hashlib.sha256(), 0
+    with gzip.open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def recompress_file(path: Path, level: int = COMPRESS_LEVEL, pigz: Optional[str] = None,
+                    threads: int = 1) -> Dict:
+    """
+    .nii -> .nii.gz bzw. .nii.gz mit höherem Level neu komprimieren.
+    Erst in eine .part Datei schreiben, entpackt gegen den Original-Inhalt prüfen,
+    dann atomar ersetzen; das Original wird erst danach gelöscht.
+    Bereits komprimierte Dateien werden nur ersetzt, wenn sie kleiner werden.
+    """
+    path = Path(path)
+    already_gz = path.suffix == '.gz'
+    target = path if already_gz else path.with_name(path.name + '.gz')
+    part = target.with_name(target.name + '.part')
+    old_bytes = path.stat().st_size
+    result = {'path': str(path), 'target': str(target), 'old_bytes': old_bytes, 'new_bytes': old_bytes}
+
+    try:
+        if not already_gz and target.exists():
+            raise RuntimeError(f"{target.name} existiert bereits")
+        with (gzip.open(path, 'rb') if already_gz else open(path, 'rb')) as reader, open(part, 'wb') as out:
+            source = _compress_stream(reader, out, level, pigz, threads)
+        if _gzip_digest(part) != source:
+            raise RuntimeError("Round-Trip stimmt nicht mit dem Original überein")
+
+        new_bytes = part.stat().st_size
+        if already_gz and new_bytes >= old_bytes:
+            part.unlink()
+            return {**result, 'status': 'unchanged'}
+        shutil.copystat(path, part)
+        os.replace(part, target)
+        if not already_gz:
+            path.unlink()
+        return {**result, 'new_bytes': new_bytes, 'status': 'recompressed'}
+    except Exception as e:
+        if part.exists():
+            part.unlink()
+        return {**result, 'status': f'failed: {e}'}
+
+
+def recompress_files(paths: List[Path], level: int = COMPRESS_LEVEL, workers: int = COMPRESS_WORKERS,
+                     use_pigz: bool = True) -> pd.DataFrame:
+    """Dateien parallel (re)komprimieren: pigz mit den restlichen Kernen oder zlib-Threads"""
+    pigz = pigz_available() if use_pigz else None
+    threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+    print(f"Komprimiere {len(paths)} Dateien mit {'pigz' if pigz else 'zlib'} "
+          f"(Level {level}, {workers} Dateien parallel{f', je {threads} Threads' if pigz else ''})...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda p: recompress_file(p, level, pigz, threads), paths))
+    return pd.DataFrame(results)
+
+
+def prune_files(paths: List[Path]) -> pd.DataFrame:
+    """Dateien löschen (nur aufgerufen für nicht geschützte Klassen)"""
+    results = []
+    for path in paths:
+        path = Path(path)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            results.append({'path': str(path), 'old_bytes': size, 'new_bytes': 0, 'status': 'deleted'})
+        except OSError as e:
+            results.append({'path': str(path), 'old_bytes': 0, 'new_bytes': 0, 'status': f'failed: {e}'})
+    return pd.DataFrame(results)
+
+
+def select_files(files: pd.DataFrame, classes: List[str], root: Path) -> List[Path]:
+    selected = files[files['class'].isin(classes)]
+    return [root / subject / path for subject, path in zip(selected['subject'], selected['path'])]
+
+
+def print_summary(summary: pd.DataFrame, pre_cleanup: pd.DataFrame):
+    print("\n" + "="*80)
+    print("SPEICHERBEDARF PRO DATEIKLASSE")
+    print("="*80)
+    print(summary.to_string(float_format=lambda v: f'{v:.2f}'))
+
+    print("\n" + "="*80)
+    print("SUBJECTS VOR DEM CLEANUP-SCHRITT")
+    print("="*80)
+    if pre_cleanup.empty:
+        print("✓ Keine (alle Subjects ohne iy_*.nii und ohne unkomprimierte Volumes)")
+        return
+    print(f"⚠️  {len(pre_cleanup)} Subjects mit iy_*.nii ({pre_cleanup['has_iy'].sum()}) "
+          f"oder unkomprimierten Volumes ({pre_cleanup['has_uncompressed_volumes'].sum()})")
+    print(f"   davon ohne *_cat12_results.csv: {(~pre_cleanup['has_results']).sum()}")
+    print(f"   einsparbar: {pre_cleanup['reclaimable_MB'].sum() / 1e3:.2f} GB "
+          f"(--prune inverse_deformation, --recompress volume_uncompressed)")
+    print(pre_cleanup.head(10).to_string())
+
+
+def apply_actions(files: pd.DataFrame, root: Path, report_path: Path, recompress: List[str],
+                  prune: List[str], level: int, workers: int, dry_run: bool):
+    """--recompress / --prune ausführen, Ergebnis als storage_actions_<Zeit>.csv"""
+    not_compressible = [c for c in recompress if c not in COMPRESSIBLE_CLASSES]
+    protected = [c for c in prune if c in PROTECTED_CLASSES]
+    if not_compressible:
+        raise ValueError(f"Nicht rekomprimierbar: {not_compressible} (nur {COMPRESSIBLE_CLASSES})")
+    if protected:
+        raise ValueError(f"Geschützte Klassen können nicht gelöscht werden: {protected}")
+    overlap = set(recompress) & set(prune)
+    if overlap:
+        raise ValueError(f"Klassen sowohl in --recompress als auch --prune: {sorted(overlap)}")
+
+    recompress_paths = select_files(files, recompress, root)
+    prune_paths = select_files(files, prune, root)
+    print("\n" + "="*80)
+    print("AKTIONEN")
+    print("="*80)
+    for label, classes, paths in [('Rekomprimieren', recompress, recompress_paths), ('Löschen', prune, prune_paths)]:
+        if classes:
+            size = files.loc[files['class'].isin(classes), 'bytes'].sum()
+            print(f"{label}: {len(paths)} Dateien ({size / 1e9:.2f} GB) aus {classes}")
+    if dry_run:
+        print("\n(dry run - nichts geändert)")
+        return None
+
+    frames = []
+    if recompress_paths:
+        frames.append(recompress_files(recompress_paths, level, workers).assign(action='recompress'))
+    if prune_paths:
+        frames.append(prune_files(prune_paths).assign(action='prune'))
+    if not frames:
+        print("Nichts zu tun.")
+        return None
+    actions = pd.concat(frames, ignore_index=True)
+
+    failed = actions['status'].str.startswith('failed')
+    saved = (actions['old_bytes'] - actions['new_bytes'])[~failed].sum()
+    print(f"✓ {(~failed).sum()} Dateien bearbeitet, {saved / 1e9:.2f} GB eingespart")
+    if failed.any():
+        print(f"⚠️  {failed.sum()} Fehler (Originale unverändert), z.B.:")
+        print(actions.loc[failed, ['path', 'status']].head(5).to_string(index=False))
+
+    report_path.mkdir(parents=True, exist_ok=True)
+    actions_file = report_path / f"storage_actions_{datetime.now():%Y%m%d_%H%M%S}.csv"
+    actions.to_csv(actions_file, index=False)
+    print(f"✓ Protokoll: {actions_file}")
+    return actions
+
+
+#%% ========== HAUPTPROGRAMM ==========
+
+if __name__ == "__main__":
+    class_names = [label for label, _ in FILE_CLASSES] + [OTHER_CLASS]
+    parser = argparse.ArgumentParser(description="Speicherbedarf von data_output analysieren, "
+                                                 "Klassen rekomprimieren oder löschen")
+    parser.add_argument('--root', type=Path, default=DATA_OUTPUT_ROOT)
+    parser.add_argument('--report', type=Path, default=REPORT_PATH, help="Ordner für die CSV-Berichte")
+    parser.add_argument('--subjects', nargs='*', default=None, help="nur diese Subject-Ordner")
+    parser.add_argument('--threads', type=int, default=SCAN_THREADS, help="Threads für den Durchlauf")
+    parser.add_argument('--recompress', nargs='*', default=[], choices=COMPRESSIBLE_CLASSES, metavar='CLASS')
+    parser.add_argument('--prune', nargs='*', default=[], choices=class_names, metavar='CLASS')
+    parser.add_argument('--level', type=int, default=COMPRESS_LEVEL, choices=range(1, 10))
+    parser.add_argument('--workers', type=int, default=COMPRESS_WORKERS, help="Dateien parallel beim Komprimieren")
+    parser.add_argument('--dry-run', action='store_true', help="nur anzeigen, was geändert würde")
+    args = parser.parse_args()
+
+    print("="*80)
+    print("CAT12 DATA_OUTPUT SPEICHERANALYSE")
+    print("="*80)
+    files = scan_output_tree(args.root, args.threads, args.subjects)
+    summary = summarize_classes(files)
+    pre_cleanup = pre_cleanup_subjects(files)
+    print_summary(summary, pre_cleanup)
+
+    args.report.mkdir(parents=True, exist_ok=True)
+    summary.to_csv(args.report / 'storage_by_class.csv')
+    files.pivot_table(index='subject', columns='class', values='bytes', aggfunc='sum',
+                      fill_value=0).to_csv(args.report / 'storage_by_subject.csv')
+    pre_cleanup.to_csv(args.report / 'pre_cleanup_subjects.csv')
+    print(f"\n✓ Berichte gespeichert in: {args.report}")
+
+    if args.recompress or args.prune:
+        try:
+            apply_actions(files, args.root, args.report, args.recompress, args.prune,
+                          args.level, args.workers, args.dry_run)
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)